@@ -5,6 +5,12 @@ from .mqtt_spb_entity_device import MqttSpbEntityDevice
 from .mqtt_spb_entity_edgenode import MqttSpbEntityEdgeNode
 from .mqtt_spb_entity_app import MqttSpbEntityApp
 from .mqtt_spb_entity_scada import MqttSpbEntityScada
+from .spb_dispatcher import SpbCallbackDispatcher
+from .spb_stream import SpbChange, SpbChangeStream
+from .spb_historian import SpbSqliteHistorian
+from .spb_columnar import SpbColumnarSink
+from .spb_sharedmem import SpbSharedTable, SpbSharedTableReader
+from .spb_capture import SpbTrafficRecorder, SpbTrafficPlayer
 
 __all__ = [
     "MetricDataType",
@@ -16,4 +22,13 @@ __all__ = [
     "MqttSpbEntityEdgeNode",
     "MqttSpbEntityApp",
     "MqttSpbEntityScada",
+    "SpbCallbackDispatcher",
+    "SpbChange",
+    "SpbChangeStream",
+    "SpbSqliteHistorian",
+    "SpbColumnarSink",
+    "SpbSharedTable",
+    "SpbSharedTableReader",
+    "SpbTrafficRecorder",
+    "SpbTrafficPlayer",
 ]
\ No newline at end of file
@@ -1,8 +1,14 @@
 import time
+import threading
 import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.subscribeoptions import SubscribeOptions
 
 from .spb_base import SpbEntity, SpbTopic, SpbPayloadParser
 from .spb_protobuf import getNodeDeathPayload
+from .spb_publish import SpbPublishFuture, SpbPublishWindow
+from .spb_capture import SpbTrafficRecorder
 
 
 class MqttSpbEntity(SpbEntity):
@@ -36,6 +42,12 @@ class MqttSpbEntity(SpbEntity):
         self._entity_is_scada = entity_is_scada
         self._mqtt = None  # Mqtt client object
         self._loopback_topic = ""  # Last publish topic, to avoid loopback message reception
+        self._mqtt_v5 = False  # MQTT protocol v5.0 enabled ( otherwise v3.1.1 )
+        self._mqtt_topic_alias_max = 0  # Max number of topic aliases accepted by the broker ( MQTT v5.0 )
+        self._mqtt_topic_alias = {}  # Topic aliases assigned on the current connection, topic -> alias
+        self._publish_window = SpbPublishWindow()  # In-flight published messages, pending to be delivered
+        self._publish_timeout = None  # Max time to wait for space in the publish window, None forever
+        self._recorder = None  # Traffic recorder - SpbTrafficRecorder of the received messages
 
     def publish_birth(self, qos=0):
 
@@ -83,25 +95,47 @@ class MqttSpbEntity(SpbEntity):
 
         self.is_birth_published = True
 
-    def publish_data(self, send_all=False, qos=0):
+    def publish_data(self, send_all=False, qos=0, message_expiry=None):
         """
             Send the new updated data to the MQTT broker as a Sparkplug B DATA message.
 
         :param send_all: boolean    True: Send all data fields, False: send only updated field values
         :param qos                  QoS level
+        :param message_expiry       Message expiry interval in seconds ( MQTT v5.0 only ), stale DATA
+                                    messages will be discarded by the broker after this time.
         :return:                    result
         """
+        future = self._publish_data(send_all, qos, message_expiry)
+
+        # Failed if nothing was published, or the message was rejected ( i.e. publish window full )
+        if future is None or (future.done() and not future.result()):
+            return False
+        return True
+
+    def publish_data_future(self, send_all=False, qos=0, message_expiry=None) -> SpbPublishFuture:
+        """
+            Send the new updated data to the MQTT broker as a Sparkplug B DATA message, and get a future
+            resolved when the message is delivered to the broker ( PUBACK / PUBCOMP for QoS 1 / 2 ).
+
+        :param send_all: boolean    True: Send all data fields, False: send only updated field values
+        :param qos                  QoS level
+        :param message_expiry       Message expiry interval in seconds ( MQTT v5.0 only )
+        :return:                    SpbPublishFuture, result True if delivered. None if there is nothing to publish.
+        """
+        return self._publish_data(send_all, qos, message_expiry)
+
+    def _publish_data(self, send_all=False, qos=0, message_expiry=None):
 
         if not self.is_connected():  # If not connected
             self._logger.warning(
                 "%s - Could not send publish_telemetry(), not connected to MQTT server" % self._entity_domain)
-            return False
+            return None
 
         if self.is_empty():  # If no data (Data, attributes, commands )
             self._logger.warning(
                 "%s - Could not send publish_telemetry(), entity doesn't have data ( attributes, data, commands )"
                 % self._entity_domain)
-            return False
+            return None
 
         # Send payload if there is new data, or we need to send all
         if send_all or self.data.is_updated():
@@ -119,14 +153,65 @@ class MqttSpbEntity(SpbEntity):
                                                self._spb_eon_device_name)
 
             self._loopback_topic = topic
-            self._mqtt_payload_publish(topic, payload_bytes, qos)
+            future = self._mqtt_payload_publish_future(topic, payload_bytes, qos, message_expiry=message_expiry)
 
             self._logger.debug("%s - Published DATA message %s" % (self._entity_domain, topic))
-            return True
+            return future
 
         self._logger.warning("%s - Could not publish DATA message, may be data no new data values?"
                              % self._entity_domain)
-        return False
+        return None
+
+    def set_publish_window(self, max_inflight: int = 0, timeout: float = None):
+        """
+            Configure the outbound flow control. The number of published messages not yet delivered to the broker
+            ( in-flight ) is limited, new publish calls will wait until there is space in the window.
+
+        Args:
+            max_inflight:   Maximum number of in-flight messages, 0 for unlimited
+            timeout:        Maximum time to wait for space in the window, in seconds. None to wait forever,
+                            0 to not wait. If the window is still full, the message is not published.
+
+        Returns:    Nothing
+        """
+        self._publish_window.max_inflight = max_inflight
+        self._publish_timeout = timeout
+
+        if self._mqtt is not None and max_inflight > 0:
+            self._mqtt.max_inflight_messages_set(max_inflight)
+
+    def set_recorder(self, path: str = None, block_interval: float = 1.0, block_size: int = 1024 * 1024):
+        """
+            Configure the traffic recorder. The raw received MQTT messages ( topic, payload and receive
+            timestamp ) are appended to a capture file, to be replayed with SpbTrafficPlayer.
+
+        Args:
+            path:           Capture file path, the messages are appended if it exists. If set to None, the
+                            recorder is disabled and the file closed.
+            block_interval: Maximum duration of a capture block ( time index resolution ), in seconds
+            block_size:     Maximum size of a capture block in bytes
+
+        Returns:    Nothing
+        """
+        if self._recorder is not None:
+            recorder, self._recorder = self._recorder, None
+            recorder.close()
+
+        if path is None:
+            return
+
+        self._recorder = SpbTrafficRecorder(path, block_interval=block_interval, block_size=block_size)
+
+        self._logger.info("%s - Recording the received messages to %s" % (self._entity_domain, path))
+
+    def get_publish_stats(self) -> dict:
+        """
+            Get the outbound publish statistics
+
+        Returns:    dictionary with the number of queued ( waiting for the window ), in-flight, published and
+                    failed messages
+        """
+        return self._publish_window.get_stats()
 
     def connect(self,
                 host='localhost',
@@ -141,6 +226,7 @@ class MqttSpbEntity(SpbEntity):
                 timeout=5,
                 skip_death=False,
                 client_id="",
+                mqtt_v5=False,
                 ):
         """
             Connect to the spB MQTT server
@@ -156,6 +242,9 @@ class MqttSpbEntity(SpbEntity):
             tls_insecure:
             timeout:
             skip_death:         If true, DEATH meassage will not be sent
+            client_id:          MQTT client id
+            mqtt_v5:            If true, MQTT v5.0 protocol is used ( topic aliases, no-local subscriptions and
+                                message expiry ), otherwise MQTT v3.1.1
 
         Returns:
 
@@ -166,11 +255,19 @@ class MqttSpbEntity(SpbEntity):
 
         # MQTT Client configuration
         if self._mqtt is None:
-            self._mqtt = mqtt.Client(userdata=self, client_id=client_id)
+            self._mqtt_v5 = mqtt_v5
+            if self._mqtt_v5:
+                self._mqtt = mqtt.Client(userdata=self, client_id=client_id, protocol=mqtt.MQTTv5)
+            else:
+                self._mqtt = mqtt.Client(userdata=self, client_id=client_id)
 
         self._mqtt.on_connect = self._mqtt_on_connect
         self._mqtt.on_disconnect = self._mqtt_on_disconnect
         self._mqtt.on_message = self._mqtt_on_message
+        self._mqtt.on_publish = self._mqtt_on_publish
+
+        if self._publish_window.max_inflight > 0:
+            self._mqtt.max_inflight_messages_set(self._publish_window.max_inflight)
 
         if user != "":
             self._mqtt.username_pw_set(user, password)
@@ -276,6 +373,9 @@ class MqttSpbEntity(SpbEntity):
             self._mqtt.disconnect()
             time.sleep(0.1)
 
+            # Pending messages will not be delivered by this client anymore
+            self._publish_window.fail_all()
+
         self._mqtt = None
 
     def is_connected(self):
@@ -284,7 +384,8 @@ class MqttSpbEntity(SpbEntity):
         else:
             return self._mqtt.is_connected()
 
-    def _mqtt_payload_publish(self, topic: str, payload:bytes, qos:int = 0, retrain:bool = False):
+    def _mqtt_payload_publish(self, topic: str, payload:bytes, qos:int = 0, retrain:bool = False,
+                              message_expiry: int = None):
         """
             Send byte payload via MQTT client
         Args:
@@ -292,17 +393,95 @@ class MqttSpbEntity(SpbEntity):
             payload: Payload to be sent
             qos: Quality of service
             retrain: retrain flag for message
+            message_expiry: Message expiry interval in seconds ( MQTT v5.0 only )
 
-        Returns: bool true if successful
+        Returns: bool true if successful ( handed to the MQTT client, it may not be delivered yet )
         """
+        future = self._mqtt_payload_publish_future(topic, payload, qos, retrain, message_expiry)
+        return not (future.done() and not future.result())
+
+    def _mqtt_payload_publish_future(self, topic: str, payload: bytes, qos: int = 0, retrain: bool = False,
+                                     message_expiry: int = None) -> SpbPublishFuture:
+        """
+            Send byte payload via MQTT client, with flow control ( publish window )
+        Args:
+            topic:  MQTT topic
+            payload: Payload to be sent
+            qos: Quality of service
+            retrain: retrain flag for message
+            message_expiry: Message expiry interval in seconds ( MQTT v5.0 only )
+
+        Returns: SpbPublishFuture resolved when the message is delivered
+        """
+
+        future = SpbPublishFuture(topic, qos)
 
         if not self.is_connected():
-            return False
+            self._publish_window.fail(future)
+            return future
+
+        # Wait for space in the publish window. Never wait from the MQTT network thread ( i.e. publishing from
+        # a callback ), the window would never be released.
+        timeout = self._publish_timeout
+        if threading.current_thread() is getattr(self._mqtt, "_thread", None):
+            timeout = 0
+
+        if not self._publish_window.acquire(timeout):
+            self._logger.warning("%s - Could not publish message to %s, publish window is full"
+                                 % (self._entity_domain, topic))
+            self._publish_window.fail(future)
+            return future
+
+        # MQTT v3.1.1 - send payload to broker
+        if not self._mqtt_v5:
+            res = self._mqtt.publish(topic, payload, qos, retrain)
+
+        else:
+            # MQTT v5.0 - publish properties
+            properties = Properties(PacketTypes.PUBLISH)
+
+            if message_expiry is not None:
+                properties.MessageExpiryInterval = int(message_expiry)
+
+            # Topic alias, only for QoS 0 messages. QoS>0 messages may be retransmitted by the client on a new
+            # connection, where the previous aliases are no longer valid.
+            if qos == 0 and self._mqtt_topic_alias_max > 0:
+                alias = self._mqtt_topic_alias.get(topic, None)
+                if alias is not None:
+                    properties.TopicAlias = alias
+                    topic = ""  # Topic already known by the broker, only send the alias
+                elif len(self._mqtt_topic_alias) < self._mqtt_topic_alias_max:
+                    alias = len(self._mqtt_topic_alias) + 1
+                    self._mqtt_topic_alias[topic] = alias
+                    properties.TopicAlias = alias  # First message, send the topic and register the alias
+
+            res = self._mqtt.publish(topic, payload, qos, retrain, properties=properties)
+
+        if res.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._publish_window.release()
+            self._publish_window.fail(future)
+        else:
+            self._publish_window.register(future, res.mid)
+
+        return future
 
-        # send payload to broker
-        res = self._mqtt.publish(topic, payload, qos, retrain)
+    def _mqtt_subscribe(self, client, topic: str, qos: int = 0):
+        """
+            Subscribe to a MQTT topic. On MQTT v5.0 the no-local flag is set, so the broker will not
+            send back the messages published by this entity.
+        Args:
+            client: MQTT client
+            topic: MQTT topic
+            qos: Quality of service
 
-        return res.is_published()
+        Returns: Nothing
+        """
+        if self._mqtt_v5:
+            client.subscribe(topic, options=SubscribeOptions(qos=qos, noLocal=True))
+        elif qos:
+            client.subscribe(topic, qos)
+        else:
+            client.subscribe(topic)
 
 
     def _mqtt_payload_set_last_will (self, topic: str, payload:bytes, qos:int = 1, retrain:bool = False):
@@ -311,7 +490,23 @@ class MqttSpbEntity(SpbEntity):
         self._mqtt.will_set(topic, payload, qos, retrain)
 
 
-    def _mqtt_on_connect(self, client, userdata, flags, rc):
+    def _mqtt_on_connect_v5_properties(self, properties):
+        """
+            Reset the MQTT v5.0 connection state ( topic aliases are only valid for a single connection )
+        Args:
+            properties: CONNACK properties received from the broker
+
+        Returns: Nothing
+        """
+        self._mqtt_topic_alias = {}
+        self._mqtt_topic_alias_max = getattr(properties, "TopicAliasMaximum", 0) if properties is not None else 0
+
+    def _mqtt_on_connect(self, client, userdata, flags, rc, properties=None):
+
+        self._mqtt_on_connect_v5_properties(properties)
+
+        # QoS 0 messages queued before the reconnection were discarded by the MQTT client
+        self._publish_window.fail_qos0()
 
         if rc == 0:
             self._logger.info("%s - Connected to MQTT server" % self._entity_domain)
@@ -327,13 +522,13 @@ class MqttSpbEntity(SpbEntity):
                                               self._spb_group_name,
                                               self._spb_eon_name,
                                               self._spb_eon_device_name)
-            client.subscribe(topic)
+            self._mqtt_subscribe(client, topic)
             self._logger.info("%s - Subscribed to MQTT topic: %s" % (self._entity_domain, topic))
 
             # Subscribe to STATE of SCADA application
             topic = "%s/%s/STATE/+" % (self._spb_namespace,
                                        self._spb_group_name)
-            client.subscribe(topic)
+            self._mqtt_subscribe(client, topic)
 
             self._logger.info("%s - Subscribed to MQTT topic: %s" % (self._entity_domain, topic))
 
@@ -344,17 +539,27 @@ class MqttSpbEntity(SpbEntity):
         if self.on_connect is not None:
             self.on_connect(rc)
 
-    def _mqtt_on_disconnect(self, client, userdata, rc):
+    def _mqtt_on_publish(self, client, userdata, mid):
+        # Message delivered to the broker
+        self._publish_window.delivered(mid)
+
+    def _mqtt_on_disconnect(self, client, userdata, rc, properties=None):
         self._logger.info("%s - Disconnected from MQTT server" % self._entity_domain)
 
+        # QoS 0 messages not sent yet are lost, only QoS>0 messages are retransmitted on reconnection
+        self._publish_window.fail_qos0()
+
         # Execute the callback function if it is not None
         if self.on_disconnect is not None:
             self.on_disconnect(rc)
 
     def _mqtt_on_message(self, client, userdata, msg):
 
-        # Check if loopback message
-        if self._loopback_topic == msg.topic:
+        if self._recorder is not None:
+            self._recorder.on_message(msg)
+
+        # Check if loopback message ( MQTT v5.0 uses the no-local subscription flag instead )
+        if not self._mqtt_v5 and self._loopback_topic == msg.topic:
             return
 
         msg_ts_rx = int(time.time() * 1000)  # Save the current timestamp
@@ -375,21 +580,41 @@ class MqttSpbEntity(SpbEntity):
         if topic.message_type == "STATE":
             # Execute the callback function if it is not None
             if self.on_message is not None:
-                self.on_message(topic, msg.payload.decode("utf-8"))
+                self._spb_callback(self.on_message, topic, msg.payload.decode("utf-8"), key=topic.domain)
             return
 
         # Parse the received ProtoBUF data ------------------------------------------------
         payload = SpbPayloadParser().parse_payload(msg.payload)
 
+        self._spb_on_message(topic, payload, msg_ts_rx)
+
+    def _spb_on_message(self, topic: SpbTopic, payload: dict, msg_ts_rx: int):
+        """
+            Process a received spB message, once the payload is decoded.
+
+        Args:
+            topic: spB topic of the message
+            payload: decoded payload dictionary
+            msg_ts_rx: timestamp when the message was received, in milliseconds
+
+        Returns: Nothing
+        """
+
+        if not isinstance(payload, dict):
+            self._logger.warning("%s - Could not parse MQTT payload from %s, message ignored !"
+                                 % (self._entity_domain, topic))
+            return
+
         # Add the timestamp when the message was received
         payload['timestamp_rx'] = msg_ts_rx
 
         # Execute the callback function if it is not None
         if self.on_message is not None:
-            self.on_message(topic, payload)
+            self._spb_callback(self.on_message, topic, payload, key=topic.domain)
 
-        # Actions depending on the MESSAGE TYPE
-        if "CMD" in topic.message_type:
+        # Actions depending on the MESSAGE TYPE - Only commands addressed to this entity
+        if "CMD" in topic.message_type \
+                and topic.eon_name == self._spb_eon_name and topic.eon_device_name == self._spb_eon_device_name:
 
             # Check if a list of commands is provided
             if "metrics" not in payload.keys():
@@ -418,4 +643,4 @@ class MqttSpbEntity(SpbEntity):
 
             # Execute the callback function if it is not None, with all commands received
             if self.on_command is not None:
-                self.on_command(payload)
+                self._spb_callback(self.on_command, payload)
@@ -1,14 +1,79 @@
+import os
 import time
+import queue
+import multiprocessing
+import zlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict
 
-from .spb_base import SpbTopic, SpbPayloadParser
+from .spb_protobuf import getDdataPayload, addMetric, MetricDataType
+from .spb_base import SpbTopic, SpbPayloadParser, get_metric_version
+from .spb_shard import SpbHashRing
+from .spb_conflation import SpbConflationQueue
+from .spb_index import SpbAttributeIndex, SpbMetricIndex
+from .spb_history import SpbMetricHistory
+from .spb_snapshot import write_snapshot, read_snapshot
+from .spb_rebirth import SpbRebirthScheduler
+from .spb_liveness import SpbLivenessTracker
+from .spb_subscription import SpbSubscriptionFilter
+from .spb_router import SpbTopicRouter, SpbRoute
+from .spb_watch import SpbMetricWatch
+from .spb_stream import SpbChange, SpbChangeStream
+from .spb_historian import SpbSqliteHistorian
+from .spb_columnar import SpbColumnarSink
+from .spb_sharedmem import SpbSharedTable
+from .spb_export import EXPORT_FORMATS, iter_entity_rows, iter_fleet_rows, write_jsonl, write_columnar
 from .mqtt_spb_entity import SpbEntity
 from .mqtt_spb_entity import MqttSpbEntity
 
 
+def _decode_payload(payload_bytes: bytes):
+    """
+    Decode a spB payload, executed by the decode pool worker processes.
+    """
+    return SpbPayloadParser().parse_payload(payload_bytes)
+
+
+def _decode_start():
+    """
+    Empty task, used to start the decode pool worker processes.
+    """
+    return None
+
+
+class _SpbAliveStatus:
+    """
+    Alive status of the virtual entities of an application.
+
+    The status is stamped with the alive generation of the application, shared with its entities on
+    registration, so the application resets the status of all the entities by incrementing the generation.
+    """
+
+    _alive_generation = None    # Application alive generation ( one item list ), None if not registered
+    _alive_stamp = None         # Generation when the entity was set alive, None if not alive
+
+    @property
+    def _is_alive(self) -> bool:
+        if self._alive_stamp is None:
+            return False
+        return self._alive_generation is None or self._alive_stamp == self._alive_generation[0]
+
+    @_is_alive.setter
+    def _is_alive(self, alive: bool):
+        if not alive:
+            self._alive_stamp = None
+        else:
+            self._alive_stamp = self._alive_generation[0] if self._alive_generation is not None else 0
+
+    def is_alive(self):
+        return self._is_alive
+
+
 class MqttSpbEntityApp(MqttSpbEntity):
 
-    class DeviceEntity(SpbEntity):
+    class DeviceEntity(_SpbAliveStatus, SpbEntity):
         """
             Entity Edge Device (EoND) class
 
@@ -42,10 +107,7 @@ class MqttSpbEntityApp(MqttSpbEntity):
 
             self._is_alive = False  # Device is alive ( BIRTH + DATA ) or not ( DEATH )
 
-        def is_alive(self):
-            return self._is_alive
-
-    class EdgeEntity(SpbEntity):
+    class EdgeEntity(_SpbAliveStatus, SpbEntity):
         """
             Entity Edge Node entity (EoN) class
 
@@ -75,13 +137,24 @@ class MqttSpbEntityApp(MqttSpbEntity):
             self.callback_death = callback_death
 
             self.entities_eond: Dict[str, MqttSpbEntityApp.DeviceEntity] = {}
+            self._attribute_index = None  # Application attribute index of the devices ( SpbAttributeIndex )
 
             self._is_alive = False  # Device is alive ( BIRTH + DATA ) or not ( DEATH )
 
-        def is_alive(self):
-            return self._is_alive
-
         def search_device_by_attribute(self, attributes: dict) -> list:
+            """
+            Search the devices of the edge node matching all the attribute values
+
+            Args:
+                attributes: dictionary of attribute name -> value ( compared by its string representation )
+
+            Returns: list of device names
+            """
+
+            # Use the application attribute index, if available. The devices are returned in discovery order.
+            if self._attribute_index is not None and attributes:
+                found = self._attribute_index.search(attributes)
+                return [eond for eond, device in list(self.entities_eond.items()) if device in found]
 
             res = []    # List of devices found
 
@@ -119,7 +192,9 @@ class MqttSpbEntityApp(MqttSpbEntity):
                  callback_birth=None, callback_data=None, callback_death=None,  # callbacks for different spb messages
                  callback_new_eon=None, callback_new_eond=None,
                  retain_birth=False,
-                 debug=False):
+                 debug=False,
+                 entity_is_scada=False,
+                 debug_id="MQTT_SPB_APP"):
         """
 
         Initiate the spb application entity
@@ -128,6 +203,8 @@ class MqttSpbEntityApp(MqttSpbEntity):
             spb_group_name:  Sparkplug B domain name
             spb_app_name:     Application entity ID ( will be part of the MQTT topic )
             debug:       Enable / Disable debug information.
+            entity_is_scada: Application is a SCADA entity ( used by the SCADA subclass )
+            debug_id:    Console debug identification for the class messages.
         """
 
         # Initialized the object ( parent class ) with Device_id as None - Configuring it as edge node
@@ -136,9 +213,9 @@ class MqttSpbEntityApp(MqttSpbEntity):
             spb_eon_name=spb_app_name,
             spb_eon_device_name=None,
             retain_birth=retain_birth,
-            entity_is_scada=False,
+            entity_is_scada=entity_is_scada,
             debug=debug,
-            debug_id="MQTT_SPB_APP",
+            debug_id=debug_id,
          )
 
         self.entities_eon: Dict[str, MqttSpbEntityApp.EdgeEntity] = {}
@@ -153,8 +230,74 @@ class MqttSpbEntityApp(MqttSpbEntity):
         self.callback_new_eon = callback_new_eon    # Callbacks for new entities
         self.callback_new_eond = callback_new_eond
 
+        self.groups: Dict[str, MqttSpbEntityApp] = {}
+        '''
+        Other spB groups managed by the application over the same MQTT connection, group name -> application
+        '''
+        self._group_parent = None   # Multi-group - Application managing the MQTT connection of this group
+
+        self.callback_initialized = None    # Callback when the initialization period finishes
+        self.callback_liveness = None   # Callback( entity, old_state, new_state ) on entity liveness transitions
+
         self._spb_initialized = False  # Flag to mark the initialization of spb persistent messages(BIRTH, DEATH)
-        self._spb_initialized_timeout = 0  # Counter to keep initialization timeout event
+        self._spb_initialized_event = threading.Event()  # Set when the initialization period finishes
+        self._spb_init_quiet_period = 0.5   # Initialization - Time without retained messages to finish, in seconds
+        self._spb_init_max_time = 30.0      # Initialization - Maximum duration, in seconds
+        self._spb_init_adaptive = True      # Initialization - Adapt the quiet period to the retained messages rate
+        self._spb_init_rx_count = 0         # Initialization - Number of retained messages received
+        self._spb_init_stop = None          # Initialization - Event to stop the quiescence detector
+        self._alive_generation = [0]        # Alive status generation of the entities, incremented to reset them
+
+        self._attribute_index = SpbAttributeIndex()     # Index of the devices by attribute value
+        self._data_index = SpbMetricIndex()     # Index of the devices by data metric value
+        self._eon_attribute_index = SpbAttributeIndex()     # Index of the edge nodes by attribute value
+        self._eon_data_index = SpbMetricIndex()     # Index of the edge nodes by data metric value
+
+        self._metric_watch = SpbMetricWatch()   # Metric callbacks, by metric pattern
+        self._streams = ()          # Change data capture streams ( SpbChangeStream )
+        self._message_seq = None    # Sequence number of the message being processed
+
+        self._change_log = OrderedDict()    # Updated entities, entity -> version, ordered by update
+        self._change_log_lock = threading.Lock()    # Shared with the metric groups of the entities
+
+        self._historian = None      # Historian mode - SpbSqliteHistorian
+        self._columnar_sink = None  # Columnar sink mode - SpbColumnarSink
+        self._shared_table = None   # Shared table mode - SpbSharedTable, last values for other processes
+
+        self._history_config = None    # Metric history mode - SpbMetricHistory arguments and metric names
+        self._history = {}      # Metric history mode - entity -> { metric name: SpbMetricHistory }
+
+        self._shard_member = None   # Sharded mode - Name of this application member
+        self._shard_ring = None     # Sharded mode - Consistent hash ring of EoN names between members
+        self._shard_subscription = None     # Sharded mode - SpbSubscriptionFilter of the owned edge nodes
+
+        self._decode_pool = None    # Decode pool mode - Worker processes pool
+        self._decode_queue = None   # Decode pool mode - Queue of pending messages, in reception order
+        self._decode_thread = None  # Decode pool mode - Thread processing the decoded messages
+        self._decode_lock = threading.Lock()    # Decode pool mode - Pool submits and pool stop
+
+        self._conflation_queue = None   # Conflation mode - Queue of decoded messages pending to be processed
+        self._conflation_thread = None  # Conflation mode - Thread processing the messages
+
+        self._seq_last = {}     # Sequence tracking - Last sequence number received from each EoN
+        self._seq_devices = {}  # Sequence tracking - EoND names with a BIRTH after the last NBIRTH of each EoN
+        self._seq_stats = {"gaps": 0, "out_of_order": 0, "no_birth": 0}
+        self._rebirth = None    # Rebirth requests mode - SpbRebirthScheduler
+
+        self._liveness = None   # Liveness tracking mode - SpbLivenessTracker
+
+        self._subscription = None   # Selective subscriptions mode - SpbSubscriptionFilter
+        self._subscription_dynamic = True   # Selective subscriptions mode - Subscribe to the requested entities
+        self._subscription_topics = set()   # Current subscribed topic filters
+
+        self._router = SpbTopicRouter()     # Routes of the received topics, cached per topic string
+        self._message_handlers = {"BIRTH": self._spb_on_birth,
+                                  "DATA": self._spb_on_data,
+                                  "DEATH": self._spb_on_death}
+
+        self._snapshot_path = None      # Snapshot mode - File path
+        self._snapshot_stop = None      # Snapshot mode - Event to stop the periodic snapshots
+        self._snapshot_thread = None    # Snapshot mode - Thread writing the periodic snapshots
 
         self._debug_enabled = debug
 
@@ -172,11 +315,13 @@ class MqttSpbEntityApp(MqttSpbEntity):
                 tls_insecure: str = False,
                 timeout: int = 5,
                 skip_death=False,
+                mqtt_v5: bool = False,
                 ) -> bool:
 
-        # Set the initialization of spb messages ( BIRTH and DEATH )
+        # Set the initialization of spb messages ( BIRTH and DEATH ), started once subscribed
+        self._spb_init_cancel()
         self._spb_initialized = False
-        self._spb_initialized_timeout = time.time()
+        self._spb_initialized_event.clear()
 
         # Call the parent method
         return super().connect(
@@ -186,54 +331,245 @@ class MqttSpbEntityApp(MqttSpbEntity):
             tls_ca_path=tls_ca_path, tls_cert_path=tls_cert_path, tls_key_path=tls_key_path,
             tls_insecure=tls_insecure,
             timeout=timeout,
-            skip_death=skip_death
+            skip_death=skip_death,
+            mqtt_v5=mqtt_v5,
         )
 
     def disconnect(self, skip_death_publish=False):
 
+        # Multi-group - Disconnect the other groups first, they share the MQTT connection
+        for group in list(self.groups.values()):
+            group.disconnect(skip_death_publish)
+
         # Clear the initialization of spb messages ( BIRTH and DEATH )
+        self._spb_init_cancel()
         self._spb_initialized = False
+        self._spb_initialized_event.clear()
+
+        # Save the last known state
+        if self._snapshot_path is not None:
+            self.save_snapshot()
+
+        # Group of a multi-group application, the MQTT connection is managed by the application
+        if self._group_parent is not None:
+            if self._entity_is_scada and not skip_death_publish and self.is_connected():
+                topic = "%s/%s/STATE/%s" % (self._spb_namespace, self._spb_group_name, self._spb_eon_name)
+                self._mqtt_payload_publish(topic, "OFFLINE".encode("utf-8"))
+            self._mqtt = None
+            return
 
         # Call the parent method
         return super().disconnect(skip_death_publish)
 
+    def publish_birth(self, qos=0):
+
+        res = super().publish_birth(qos)
+
+        # Multi-group SCADA application - STATE BIRTH of the other groups
+        if self._entity_is_scada and self.is_connected():
+            for group in list(self.groups.values()):
+                group.publish_birth(qos)
+
+        return res
+
     def is_initialized(self):
         """
         Returns True if application is initialized.
-        This initialization time is used to retrieve all BIRTH messages from the broker during an specific timeout.
+        The initialization period is used to retrieve all the retained BIRTH messages from the broker, and it
+        finishes when no retained messages are received during the quiet period ( see set_initialization ).
 
             Returns: True when initialized
 
         """
+        return self._spb_initialized
 
-        # Check if the timeout has expired
-        if not self._spb_initialized:
+    def wait_initialized(self, timeout: float = None) -> bool:
+        """
+        Wait until the application is initialized
 
-            # If timeout expired, then mark the finalization of the initialization period
-            if time.time() > (self._spb_initialized_timeout + 0.5):
+        Args:
+            timeout:    Maximum time to wait in seconds, None to wait forever
 
-                # spb persistent messages are being initialized
-                self._spb_initialized = True
+        Returns:    True if initialized
+        """
+        return self._spb_initialized_event.wait(timeout)
 
-                # Reset entity state for all discovered entities
-                for eon in self.entities_eon.keys():
-                    self.entities_eon[eon]._is_alive = False
+    def set_initialization(self, quiet_period: float = 0.5, max_time: float = 30.0, adaptive: bool = True):
+        """
+        Configure the initialization period detection.
 
-                    for eond in self.entities_eon[eon].entities_eond.keys():
-                        self.entities_eon[eon].entities_eond[eond]._is_alive = False
+        After subscribing, the initialization finishes when no retained messages are received during the quiet
+        period. In adaptive mode, the quiet period is increased to twice the longest gap observed between
+        retained messages, for brokers that deliver them slowly.
 
-                self._logger.debug("spB initialization period expired, all entity states are cleared.")
+        Args:
+            quiet_period:   Time without retained messages to finish the initialization, in seconds
+            max_time:       Maximum duration of the initialization, in seconds
+            adaptive:       Adapt the quiet period to the retained messages arrival
 
-        return self._spb_initialized
+        Returns:    Nothing
+        """
+        self._spb_init_quiet_period = quiet_period
+        self._spb_init_max_time = max_time
+        self._spb_init_adaptive = adaptive
+
+    def _spb_init_start(self):
+        """
+        Start the initialization period quiescence detector
+        """
+        if self._spb_initialized or self._spb_init_stop is not None:
+            return
+
+        self._spb_init_rx_count = 0
+        self._spb_init_stop = threading.Event()
+        threading.Thread(target=self._spb_init_loop, args=(self._spb_init_stop,),
+                         name="spb-initialization", daemon=True).start()
+
+    def _spb_init_cancel(self):
+        """
+        Stop the initialization period quiescence detector
+        """
+        if self._spb_init_stop is not None:
+            self._spb_init_stop.set()
+            self._spb_init_stop = None
+
+    def _spb_init_loop(self, stop: threading.Event):
+
+        # Reset the alive status of all the discovered entities. No entity becomes alive during the
+        # initialization, so they can be reset at the beginning, outside the MQTT thread.
+        self._alive_generation[0] += 1
+
+        quiet_period = self._spb_init_quiet_period
+        step = max(min(quiet_period, self._spb_init_max_time) / 5, 0.01)
+
+        ts_start = ts_last_rx = time.monotonic()
+        rx_count = self._spb_init_rx_count
+
+        while not stop.wait(step):
+
+            ts = time.monotonic()
+
+            if self._spb_init_rx_count != rx_count:
+                # Retained messages received, extend the quiet period to the observed gap
+                if self._spb_init_adaptive:
+                    quiet_period = max(quiet_period, 2 * (ts - ts_last_rx))
+                rx_count = self._spb_init_rx_count
+                ts_last_rx = ts
+
+            elif (ts - ts_last_rx) >= quiet_period or (ts - ts_start) >= self._spb_init_max_time:
+                break
 
-    def _mqtt_on_connect(self, client, userdata, flags, rc):
+        else:
+            return  # Cancelled
+
+        if self._spb_init_stop is stop:
+            self._spb_init_stop = None
+        self._spb_initialized = True
+        self._spb_initialized_event.set()
+
+        self._logger.debug("%s - spB initialization period finished, %d retained messages received in %.2f s"
+                           % (self._entity_domain, rx_count, time.monotonic() - ts_start))
+
+        if self.callback_initialized is not None:
+            self._spb_callback(self.callback_initialized)
+
+    def set_shard(self, member: str, members: list = None, edge_nodes: list = None):
+        """
+        Configure the sharded application mode.
+
+        Several cooperating application processes can share the ingest of a single spB group. Each edge node
+        (EoN), and its devices, is assigned to a single member by consistent hashing of its name, so only the
+        messages of the owned entities are decoded and mirrored by this application.
+
+        By default the partitioning is done by the application: every member is still subscribed to all the
+        group topics, and receives all the messages from the broker, but the messages of the edge nodes owned
+        by other members are discarded before their payloads are decoded. If the EoN names of the group are
+        known in advance, provide them as edge_nodes, so only the topics of the owned edge nodes are
+        subscribed and the broker does not send the other messages. The edge nodes not in the list are not
+        received. The topic subscriptions are only partitioned if the selective subscriptions mode is disabled.
+
+        Call it again with the new list of members when members join or leave the group. The entities no
+        longer owned by this member are removed, and the newly owned entities are discovered as their
+        messages are received ( the subscriptions are updated to the new partition ).
+
+        Args:
+            member:     Name of this application member, must be part of the list of members
+            members:    List of all application members. If set to None, the sharded mode is disabled.
+            edge_nodes: List of the EoN names of the group, to subscribe only to the owned edge nodes
+
+        Returns:    Nothing
+        """
+
+        if not members:
+            self._shard_member = None
+            self._shard_ring = None
+            self._shard_subscription = None
+            self._router.invalidate()
+            self._subscription_update()
+            self._logger.info("%s - Sharded mode disabled" % self._entity_domain)
+            return
+
+        if member not in members:
+            raise ValueError("Shard member '%s' is not part of the list of members" % member)
+
+        ring = SpbHashRing(members)
+
+        # Rebalance - Remove the entities that are no longer owned by this member
+        for eon_name in list(self.entities_eon.keys()):
+            if ring.get_owner(eon_name) != member:
+                self._unregister_edge_node(eon_name)
+                self._logger.debug("Shard rebalance, edge node <%s> removed" % eon_name)
+
+        self._shard_member = member
+        self._shard_ring = ring
+
+        # Broker side partitioning - Subscribe only to the owned edge nodes
+        if edge_nodes is not None:
+            owned = [eon_name for eon_name in edge_nodes if ring.get_owner(eon_name) == member]
+            self._shard_subscription = SpbSubscriptionFilter(self._spb_namespace, self._spb_group_name,
+                                                             edge_nodes=owned)
+        else:
+            self._shard_subscription = None
+
+        self._router.invalidate()
+        self._subscription_update()
 
-        # Subscribe to all group topics
+        self._logger.info("%s - Sharded mode, member %s of %d members" % (self._entity_domain, member, len(members)))
+
+    def is_shard_owner(self, eon_name: str) -> bool:
+        """
+        Check if an edge node (EoN) is owned by this application member.
+
+        Args:
+            eon_name:   EoN name
+
+        Returns:    True if owned, always True if the sharded mode is disabled
+        """
+        if self._shard_ring is None:
+            return True
+        return self._shard_ring.get_owner(eon_name) == self._shard_member
+
+    def _mqtt_on_connect(self, client, userdata, flags, rc, properties=None):
+
+        # The MQTT v5.0 connection state is shared by all the groups
+        if self._group_parent is None:
+            self._mqtt_on_connect_v5_properties(properties)
+
+            # QoS 0 messages queued before the reconnection were discarded by the MQTT client ( shared window )
+            self._publish_window.fail_qos0()
+
+        # Subscribe to all group topics, or the selected topics
         if rc == 0:
-            topic = "%s/%s/#" % (self._spb_namespace,
-                                 self._spb_group_name)
-            self._mqtt.subscribe(topic)
-            self._logger.info("%s - Subscribed to MQTT topic: %s" % (self._entity_domain, topic))
+            self._subscription_topics = set()
+            self._subscription_update()
+
+            # Start the initialization period, to receive the retained messages
+            self._spb_init_start()
+
+            # Multi-group - Subscribe to the topics of the other groups
+            for group in list(self.groups.values()):
+                self._group_share_connection(group)
+                group._mqtt_on_connect(client, userdata, flags, rc, properties)
 
         else:
             self._logger.error(" %s - Could not connect to MQTT server !" % self._entity_domain)
@@ -242,157 +578,1593 @@ class MqttSpbEntityApp(MqttSpbEntity):
         if self.on_connect is not None:
             self.on_connect(rc)
 
-    def _mqtt_on_message(self, client, userdata, msg):
+    def add_group(self, group_name: str):
+        """
+        Manage another spB group over the same MQTT connection.
 
-        # self._logger.info("%s - Message received  %s" % (self._entity_domain, msg.topic))
+        A new application entity is created for the group, with its own EoN -> EoND registry, indexes and modes.
+        The messages are routed to the group by the topic prefix, and its topics are subscribed on the current
+        connection, and on every reconnection. The callbacks of this application are copied to the new group,
+        and the rebirth requests, liveness tracking, metric history and sharded modes are configured as in
+        this application ( changes made after the group is added are not propagated ). The selective
+        subscriptions select the entities of a single group, use set_subscriptions() of the returned group.
 
-        # Check if it is initialized
-        if not self._spb_initialized:
-            self.is_initialized()   # Ignore return value, just run function to initialize devices
+        For a SCADA application, the STATE BIRTH message of the group is published if the application BIRTH
+        was published, and the STATE DEATH message when the group is removed or disconnected. There is a single
+        last will per MQTT connection, so only the STATE DEATH of the application group is published by the
+        broker if the connection is lost.
 
-        # Process the message for edge nodes ( EoN and EoND )
-        topic = SpbTopic(msg.topic)
-        eon_name = topic.eon_name
-        eond_name = topic.eon_device_name
+        Example:
+            line2 = app.add_group("Line2")
+            device = line2.get_edge_device("EoN1", "Device1")
 
-        # Ignore data from self application
-        if eon_name == self.entity_name:
-            return  # Exit and ignore the data
+        Args:
+            group_name: spB group name
 
-        # EDGE NODE - Let's check if the EdgeNode is already discovered, if not create it
-        self._register_edge_node(eon_name=eon_name)
+        Returns:    Application entity of the group
+        """
 
-        # DEVICE NODE - Lets check if device is discovered, otherwise create it.
-        if eond_name is not None:
-            self._register_edge_device(eon_name=eon_name, eond_name=eond_name)
+        if group_name == self._spb_group_name:
+            return self
 
-        # Select the entity (EoN / EoND) to process the data and inject the data into the entity
-        if eond_name is None:
-            entity = self.entities_eon[eon_name]
+        group = self.groups.get(group_name, None)
+        if group is not None:
+            return group
+
+        group = self._new_group(group_name)
+        group._group_parent = self
+
+        for name in ("callback_birth", "callback_data", "callback_death", "callback_new_eon", "callback_new_eond",
+                     "callback_initialized", "callback_liveness", "on_message"):
+            setattr(group, name, getattr(self, name))
+        group.set_callback_dispatcher(self._callback_dispatcher)
+        group._streams = self._streams
+        group._shared_table = self._shared_table
+        self._group_share_modes(group)
+
+        self.groups[group_name] = group
+        self._router.invalidate()
+
+        # Already connected, subscribe to the group topics
+        self._group_share_connection(group)
+        if self.is_connected():
+            group._mqtt_on_connect(self._mqtt, None, None, 0)
+
+            # SCADA application already online, STATE BIRTH of the group
+            if self._entity_is_scada and self.is_birth_published:
+                group.publish_birth()
+
+        self._logger.info("%s - Added group %s" % (self._entity_domain, group_name))
+
+        return group
+
+    def get_group(self, group_name: str):
+        """
+        Get the application entity of a spB group
+
+        Args:
+            group_name: spB group name
+
+        Returns:    Application entity of the group, None if not managed by the application
+        """
+        if group_name == self._spb_group_name:
+            return self
+        return self.groups.get(group_name, None)
+
+    def remove_group(self, group_name: str) -> bool:
+        """
+        Stop managing a spB group added with add_group(), its topics are unsubscribed.
+
+        Args:
+            group_name: spB group name
+
+        Returns:    True if removed
+        """
+
+        group = self.groups.pop(group_name, None)
+        if group is None:
+            return False
+        self._router.invalidate()
+
+        if self.is_connected():
+            for topic in sorted(group._subscription_topics):
+                self._mqtt.unsubscribe(topic)
+        group.disconnect()
+
+        self._logger.info("%s - Removed group %s" % (self._entity_domain, group_name))
+
+        return True
+
+    def _new_group(self, group_name: str):
+        """
+        Create the application entity of a new spB group
+        """
+        return MqttSpbEntityApp(
+            spb_group_name=group_name,
+            spb_app_name=self.spb_eon_name,
+            retain_birth=self._retain_birth,
+            debug=self._debug_enabled,
+        )
+
+    def _group_share_modes(self, group):
+        """
+        Configure the modes of this application in the application entity of a group
+        """
+        if self._rebirth is not None:
+            group.set_rebirth_requests(min_interval=self._rebirth.min_interval,
+                                       max_inflight=self._rebirth.max_inflight, timeout=self._rebirth.timeout)
+
+        if self._liveness is not None:
+            liveness = self._liveness
+            group.set_liveness(interval=liveness.interval / 1000 if liveness.interval else None,
+                               stale_factor=liveness.stale_factor, offline_factor=liveness.offline_factor,
+                               resolution=liveness.resolution)
+
+        group._history_config = self._history_config
+
+        if self._shard_ring is not None:
+            group.set_shard(self._shard_member, self._shard_ring.members)
+
+        if self._subscription is not None:
+            self._logger.warning("%s - Selective subscriptions are not applied to the group %s, use its "
+                                 "set_subscriptions()" % (self._entity_domain, group.spb_group_name))
+
+    def _group_share_connection(self, group):
+        """
+        Share the MQTT connection, and its state, with the application entity of a group
+        """
+        group._mqtt = self._mqtt
+        group._mqtt_v5 = self._mqtt_v5
+        group._mqtt_topic_alias = self._mqtt_topic_alias
+        group._mqtt_topic_alias_max = self._mqtt_topic_alias_max
+        group._publish_window = self._publish_window
+        group._publish_timeout = self._publish_timeout
+
+    def set_subscriptions(self, enabled: bool = True, edge_nodes: list = None, devices: list = None,
+                          message_types: list = None, patterns: list = None, dynamic: bool = True):
+        """
+        Configure the selective subscriptions mode.
+
+        By default the application subscribes to all the group topics. In selective mode, only the messages of
+        the selected edge nodes, devices, message types and glob patterns are received. CMD and STATE messages
+        are not received unless their message types are selected.
+
+        Example:
+            # Only the BIRTH and DATA messages of the devices of Line1 edge nodes
+            app.set_subscriptions(patterns=["Line1-*"], message_types=["NBIRTH", "DBIRTH", "DDATA"])
+
+        Args:
+            enabled:        Enable or disable the selective subscriptions mode
+            edge_nodes:     List of EoN names
+            devices:        List of devices as ( EoN name, EoND name )
+            message_types:  List of message types, None for all the BIRTH, DATA and DEATH messages
+            patterns:       List of glob patterns of EoN names or EoN/EoND names, filtered by the application
+            dynamic:        Subscribe to the entities requested with get_edge_node() and get_edge_device()
+
+        If no edge nodes, devices or patterns are provided, all the edge nodes are subscribed. Use an empty
+        list of edge nodes to only subscribe to the entities requested dynamically.
+
+        The sequence numbers are only tracked ( and rebirths requested ) for the edge nodes with all their
+        messages subscribed: selected edge nodes or EoN patterns, and all the BIRTH, DATA and DDEATH types.
+
+        Returns:    Nothing
+        """
+
+        if enabled:
+            self._subscription = SpbSubscriptionFilter(self._spb_namespace, self._spb_group_name,
+                                                       edge_nodes=edge_nodes, devices=devices,
+                                                       message_types=message_types, patterns=patterns)
         else:
-            entity = self.entities_eon[eon_name].entities_eond[eond_name]
-
-        # PARSE PAYLOAD - De-serialize payload and update device data
-
-        payload = SpbPayloadParser(msg.payload)
-
-        # Parse the message from its type
-        if topic.message_type.endswith("BIRTH"):
-            if self._spb_initialized:
-                entity._is_alive = True  # Update status
-            entity.deserialize_payload_birth(msg.payload)  # Send the payload to the entity to deserialize it.
-            if entity.callback_birth is not None:
-                entity.callback_birth(payload.as_dict())
-            if self.callback_birth is not None:
-                self.callback_birth(topic, payload.as_dict())
-
-        elif topic.message_type.endswith("DATA"):
-            if self._spb_initialized:
-                entity._is_alive = True  # Update status
-            entity.deserialize_payload_data(msg.payload)  # Send the payload to the entity to deserialize it.
-            if entity.callback_data is not None:
-                entity.callback_data(payload.as_dict())
-            if self.callback_data is not None:
-                self.callback_data(topic, payload.as_dict())
-
-        elif topic.message_type.endswith("DEATH"):
-            if self._spb_initialized:
-                entity._is_alive = False  # Update status
-                # entity.deserialize_payload_death(msg.payload)  # Send the payload to the entity to deserialize it.
-            if entity.callback_death is not None:
-                entity.callback_death(payload.as_dict())
-            if self.callback_death is not None:
-                self.callback_death(topic, payload.as_dict())
-
-        elif topic.message_type.endswith("CMD"):
-            pass  # do not parse entity commands
-
-        elif topic.message_type.endswith("STATE"):
-            pass  # do not parse entity commands
+            self._subscription = None
+
+        self._subscription_dynamic = dynamic
+        self._router.invalidate()
+        self._subscription_update()
+
+    def _subscription_topics_required(self) -> set:
+        if self._subscription is None and self._shard_subscription is not None:
+            return self._shard_subscription.topics()
+        if self._subscription is None:
+            return {"%s/%s/#" % (self._spb_namespace, self._spb_group_name)}
+        return self._subscription.topics()
+
+    def _subscription_update(self):
+        """
+        Subscribe and unsubscribe the topics to match the current subscription, if connected
+        """
+        if not self.is_connected():
+            return
+
+        topics = self._subscription_topics_required()
+
+        for topic in sorted(topics - self._subscription_topics):
+            self._mqtt_subscribe(self._mqtt, topic)
+            self._logger.info("%s - Subscribed to MQTT topic: %s" % (self._entity_domain, topic))
+
+        for topic in sorted(self._subscription_topics - topics):
+            self._mqtt.unsubscribe(topic)
+            self._logger.info("%s - Unsubscribed from MQTT topic: %s" % (self._entity_domain, topic))
 
+        self._subscription_topics = topics
+
+    def _subscription_add(self, eon_name: str, eond_name: str = None):
+        """
+        Add an entity to the selective subscriptions, if dynamic subscriptions are enabled
+        """
+        if self._subscription is None or not self._subscription_dynamic:
+            return
+
+        if eond_name is None:
+            changed = self._subscription.add_edge_node(eon_name)
         else:
-            self._logger.warning("%s - Unknown message type %s, could not parse MQTT message, message ignored" %
-                                 (self._entity_domain, topic.message_type))
+            changed = self._subscription.add_device(eon_name, eond_name)
 
-        # Send message to Entity
-        super()._mqtt_on_message(client, userdata, msg)
+        if changed:
+            self._router.invalidate()
+            self._subscription_update()
 
+    def add_topic_handler(self, topic_filter: str, handler):
+        """
+        Register a handler for the received messages matching a MQTT topic filter.
 
-    def _register_edge_node(self, eon_name) -> EdgeEntity:
+        The handler is executed, as the on_message callback, once the message is processed by the application.
+        The topic filters are matched once per topic, the matching handlers are cached with the topic route.
+
+        Example:
+            app.add_topic_handler("spBv1.0/Group1/DDATA/+/Pump1", on_pump_data)
+
+        Args:
+            topic_filter:   MQTT topic filter, "+" matches a single level and "#" the remaining levels
+            handler:        Function( topic: SpbTopic, payload: dict )
+
+        Returns:    Nothing
         """
-        If not discovered, it will create the entity and return a reference
+        self._router.add_handler(topic_filter, handler)
+
+    def remove_topic_handler(self, topic_filter: str, handler) -> bool:
+        """
+        Remove a handler registered with add_topic_handler()
 
         Args:
-            eon_name:       EoN name
+            topic_filter:   MQTT topic filter
+            handler:        Handler function
 
-        Returns:    reference to the entity
+        Returns:    True if removed
         """
+        return self._router.remove_handler(topic_filter, handler)
 
-        # EDGE NODE - Let's check if the EdgeNode is already discovered, if not create it
-        if eon_name not in self.entities_eon.keys():
-            self._logger.debug("Unknown EoN entity, registering edge node: " + eon_name)
-            self.entities_eon[eon_name] = MqttSpbEntityApp.EdgeEntity(
-                spb_group_name=self._spb_group_name,
-                spb_eon_name=eon_name,
-                debug=self._debug_enabled
-            )
+    def _spb_route_accept(self, route: SpbRoute):
+        """
+        Resolve the group and the application filters of a new route
+        """
+        topic = route.topic
+        eon_name = topic.eon_name
 
-            # If callback is configured
-            if self.callback_new_eon is not None:
-                self.callback_new_eon(eon_name)
+        route.group = self.groups.get(topic.group_name, None)
 
-            self._logger.debug("New edge node <%s>" % eon_name)
+        # Ignore data from self application, the glob patterns of the selective subscriptions, and the
+        # entities owned by other application members in sharded mode
+        subscription = self._subscription
+        route.accepted = not (
+            eon_name == self.entity_name
+            or (subscription is not None and subscription.client_filter and not subscription.match(topic))
+            or (self._shard_ring is not None and eon_name is not None and not self.is_shard_owner(eon_name))
+        )
 
-        return self.entities_eon[eon_name]  # Return EoN
+    def set_decode_workers(self, workers: int = 0, start_method: str = None):
+        """
+        Configure the process pool decoding mode.
 
-    def _register_edge_device(self, eon_name, eond_name) -> DeviceEntity:
+        The spB payloads are decoded by a pool of worker processes, instead of the MQTT network thread. The
+        decoded payloads are processed ( entity update and callbacks ) by a single thread, in the same order
+        they were received, so the order of the messages of each EoN and EoND is preserved.
+
+        The worker processes are started before returning, with the "forkserver" start method if available or
+        "spawn" otherwise, never forking the threads of the application ( i.e. the MQTT network thread ). Your
+        main module must be protected with "if __name__ == '__main__':".
+
+        Args:
+            workers:        Number of worker processes. If set to 0, the pool is stopped and payloads are
+                            decoded in the MQTT network thread.
+            start_method:   multiprocessing start method of the worker processes, None for the default
+
+        Returns:    Nothing
         """
-            If not discovered, it will create the entity and return a reference
+
+        # Stop the current pool, the pending messages are processed before returning. No new messages are
+        # submitted to the pool once it is detached.
+        with self._decode_lock:
+            pool, decode_queue, thread = self._decode_pool, self._decode_queue, self._decode_thread
+            self._decode_pool = None
+            if pool is not None:
+                decode_queue.put(None)
+
+        if pool is not None:
+            thread.join()
+            pool.shutdown()
+            self._logger.info("%s - Decode process pool stopped" % self._entity_domain)
+
+        if workers > 0:
+
+            if start_method is None:
+                methods = multiprocessing.get_all_start_methods()
+                start_method = "forkserver" if "forkserver" in methods else "spawn"
+
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+
+            # Start the worker processes now, not from the MQTT network thread on the first messages
+            for future in [pool.submit(_decode_start) for _ in range(workers)]:
+                future.result()
+
+            decode_queue = queue.Queue(maxsize=workers * 64)  # Bounded, MQTT thread blocks when full
+            thread = threading.Thread(target=self._decode_pool_loop, args=(decode_queue,),
+                                      name="spb-decode-%s" % self.entity_name, daemon=True)
+            thread.start()
+
+            with self._decode_lock:
+                self._decode_queue = decode_queue
+                self._decode_thread = thread
+                self._decode_pool = pool
+
+            self._logger.info("%s - Decode process pool started, %d workers (%s)"
+                              % (self._entity_domain, workers, start_method))
+
+    def _decode_pool_loop(self, decode_queue: queue.Queue):
+        """
+        Process the decoded payloads from the worker processes, in the same order they were received.
+        """
+        while True:
+            item = decode_queue.get()
+            if item is None:
+                break
+
+            topic, future, msg_ts_rx = item
+            try:
+                self._spb_inbound_message(topic, future.result(), msg_ts_rx)
+            except Exception as e:
+                self._logger.error("%s - Error processing message %s (%s)" % (self._entity_domain, topic, str(e)))
+
+    def set_inbound_conflation(self, enabled: bool = True):
+        """
+        Configure the last-value conflation mode for inbound messages.
+
+        The decoded messages are processed ( entity update and callbacks ) by a separate thread. While the
+        messages of an edge node are pending to be processed, new DATA messages of the same EoN or EoND are
+        merged with the pending ones, so only the newest value of each metric is processed. If the application
+        can not keep up with the message rate, intermediate values are skipped instead of queued.
+
+        BIRTH and DEATH messages are never merged, and the order of the messages of each edge node is preserved.
 
         Args:
-            eon_name:       EoN name
-            eond_name:      EoND name
+            enabled:    Enable or disable the conflation mode. When disabled, the pending messages are
+                        processed before returning.
 
-        Returns:    reference to the entity
+        Returns:    Nothing
+        """
 
+        # Stop the current conflation thread
+        if self._conflation_queue is not None:
+            conflation_queue, thread = self._conflation_queue, self._conflation_thread
+            self._conflation_queue = None
+            conflation_queue.close()
+            thread.join()
+            self._logger.info("%s - Inbound conflation mode disabled" % self._entity_domain)
+
+        if enabled:
+            self._conflation_queue = SpbConflationQueue()
+            self._conflation_thread = threading.Thread(target=self._conflation_loop,
+                                                       args=(self._conflation_queue,),
+                                                       name="spb-conflation-%s" % self.entity_name,
+                                                       daemon=True)
+            self._conflation_thread.start()
+            self._logger.info("%s - Inbound conflation mode enabled" % self._entity_domain)
+
+    def get_conflation_stats(self) -> dict:
         """
+        Get the inbound conflation statistics
 
-        # DEVICE ENTITY - Let's check if the Device entity is already discovered, if not create it
-        if eond_name not in self.entities_eon[eon_name].entities_eond.keys():
+        Returns: dictionary with the number of received messages, pending messages and conflated metric values
+        """
+        conflation_queue = self._conflation_queue
+        if conflation_queue is None:
+            return {"messages": 0, "pending": 0, "conflated": 0}
 
-            self.entities_eon[eon_name].entities_eond[eond_name] = MqttSpbEntityApp.DeviceEntity(
-                spb_group_name=self._spb_group_name,
-                spb_eon_name=eon_name,
-                spb_eon_device_name=eond_name,
-                debug=self._debug_enabled
-            )
+        return {
+            "messages": conflation_queue.messages,
+            "pending": conflation_queue.pending(),
+            "conflated": conflation_queue.conflated,
+        }
 
-            # If callback is configured
-            if self.callback_new_eond is not None:
-                self.callback_new_eond(eon_name, eond_name)
+    def _conflation_loop(self, conflation_queue: SpbConflationQueue):
+        """
+        Process the pending messages from the conflation queue
+        """
+        while True:
+            events = conflation_queue.get()
+            if events is None:
+                break
+
+            for topic, payload, msg_ts_rx in events:
+                try:
+                    self._spb_on_message(topic, payload, msg_ts_rx)
+                except Exception as e:
+                    self._logger.error("%s - Error processing message %s (%s)" % (self._entity_domain, topic, str(e)))
+
+    def _spb_inbound_message(self, topic: SpbTopic, payload: dict, msg_ts_rx: int):
+        """
+        Process a decoded message, or queue it if the conflation mode is enabled.
+        """
+        if isinstance(payload, dict):
+            self._spb_check_sequence(topic, payload)
 
-            self._logger.debug("New device <%s> for edge node <%s>" % (eond_name, eon_name))
+        conflation_queue = self._conflation_queue
+        if conflation_queue is not None and isinstance(payload, dict):
+            conflation_queue.put(topic.eon_name, topic, payload, msg_ts_rx)
+        else:
+            self._spb_on_message(topic, payload, msg_ts_rx)
 
-        return self.entities_eon[eon_name].entities_eond[eond_name]  # Return EoND
+    def _spb_check_sequence(self, topic: SpbTopic, payload: dict):
+        """
+        Check the sequence number of the messages of each EoN, detecting the sequence gaps, out of order
+        messages and messages without a previous BIRTH. A rebirth is requested if the rebirth requests mode
+        is enabled ( see set_rebirth_requests ).
+        """
 
-    def get_edge_node(self, eon_name: str) -> EdgeEntity:
+        eon_name = topic.eon_name
+        message_type = topic.message_type
+
+        # Selective subscriptions - Only checked if all the messages of the EoN are received, otherwise every
+        # filtered message is a gap, and the rebirth BIRTH messages may not be subscribed.
+        subscription = self._subscription
+        if subscription is not None and not subscription.covers_sequence(eon_name):
+            return
+
+        if message_type == "NDEATH":
+            self._seq_last.pop(eon_name, None)
+            self._seq_devices.pop(eon_name, None)
+            return
+
+        if message_type not in ("NBIRTH", "NDATA", "DBIRTH", "DDATA", "DDEATH"):
+            return
+
+        seq = payload.get("seq", None)
+        seq = int(seq) if seq is not None else None
+
+        if message_type == "NBIRTH":
+            self._seq_last[eon_name] = seq
+            self._seq_devices[eon_name] = set()
+            if self._rebirth is not None:
+                self._rebirth.completed(eon_name)
+            return
+
+        error = None
+        if eon_name not in self._seq_last:
+            error = "no_birth"
+
+        else:
+            last = self._seq_last[eon_name]
+            if seq is not None and last is not None:
+                expected = (last + 1) & 0xFF
+                if seq != expected:
+                    if ((expected - seq) & 0xFF) < 128:
+                        error = "out_of_order"    # Older than expected, the last sequence is kept
+                    else:
+                        error = "gaps"
+                        self._seq_last[eon_name] = seq
+                else:
+                    self._seq_last[eon_name] = seq
+
+            devices = self._seq_devices[eon_name]
+            if message_type == "DBIRTH":
+                devices.add(topic.eon_device_name)
+            elif message_type == "DDEATH":
+                devices.discard(topic.eon_device_name)
+            elif message_type == "DDATA" and topic.eon_device_name not in devices and error is None:
+                error = "no_birth"
+
+        if error is None:
+            return
+
+        self._seq_stats[error] += 1
+        self._logger.debug("%s - Sequence error (%s) on message %s" % (self._entity_domain, error, topic))
+
+        if self._rebirth is not None:
+            self._rebirth.request(eon_name)
+
+    def set_liveness(self, enabled: bool = True, interval: float = None, stale_factor: float = 2.0,
+                     offline_factor: float = 5.0, resolution: float = 0.5):
         """
-            Subscribe and get a reference to the virtual EoN entity.
+        Configure the liveness tracking mode.
+
+        The entities are ONLINE while they publish messages, STALE when no message is received for stale_factor
+        times their expected interval, and OFFLINE after offline_factor times their expected interval or when
+        a DEATH message is received. OFFLINE entities are not alive. The transitions are notified with the
+        callback_liveness( entity, old_state, new_state ) callback.
+
         Args:
-            eon_name:   EoN Entity Name
+            enabled:        Enable or disable the liveness tracking
+            interval:       Expected interval between messages in seconds, None to learn it for each entity
+            stale_factor:   Number of intervals without messages to mark an entity as STALE
+            offline_factor: Number of intervals without messages to mark an entity as OFFLINE
+            resolution:     Timer resolution in seconds
 
-        Returns:    Reference for the EoN Entity.
+        Returns:    Nothing
         """
-        return self._register_edge_node(eon_name)  # Get reference for the
 
-    def get_edge_device(self, eon_name: str, eond_name: str) -> DeviceEntity:
+        if self._liveness is not None:
+            self._liveness.stop()
+            self._liveness = None
+
+        if enabled:
+            self._liveness = SpbLivenessTracker(interval=interval, stale_factor=stale_factor,
+                                                offline_factor=offline_factor, resolution=resolution,
+                                                callback=self._spb_on_liveness, debug=self._debug_enabled)
+            self._liveness.start()
+
+    def _spb_on_liveness(self, entity, old_state: str, new_state: str):
         """
-        Get reference for the virtual Edge Node Device (EoND) entity.
+        Entity liveness transition
+        """
+        if new_state == SpbLivenessTracker.OFFLINE:
+            entity._is_alive = False
+
+        if self.callback_liveness is not None:
+            entity._spb_callback(self.callback_liveness, entity, old_state, new_state)
+
+    def get_liveness_state(self, eon_name: str, eond_name: str = None) -> str:
+        """
+        Get the liveness state of a discovered entity ( see set_liveness )
+
+        Args:
+            eon_name:   EoN name
+            eond_name:  EoND name, None for the EoN
+
+        Returns:    State ( online, stale, offline ), None if unknown
+        """
+        eon = self.entities_eon.get(eon_name, None)
+        if eon is None or self._liveness is None:
+            return None
+        entity = eon if eond_name is None else eon.entities_eond.get(eond_name, None)
+        return self._liveness.get_state(entity)
+
+    def get_liveness_counts(self) -> dict:
+        """
+        Get the number of entities in each liveness state ( see set_liveness )
+
+        Returns:    dictionary state -> count
+        """
+        if self._liveness is None:
+            return {}
+        return self._liveness.get_counts()
+
+    def set_rebirth_requests(self, enabled: bool = True, min_interval: float = 30.0, max_inflight: int = 10,
+                             timeout: float = 10.0):
+        """
+        Configure the rebirth requests mode.
+
+        When a sequence gap, an out of order message or a message without a previous BIRTH is detected, a
+        rebirth is requested to the EoN ( NCMD Node Control/Rebirth ). The requests are coalesced and rate
+        limited per EoN, and the number of requests waiting for the BIRTH message is limited fleet-wide.
+
+        Args:
+            enabled:        Enable or disable the rebirth requests
+            min_interval:   Minimum time between requests to the same EoN, in seconds
+            max_inflight:   Maximum number of requests waiting for the BIRTH message, fleet-wide
+            timeout:        Time to wait for the BIRTH message of a request, in seconds
+
+        Returns:    Nothing
+        """
+
+        if self._rebirth is not None:
+            self._rebirth.stop()
+            self._rebirth = None
+
+        if enabled:
+            self._rebirth = SpbRebirthScheduler(self.send_rebirth_request,
+                                                min_interval=min_interval, max_inflight=max_inflight,
+                                                timeout=timeout, debug=self._debug_enabled)
+            self._rebirth.start()
+
+    def send_rebirth_request(self, eon_name: str) -> bool:
+        """
+        Send a rebirth request to an EoN ( NCMD Node Control/Rebirth )
+
+        Args:
+            eon_name:   EoN name
+
+        Returns:    True if the request was sent
+        """
+        if not self.is_connected():
+            self._logger.warning("%s - Could not send rebirth request to %s, not connected to MQTT server"
+                                 % (self._entity_domain, eon_name))
+            return False
+
+        payload = getDdataPayload()
+        addMetric(container=payload, name="Node Control/Rebirth", alias=None, type=MetricDataType.Boolean,
+                  value=True, timestamp=int(round(time.time() * 1000)))
+
+        topic = "%s/%s/NCMD/%s" % (self._spb_namespace, self._spb_group_name, eon_name)
+
+        self._logger.debug("%s - Rebirth request sent to %s" % (self._entity_domain, eon_name))
+
+        return self._mqtt_payload_publish(topic, bytearray(payload.SerializeToString()))
+
+    def get_sequence_stats(self) -> dict:
+        """
+        Get the sequence tracking statistics, and the rebirth request statistics if enabled
+
+        Returns:    dictionary
+        """
+        stats = dict(self._seq_stats)
+        if self._rebirth is not None:
+            stats.update({"rebirth_" + k: v for k, v in self._rebirth.get_stats().items()})
+        return stats
+
+    def _mqtt_on_message(self, client, userdata, msg):
+
+        # self._logger.info("%s - Message received  %s" % (self._entity_domain, msg.topic))
+
+        if self._recorder is not None:
+            self._recorder.on_message(msg)
+
+        # Route of the topic, cached per topic string ( parsed topic, group, filters and handlers )
+        route = self._router.resolve(msg.topic)
+        if route is None:
+            self._logger.warning("%s - Invalid spB topic %s, message ignored" % (self._entity_domain, msg.topic))
+            return
+        if route.accepted is None:
+            self._spb_route_accept(route)
+
+        # Multi-group - Messages of the other groups
+        if route.group is not None:
+            route.group._mqtt_on_message(client, userdata, msg)
+            return
+
+        # Initialization period - Count the retained messages for the quiescence detector
+        if not self._spb_initialized and msg.retain:
+            self._spb_init_rx_count += 1
+
+        msg_ts_rx = int(time.time() * 1000)  # Save the current timestamp
+
+        # Messages filtered by the application ( before decoding the payload )
+        if not route.accepted:
+            return
+
+        topic = route.topic
+
+        # STATE message from a SCADA application, not a spB protobuf payload
+        if topic.message_type == "STATE":
+            if self.on_message is not None:
+                self._spb_callback(self.on_message, topic, msg.payload.decode("utf-8"), key=topic.domain)
+            return
+
+        # PARSE PAYLOAD - De-serialize payload, in the worker processes if the decode pool is enabled.
+        if self._decode_pool is not None:
+            with self._decode_lock:
+                if self._decode_pool is not None:
+                    future = self._decode_pool.submit(_decode_payload, bytes(msg.payload))
+                    self._decode_queue.put((topic, future, msg_ts_rx))
+                    return
+
+        payload = SpbPayloadParser().parse_payload(msg.payload)
+
+        self._spb_inbound_message(topic, payload, msg_ts_rx)
+
+    def _spb_on_message(self, topic: SpbTopic, payload: dict, msg_ts_rx: int):
+
+        eon_name = topic.eon_name
+        eond_name = topic.eon_device_name
+
+        # Check that the group is correct
+        if topic.group_name != self._spb_group_name:
+            self._logger.warning("%s - Incorrect MQTT group %s. Message ignored !"
+                                 % (self._entity_domain, topic.group_name))
+            return
+
+        if not isinstance(payload, dict):
+            self._logger.warning("%s - Could not parse MQTT payload from %s, message ignored !"
+                                 % (self._entity_domain, topic))
+            return
+
+        # Add the timestamp when the message was received
+        payload['timestamp_rx'] = msg_ts_rx
+
+        # Route of the topic - Entity (EoN / EoND) and message handler, resolved once per topic
+        route = self._router.resolve(topic.topic)
+        entity = route.entity
+        if entity is None:
+            # EDGE NODE - Let's check if the EdgeNode is already discovered, if not create it
+            entity = self._register_edge_node(eon_name=eon_name)
+
+            # DEVICE NODE - Lets check if device is discovered, otherwise create it.
+            if eond_name is not None:
+                entity = self._register_edge_device(eon_name=eon_name, eond_name=eond_name)
+
+            route.entity = entity
+            route.handler = self._message_handlers.get(route.kind, None)
+
+        # Liveness tracking
+        liveness = self._liveness
+        if liveness is not None and self._spb_initialized:
+            if route.kind == "DEATH":
+                liveness.dead(entity, msg_ts_rx)
+                if eond_name is None:   # Devices are offline with their edge node
+                    for device in list(entity.entities_eond.values()):
+                        liveness.dead(device, msg_ts_rx)
+            elif route.kind != "CMD":
+                liveness.seen(entity, msg_ts_rx)
+                if eond_name is not None:   # Device messages are published through their edge node
+                    liveness.seen(self.entities_eon[eon_name], msg_ts_rx)
+
+        # Parse the message from its type - do not parse entity commands
+        if route.handler is not None:
+            self._message_seq = payload.get("seq", None)
+            route.handler(entity, topic, payload)
+            self._message_seq = None
+        elif route.kind != "CMD":
+            self._logger.warning("%s - Unknown message type %s, could not parse MQTT message, message ignored" %
+                                 (self._entity_domain, topic.message_type))
+
+        # User topic handlers
+        for handler in route.handlers:
+            self._spb_callback(handler, topic, payload, key=topic.domain)
+
+        # Send message to Entity
+        super()._spb_on_message(topic, payload, msg_ts_rx)
+
+    def _spb_on_birth(self, entity, topic: SpbTopic, payload: dict):
+        if self._spb_initialized:
+            entity._is_alive = True  # Update status
+        entity.deserialize_payload_birth(payload)  # Send the payload to the entity to deserialize it.
+        self._index_attributes(entity)
+        if entity.callback_birth is not None:
+            entity._spb_callback(entity.callback_birth, dict(payload))
+        if self.callback_birth is not None:
+            entity._spb_callback(self.callback_birth, topic, dict(payload))
+
+    def _spb_on_data(self, entity, topic: SpbTopic, payload: dict):
+        if self._spb_initialized:
+            entity._is_alive = True  # Update status
+        entity.deserialize_payload_data(payload)  # Send the payload to the entity to deserialize it.
+        if entity.callback_data is not None:
+            entity._spb_callback(entity.callback_data, dict(payload))
+        if self.callback_data is not None:
+            entity._spb_callback(self.callback_data, topic, dict(payload))
+
+    def _spb_on_death(self, entity, topic: SpbTopic, payload: dict):
+        if self._spb_initialized:
+            entity._is_alive = False  # Update status
+        if entity.callback_death is not None:
+            entity._spb_callback(entity.callback_death, dict(payload))
+        if self.callback_death is not None:
+            entity._spb_callback(self.callback_death, topic, dict(payload))
+
+    def _new_edge_node(self, eon_name) -> EdgeEntity:
+        """
+        Create a new virtual EoN entity ( overridden by subclasses to use their own entity classes )
+        """
+        return MqttSpbEntityApp.EdgeEntity(
+            spb_group_name=self._spb_group_name,
+            spb_eon_name=eon_name,
+            debug=self._debug_enabled
+        )
+
+    def _new_edge_device(self, eon_name, eond_name) -> DeviceEntity:
+        """
+        Create a new virtual EoND entity ( overridden by subclasses to use their own entity classes )
+        """
+        return MqttSpbEntityApp.DeviceEntity(
+            spb_group_name=self._spb_group_name,
+            spb_eon_name=eon_name,
+            spb_eon_device_name=eond_name,
+            debug=self._debug_enabled
+        )
+
+    def _register_edge_node(self, eon_name) -> EdgeEntity:
+        """
+        If not discovered, it will create the entity and return a reference
+
+        Args:
+            eon_name:       EoN name
+
+        Returns:    reference to the entity
+        """
+
+        # EDGE NODE - Let's check if the EdgeNode is already discovered, if not create it
+        if eon_name not in self.entities_eon.keys():
+            self._logger.debug("Unknown EoN entity, registering edge node: " + eon_name)
+            entity = self._new_edge_node(eon_name)
+            entity.set_callback_dispatcher(self._callback_dispatcher)
+            entity._alive_generation = self._alive_generation
+            entity._attribute_index = self._attribute_index
+            entity._metric_update_hook = self._spb_on_metric_update
+            self._track_changes(entity)
+            self.entities_eon[eon_name] = entity
+
+            # If callback is configured
+            if self.callback_new_eon is not None:
+                entity._spb_callback(self.callback_new_eon, eon_name)
+
+            self._logger.debug("New edge node <%s>" % eon_name)
+
+        return self.entities_eon[eon_name]  # Return EoN
+
+    def _register_edge_device(self, eon_name, eond_name) -> DeviceEntity:
+        """
+            If not discovered, it will create the entity and return a reference
+
+        Args:
+            eon_name:       EoN name
+            eond_name:      EoND name
+
+        Returns:    reference to the entity
+
+        """
+
+        # DEVICE ENTITY - Let's check if the Device entity is already discovered, if not create it
+        if eond_name not in self.entities_eon[eon_name].entities_eond.keys():
+
+            entity = self._new_edge_device(eon_name, eond_name)
+            entity.set_callback_dispatcher(self._callback_dispatcher)
+            entity._alive_generation = self._alive_generation
+            entity._metric_update_hook = self._spb_on_metric_update
+            self._track_changes(entity)
+            self.entities_eon[eon_name].entities_eond[eond_name] = entity
+
+            # If callback is configured
+            if self.callback_new_eond is not None:
+                entity._spb_callback(self.callback_new_eond, eon_name, eond_name)
+
+            self._logger.debug("New device <%s> for edge node <%s>" % (eond_name, eon_name))
+
+        return self.entities_eon[eon_name].entities_eond[eond_name]  # Return EoND
+
+    def _unregister_edge_node(self, eon_name):
+        """
+        Remove a discovered EoN entity, and its devices, from the application
+
+        Args:
+            eon_name:       EoN name
+
+        Returns:    Nothing
+        """
+        entity = self.entities_eon.pop(eon_name, None)
+        if entity is None:
+            return
+
+        self._router.invalidate()   # Routes referencing the removed entities
+
+        self._history.pop(entity, None)
+        if self._liveness is not None:
+            self._liveness.remove(entity)
+        self._eon_attribute_index.remove_entity(entity)
+        self._eon_data_index.remove_entity(entity)
+        with self._change_log_lock:
+            self._change_log.pop(entity, None)
+            for device in entity.entities_eond.values():
+                self._change_log.pop(device, None)
+        for device in entity.entities_eond.values():
+            if self._liveness is not None:
+                self._liveness.remove(device)
+            self._attribute_index.remove_entity(device)
+            self._data_index.remove_entity(device)
+            self._history.pop(device, None)
+
+    def _track_changes(self, entity):
+        """
+        Record the metric updates of a discovered entity in the application change log
+        """
+        for group in (entity.attributes, entity.data, entity.commands):
+            group._set_change_log(self._change_log, entity, self._change_log_lock)
+
+    def _changed_entities(self, since: int) -> list:
+        """
+        Get the entities with metrics updated after a version, ordered by update
+        """
+        res = []
+        with self._change_log_lock:
+            change_log = self._change_log
+            for entity in reversed(change_log):
+                if change_log[entity] <= since:
+                    break
+                res.append(entity)
+        res.reverse()
+        return res
+
+    def get_changes(self, since: int = 0) -> tuple:
+        """
+        Get the metric values updated after a version cursor, of all the groups managed by the application. Only
+        the updated entities and metrics are visited, so polling the changes is proportional to the number of
+        updates, not to the fleet size. The metric updated flags are not modified.
+
+        Example:
+            cursor, rows = app.get_changes()    # All the metrics
+            ...
+            cursor, rows = app.get_changes(cursor)  # Only the metrics updated since the previous call
+
+        Args:
+            since:  version cursor returned by the previous call, 0 for all the metrics
+
+        Returns:    tuple ( cursor, rows ), where rows is a list of flat rows ( group, eon, eond, kind, metric,
+                    value, timestamp, datatype, version ). A metric updated during the call may be returned
+                    again in the next call.
+        """
+
+        cursor = get_metric_version()
+
+        if not since:
+            return cursor, list(iter_fleet_rows([self] + list(self.groups.values())))
+
+        rows = []
+        for app in [self] + list(self.groups.values()):
+            group_name = app.spb_group_name
+            for entity in app._changed_entities(since):
+                rows.extend(iter_entity_rows(entity, group_name, since))
+
+        return cursor, rows
+
+    def _spb_on_metric_update(self, entity, value_group, name, value, timestamp):
+        """
+        Metric value deserialized by an entity ( BIRTH / DATA messages )
+
+        Args:
+            entity:         EoN / EoND entity
+            value_group:    Metric group updated ( data, attributes or commands )
+            name:           Metric name
+            value:          Metric value
+            timestamp:      Metric timestamp
+
+        Returns:    Nothing
+        """
+        if value_group is not entity.data:
+            return
+
+        self._spb_store_metric(entity, name, value, timestamp)
+
+        for callback in self._metric_watch.match(entity.spb_eon_name, entity.spb_eon_device_name, name):
+            entity._spb_callback(callback, entity, name, value, timestamp, conflate_key=name)
+
+        streams = self._streams
+        if streams:
+            seq = self._message_seq
+            record = SpbChange(self._spb_group_name, entity.spb_eon_name, entity.spb_eon_device_name, name, value,
+                               timestamp, int(seq) if seq is not None else None)
+            for stream in streams:
+                stream.put(record)
+
+    def _spb_store_metric(self, entity, name, value, timestamp):
+        """
+        Update the application state of a data metric value ( indexes, history and shared table ), without
+        notifying the change ( metric watches and change streams )
+        """
+        if entity.spb_eon_device_name is not None:
+            self._data_index.update(entity, name, value)
+        else:
+            self._eon_data_index.update(entity, name, value)
+
+        if self._history_config is not None:
+            self._history_record(entity, name, value, timestamp)
+
+        if self._shared_table is not None:
+            self._shared_table.write(self._spb_group_name, entity.spb_eon_name, entity.spb_eon_device_name, name,
+                                     value, timestamp)
+
+    def open_change_stream(self, batch_size: int = 1000, window: float = 0.0,
+                           max_queue: int = 100000) -> SpbChangeStream:
+        """
+        Open a change data capture stream of the received data metrics.
+
+        The stream yields batches of flat records ( group, eon, eond, metric, value, timestamp, seq ), for
+        all the groups managed by the application. Close the stream when it is no longer consumed.
+
+        Example:
+            with app.open_change_stream(batch_size=500, window=1.0) as stream:
+                for batch in stream:
+                    producer.send_rows(batch)
+
+        Args:
+            batch_size: Maximum number of records per batch
+            window:     Time to wait for a full batch once a record is available, in seconds
+            max_queue:  Maximum number of queued records, the oldest records are discarded when full
+
+        Returns:    SpbChangeStream
+        """
+        stream = SpbChangeStream(batch_size=batch_size, window=window, max_queue=max_queue,
+                                 on_close=self._stream_closed)
+        for app in [self] + list(self.groups.values()):
+            app._streams = app._streams + (stream,)
+        return stream
+
+    def _stream_closed(self, stream: SpbChangeStream):
+        for app in [self] + list(self.groups.values()):
+            app._streams = tuple(s for s in app._streams if s is not stream)
+
+    def add_metric_callback(self, pattern: tuple, callback) -> int:
+        """
+        Register a callback for the data metrics matching a pattern.
+
+        The callback is executed for each received value of the matching metrics, without the payload of
+        the message. The metrics not watched by any callback are discarded with a single lookup.
+
+        Example:
+            app.add_metric_callback(("Line1", "*", "Temperature"), on_temperature)
+
+        Args:
+            pattern:    ( EoN name, EoND name, metric name ), each field can be a glob pattern. Set the
+                        EoND name to None to watch the metrics of the edge nodes.
+            callback:   Function( entity, metric_name, value, timestamp ). For historical metrics the value and
+                        the timestamp are lists.
+
+        Returns:    Callback registration id
+        """
+        eon_name, eond_name, metric_name = pattern
+        return self._metric_watch.add(eon_name, eond_name, metric_name, callback)
+
+    def remove_metric_callback(self, registration_id: int) -> bool:
+        """
+        Remove a callback registered with add_metric_callback()
+
+        Args:
+            registration_id:    Callback registration id
+
+        Returns:    True if removed
+        """
+        return self._metric_watch.remove(registration_id)
+
+    def set_metric_history(self, enabled: bool = True, max_count: int = 0, max_age: int = 0, max_bytes: int = 0,
+                           compression: bool = False, metrics: list = None):
+        """
+        Keep a time series history of the numeric data metrics received from the discovered entities.
+
+        Args:
+            enabled:        Enable or disable the metric history, disabling it discards the stored history
+            max_count:      Maximum number of points per metric, 0 for no limit
+            max_age:        Maximum age of the points in milliseconds, 0 for no limit
+            max_bytes:      Memory budget per metric in bytes, 0 for no limit
+            compression:    Compress the stored points ( delta-of-delta timestamps and XOR float values )
+            metrics:        List of metric names to keep, None for all the metrics
+
+        Returns:    Nothing
+        """
+
+        self._history = {}
+
+        if not enabled:
+            self._history_config = None
+            return
+
+        if not (max_count or max_age or max_bytes):
+            self._logger.warning("%s - Metric history without retention limits, memory will grow without limit"
+                                 % self._entity_domain)
+
+        self._history_config = (
+            dict(max_count=max_count, max_age=max_age, max_bytes=max_bytes, compression=compression),
+            set(metrics) if metrics is not None else None
+        )
+
+    def _history_record(self, entity, name, value, timestamp):
+        """
+        Add a metric value to its history
+        """
+        kwargs, metrics = self._history_config
+        if metrics is not None and name not in metrics:
+            return
+
+        # Value lists are received with the timestamps of each value
+        if isinstance(value, list):
+            if not isinstance(timestamp, list):
+                return
+            points = zip(timestamp, value)
+        else:
+            if timestamp is None:
+                timestamp = int(time.time() * 1000)
+            points = ((timestamp, value),)
+
+        history = None
+        for ts, v in points:
+            if not isinstance(v, (int, float)):    # Only numeric and boolean values
+                return
+            if history is None:
+                entity_history = self._history.setdefault(entity, {})
+                history = entity_history.get(name, None)
+                if history is None:
+                    history = entity_history[name] = SpbMetricHistory(**kwargs)
+            history.append(int(ts), float(v))
+
+    def get_metric_history(self, eon_name: str, eond_name: str = None, name: str = None):
+        """
+        Get the history of a metric of a discovered entity ( see set_metric_history )
+
+        Example:
+            # Last 10 minutes of temperature values
+            timestamps, values = app.get_metric_history("EoN1", "Device1", "temperature").get_last(600000)
+
+        Args:
+            eon_name:   EoN name
+            eond_name:  EoND name, None for the EoN metrics
+            name:       Metric name
+
+        Returns:    SpbMetricHistory, None if there is no history for the metric
+        """
+        eon = self.entities_eon.get(eon_name, None)
+        if eon is None:
+            return None
+
+        entity = eon if eond_name is None else eon.entities_eond.get(eond_name, None)
+        return self._history.get(entity, {}).get(name, None)
+
+    def set_historian(self, path: str = None, partition: int = 86400, retention: int = 0,
+                      batch_size: int = 1000, window: float = 1.0, max_queue: int = 100000):
+        """
+        Configure the historian mode. The received data metric values are persisted into a local SQLite
+        database, written in batches by a background thread ( see SpbSqliteHistorian ).
+
+        Args:
+            path:       Database file path. If set to None, the historian mode is disabled.
+            partition:  Duration of the time partitions ( data tables ) in seconds
+            retention:  Time to keep the partitions in seconds, relative to the current time. 0 to keep all
+            batch_size: Maximum number of values written per transaction
+            window:     Maximum time to wait for a full batch, in seconds
+            max_queue:  Maximum number of values pending to be written, the oldest are discarded when full
+
+        Returns:    Nothing
+        """
+
+        if self._historian is not None:
+            self._historian.stop()
+            self._historian = None
+
+        if path is None:
+            return
+
+        self._historian = SpbSqliteHistorian(path, partition=partition, retention=retention,
+                                             debug=self._debug_enabled)
+        self._historian.start(self.open_change_stream(batch_size=batch_size, window=window, max_queue=max_queue))
+
+        self._logger.info("%s - Historian mode, database %s" % (self._entity_domain, path))
+
+    def query_historian(self, eon_name: str, eond_name: str = None, name: str = None,
+                        start: int = None, end: int = None) -> list:
+        """
+        Get the values of a metric stored by the historian mode, in a time range
+
+        Args:
+            eon_name:   EoN name
+            eond_name:  EoND name, None for the EoN metrics
+            name:       Metric name
+            start:      Range start timestamp in milliseconds ( included ), None from the first value
+            end:        Range end timestamp in milliseconds ( excluded ), None to the last value
+
+        Returns:    list of ( timestamp, value ), empty if the historian mode is disabled
+        """
+        if self._historian is None:
+            return []
+        return self._historian.query(eon_name, eond_name, name, start, end, group=self._spb_group_name)
+
+    def set_shared_table(self, enabled: bool = True, name: str = None, slots: int = 65536,
+                         directory_size: int = None) -> str:
+        """
+        Configure the shared table mode. The last values of the received numeric and boolean data metrics, of all
+        the groups managed by the application, are published into a shared memory table, so other processes of
+        the host can read them without their own MQTT connection ( see SpbSharedTableReader ).
+
+        Example:
+            name = app.set_shared_table(name="spb_fleet")
+            ...
+            # Other process
+            table = SpbSharedTableReader("spb_fleet")
+            value, timestamp = table.read("Group1", "Line1", "Device1", "Temperature")
+
+        Args:
+            enabled:        Enable or disable the shared table mode, disabling it removes the segment
+            name:           Shared memory segment name, None for a random name
+            slots:          Maximum number of metrics of the table
+            directory_size: Size of the metrics directory in bytes, by default 64 bytes per slot
+
+        Returns:    Shared memory segment name, None if disabled
+        """
+
+        if self._shared_table is not None:
+            table = self._shared_table
+            for app in [self] + list(self.groups.values()):
+                app._shared_table = None
+            table.close()
+
+        if not enabled:
+            return None
+
+        table = SpbSharedTable(name, slots=slots, directory_size=directory_size, debug=self._debug_enabled)
+        for app in [self] + list(self.groups.values()):
+            app._shared_table = table
+
+        # Publish the values already received
+        for app in [self] + list(self.groups.values()):
+            for eon in list(app.entities_eon.values()):
+                for entity in [eon] + list(eon.entities_eond.values()):
+                    for item in list(entity.data.values()):
+                        table.write(app.spb_group_name, entity.spb_eon_name, entity.spb_eon_device_name, item.name,
+                                    item._value if len(item._value) != 1 else item._value[0],
+                                    item._timestamp if len(item._timestamp) != 1 else item._timestamp[0])
+
+        self._logger.info("%s - Shared table mode, segment %s" % (self._entity_domain, table.name))
+
+        return table.name
+
+    def set_columnar_sink(self, directory: str = None, file_format: str = "parquet", max_rows: int = 1000000,
+                          max_bytes: int = 0, max_age: float = 3600.0, batch_size: int = 10000, window: float = 5.0,
+                          max_queue: int = 1000000):
+        """
+        Configure the columnar sink mode. The received data metric values, of all the groups managed by the
+        application, are written into rolling Parquet or Arrow IPC files by a background thread
+        ( see SpbColumnarSink ). Requires the pyarrow package.
+
+        Args:
+            directory:      Output directory. If set to None, the columnar sink mode is disabled.
+            file_format:    "parquet" or "arrow"
+            max_rows:       Maximum number of rows per file, 0 for unlimited
+            max_bytes:      Maximum file size in bytes, 0 for unlimited
+            max_age:        Maximum duration of a file in seconds, 0 for unlimited
+            batch_size:     Maximum number of values per record batch
+            window:         Maximum time to wait for a full record batch, in seconds
+            max_queue:      Maximum number of values pending to be written, the oldest are discarded when full
+
+        Returns:    Nothing
+        """
+
+        if self._columnar_sink is not None:
+            self._columnar_sink.stop()
+            self._columnar_sink = None
+
+        if directory is None:
+            return
+
+        self._columnar_sink = SpbColumnarSink(directory, file_format=file_format, prefix=self._spb_group_name,
+                                              max_rows=max_rows, max_bytes=max_bytes, max_age=max_age,
+                                              debug=self._debug_enabled)
+        self._columnar_sink.start(self.open_change_stream(batch_size=batch_size, window=window,
+                                                          max_queue=max_queue))
+
+        self._logger.info("%s - Columnar sink mode, directory %s" % (self._entity_domain, directory))
+
+    def _index_attributes(self, entity):
+        """
+        Update the attribute index with the current attribute values of a device or an edge node
+        """
+        index = self._eon_attribute_index if entity.spb_eon_device_name is None else self._attribute_index
+        for name in entity.attributes.get_names():
+            item = entity.attributes[name]
+            is_updated = item.is_updated    # Keep the updated flag, reading the value clears it
+            index.update(entity, name, item.value)
+            item.is_updated = is_updated
+
+    def search_device_by_attribute(self, attributes: dict) -> list:
+        """
+        Search the devices, of all the discovered edge nodes, matching all the attribute values.
+
+        Args:
+            attributes: dictionary of attribute name -> value ( compared by its string representation )
+
+        Returns:    list of device entities ( not ordered )
+        """
+        if not attributes:
+            return [device for eon in self.entities_eon.values() for device in eon.entities_eond.values()]
+
+        return list(self._attribute_index.search(attributes))
+
+    def search_device_by_attribute_range(self, name: str, min_value=None, max_value=None) -> list:
+        """
+        Search the devices, of all the discovered edge nodes, with a numeric attribute value in a range
+        ( min_value <= value <= max_value ).
+
+        Args:
+            name:       attribute name
+            min_value:  minimum value, None for no lower limit
+            max_value:  maximum value, None for no upper limit
+
+        Returns:    list of device entities ( not ordered )
+        """
+        return list(self._attribute_index.find_range(name, min_value, max_value))
+
+    def set_snapshot(self, path: str = None, interval: float = 60.0, restore: bool = True) -> int:
+        """
+        Configure the snapshots of the application state ( discovered entities, metric types and last known
+        values ) to a local file. The snapshot is written periodically and on disconnect.
+
+        On restore, the entities are created with their last known values so the application is usable
+        before the edge nodes publish their BIRTH messages, and they are updated as live messages arrive.
+        Restored entities are not alive until a BIRTH or DATA message is received. The restored values are
+        indexed and recorded to the history, but not notified to the metric callbacks and change streams.
+
+        Args:
+            path:       Snapshot file path, None to disable the snapshots
+            interval:   Periodic snapshot interval in seconds, 0 to only write it on disconnect
+            restore:    Restore the application state from the file, if it exists
+
+        Returns:    Number of restored entities
+        """
+
+        # Stop the periodic snapshots
+        if self._snapshot_thread is not None:
+            self._snapshot_stop.set()
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+            self._snapshot_stop = None
+
+        self._snapshot_path = path
+        if path is None:
+            return 0
+
+        count = self.load_snapshot(path) if restore else 0
+
+        if interval > 0:
+            self._snapshot_stop = threading.Event()
+            self._snapshot_thread = threading.Thread(target=self._snapshot_loop, args=(self._snapshot_stop, interval),
+                                                     name="spb-snapshot", daemon=True)
+            self._snapshot_thread.start()
+
+        return count
+
+    def _snapshot_loop(self, stop: threading.Event, interval: float):
+        while not stop.wait(interval):
+            try:
+                self.save_snapshot()
+            except Exception as e:  # Keep the periodic snapshots running
+                self._logger.error("%s - Could not save the snapshot (%s)" % (self._entity_domain, str(e)))
+
+    def save_snapshot(self, path: str = None) -> bool:
+        """
+        Write a snapshot of the application state to a file
+
+        Args:
+            path:   File path, if None the path configured by set_snapshot is used
+
+        Returns:    True if the snapshot was written
+        """
+
+        path = path or self._snapshot_path
+        if path is None:
+            return False
+
+        entities = []
+        for eon_name, eon in list(self.entities_eon.items()):
+            entities.append((eon_name, None, self._snapshot_entity(eon)))
+            for eond_name, eond in list(eon.entities_eond.items()):
+                entities.append((eon_name, eond_name, self._snapshot_entity(eond)))
+
+        state = {
+            "group": self._spb_group_name,
+            "timestamp": int(time.time() * 1000),
+            "entities": entities,
+        }
+
+        try:
+            write_snapshot(path, state)
+        except (OSError, TypeError, ValueError) as e:
+            self._logger.error("%s - Could not write the snapshot file %s (%s)" % (self._entity_domain, path, str(e)))
+            return False
+
+        self._logger.debug("%s - Snapshot saved, %d entities" % (self._entity_domain, len(entities)))
+        return True
+
+    @staticmethod
+    def _snapshot_entity(entity) -> list:
+        """
+        Get the metric values of an entity as ( group, name, values, timestamps, data type ) tuples
+        """
+        metrics = []
+        for group in (entity.attributes, entity.data, entity.commands):
+            for item in list(group.values()):   # Copy, metrics are added by the MQTT thread
+                # Internal lists are copied, reading the value would clear the updated flag
+                metrics.append((group.birth_prefix, item.name, list(item._value), list(item._timestamp),
+                                item.spb_data_type))
+        return metrics
+
+    def load_snapshot(self, path: str = None) -> int:
+        """
+        Restore the application state from a snapshot file
+
+        Args:
+            path:   File path, if None the path configured by set_snapshot is used
+
+        Returns:    Number of restored entities
+        """
+
+        path = path or self._snapshot_path
+        if path is None:
+            return 0
+
+        try:
+            state = read_snapshot(path)
+        except (OSError, ValueError, zlib.error) as e:
+            self._logger.error("%s - Could not read the snapshot file %s (%s)" % (self._entity_domain, path, str(e)))
+            return 0
+
+        if state is None:
+            return 0
+
+        if state.get("group") != self._spb_group_name:
+            self._logger.warning("%s - Snapshot file %s is from group %s, ignored"
+                                 % (self._entity_domain, path, state.get("group")))
+            return 0
+
+        count = 0
+        for eon_name, eond_name, metrics in state["entities"]:
+
+            if not self.is_shard_owner(eon_name):
+                continue
+
+            if eond_name is None:
+                entity = self._register_edge_node(eon_name)
+            else:
+                self._register_edge_node(eon_name)
+                entity = self._register_edge_device(eon_name, eond_name)
+
+            groups = {g.birth_prefix: g for g in (entity.attributes, entity.data, entity.commands)}
+
+            for prefix, name, values, timestamps, data_type in metrics:
+
+                # Do not overwrite values already received from live messages
+                if name in groups[prefix].get_names():
+                    continue
+
+                value = values if len(values) != 1 else values[0]
+                timestamp = timestamps if len(timestamps) != 1 else timestamps[0]
+
+                groups[prefix].set_value(name=name, value=value, timestamp=timestamp,
+                                         spb_data_type=data_type, skip_callback=True)
+                groups[prefix][name].is_updated = False
+
+                # Known values, not new updates - Not sent to the metric watches and change streams
+                if groups[prefix] is entity.data:
+                    self._spb_store_metric(entity, name, value, timestamp)
+
+            self._index_attributes(entity)
+
+            count += 1
+
+        self._logger.info("%s - Snapshot restored, %d entities" % (self._entity_domain, count))
+
+        return count
+
+    def export_state(self, file, file_format: str = "jsonl", since: int = 0, batch_rows: int = 10000) -> int:
+        """
+        Export the current metric values of all the discovered entities, of all the groups managed by the
+        application. The entities are exported incrementally as flat rows ( group, eon, eond, kind, metric,
+        value, timestamp, datatype, version ), so the memory does not grow with the fleet size.
+
+        Example:
+            version = app.export_state("fleet.jsonl")
+            ...
+            version = app.export_state("changes.jsonl", since=version)   # Only the metrics updated since
+
+        Args:
+            file:       File path, or text file object for the "jsonl" format. Paths are written atomically.
+            file_format: "jsonl", "parquet" or "arrow" ( the columnar formats require the pyarrow package )
+            since:      Only export the metrics updated after this version, 0 for all the metrics
+            batch_rows: Maximum number of rows per record batch, columnar formats
+
+        Returns:    Version cursor of the export, to be used as "since" in the next export
+        """
+
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError("Unknown export format %s, valid formats: %s" % (file_format, ", ".join(EXPORT_FORMATS)))
+
+        version = get_metric_version()  # Updates during the export are exported again in the next export
+        apps = [self] + list(self.groups.values())
+        if since:   # Only the updated entities are visited
+            rows = (row for app in apps for entity in app._changed_entities(since)
+                    for row in iter_entity_rows(entity, app.spb_group_name, since))
+        else:
+            rows = iter_fleet_rows(apps)
+
+        if file_format == "jsonl" and not isinstance(file, str):
+            count = write_jsonl(rows, file)
+
+        else:
+            path_tmp = file + ".tmp"
+            if file_format == "jsonl":
+                with open(path_tmp, "w", encoding="utf-8", buffering=1024 * 1024) as fp:
+                    count = write_jsonl(rows, fp)
+            else:
+                count = write_columnar(rows, path_tmp, file_format, batch_rows)
+            os.replace(path_tmp, file)
+
+        self._logger.debug("%s - Exported %d metric values" % (self._entity_domain, count))
+
+        return version
+
+    def query(self, conditions: list, edge_nodes: bool = False) -> list:
+        """
+        Query the devices, or the edge nodes, of all the discovered edge nodes matching all the conditions. The
+        conditions are resolved with the application indexes, without iterating over the entities.
+
+        Example:
+            app.query([("data.Temperature", ">", 80), ("attributes.site", "==", "A")])
+
+        Args:
+            conditions: list of conditions as ( field, operator, value ), where field is "data.<metric name>" or
+                        "attributes.<attribute name>" and operator is one of ==, !=, <, <=, >, >=
+            edge_nodes: Query the edge nodes ( EoN metrics ) instead of the devices
+
+        Returns:    list of tuples ( entity, field, value ) with the current value of each condition field for
+                    the matching entities, ordered by EoN and EoND names.
+        """
+
+        if not conditions:
+            return []
+
+        if edge_nodes:
+            data_index, attribute_index = self._eon_data_index, self._eon_attribute_index
+        else:
+            data_index, attribute_index = self._data_index, self._attribute_index
+
+        fields = []
+        results = []
+        for field, op, value in conditions:
+            group, _, name = field.partition(".")
+            if group == "data":
+                results.append(data_index.find(name, op, value))
+                fields.append((field, data_index, name))
+            elif group == "attributes":
+                results.append(attribute_index.select(name, op, value))
+                fields.append((field, attribute_index, name))
+            else:
+                raise ValueError("Unknown query field '%s', valid fields: data.<name>, attributes.<name>" % field)
+
+        # Intersect starting with the smallest set
+        results.sort(key=len)
+        devices = set(results[0])
+        for entities in results[1:]:
+            if not devices:
+                break
+            devices &= entities
+
+        devices = sorted(devices, key=lambda d: (d.spb_eon_name, d.spb_eon_device_name or ""))
+
+        return [(device, field, index.get(device, name)) for device in devices for field, index, name in fields]
+
+    def set_callback_dispatcher(self, dispatcher=None):
+        """
+        Execute the application callbacks, and the callbacks of all the discovered entities, through a
+        callback dispatcher ( SpbCallbackDispatcher ) instead of the MQTT network thread. The callbacks of
+        each entity are executed in order.
+
+        Args:
+            dispatcher: SpbCallbackDispatcher, if None the callbacks are executed inline.
+
+        Returns:    Nothing
+        """
+        super().set_callback_dispatcher(dispatcher)
+
+        for group in list(self.groups.values()):
+            group.set_callback_dispatcher(dispatcher)
+
+        for eon in list(self.entities_eon.values()):
+            eon.set_callback_dispatcher(dispatcher)
+            for eond in list(eon.entities_eond.values()):
+                eond.set_callback_dispatcher(dispatcher)
+
+    def get_edge_node(self, eon_name: str) -> EdgeEntity:
+        """
+            Subscribe and get a reference to the virtual EoN entity.
+        Args:
+            eon_name:   EoN Entity Name
+
+        Returns:    Reference for the EoN Entity.
+        """
+        self._subscription_add(eon_name)
+        return self._register_edge_node(eon_name)  # Get reference for the
+
+    def get_edge_device(self, eon_name: str, eond_name: str) -> DeviceEntity:
+        """
+        Get reference for the virtual Edge Node Device (EoND) entity.
 
         Args:
             eon_name:   EoN name
             eond_name:  EoN Device name
         """
+        self._subscription_add(eon_name, eond_name)
+
         # If not created EoN, create it
         self._register_edge_node(eon_name=eon_name)
 
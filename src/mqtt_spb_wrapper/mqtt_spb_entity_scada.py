@@ -8,12 +8,12 @@ from .spb_protobuf import getValueDataType
 from .spb_base import SpbTopic, SpbPayloadParser
 from .mqtt_spb_entity import SpbEntity
 from .mqtt_spb_entity import MqttSpbEntity
-from .mqtt_spb_entity_app import MqttSpbEntityApp
+from .mqtt_spb_entity_app import MqttSpbEntityApp, _SpbAliveStatus
 
 
 class MqttSpbEntityScada(MqttSpbEntityApp):
 
-    class DeviceEntity(SpbEntity):
+    class DeviceEntity(_SpbAliveStatus, SpbEntity):
         """
             Entity Scada Edge Device (EoND) class
 
@@ -49,9 +49,6 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
             self._is_alive = False  # Device is alive ( BIRTH + DATA ) or not ( DEATH )
             self._scada = scada_entity  # Save reference to the scada entity
 
-        def is_alive(self):
-            return self._is_alive
-
         def send_command(self, name, value, force=False):
             return self.send_commands({name: value}, force)
 
@@ -68,7 +65,7 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
             # Send commands via SCADA application
             self._scada.send_commands(commands, self.spb_eon_name, self.spb_eon_device_name)
 
-    class EdgeEntity(SpbEntity):
+    class EdgeEntity(_SpbAliveStatus, SpbEntity):
         """
             Entity Scada Edge Node entity (EoN) class
 
@@ -102,13 +99,11 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
             self.callback_death = callback_death
 
             self.entities_eond: Dict[str, MqttSpbEntityScada.DeviceEntity] = {}
+            self._attribute_index = None  # Application attribute index of the devices ( SpbAttributeIndex )
 
             self._is_alive = False  # Device is alive ( BIRTH + DATA ) or not ( DEATH )
             self._scada = scada_entity  # Save reference to the scada entity
 
-        def is_alive(self):
-            return self._is_alive
-
         def send_command(self, name, value, force=False):
             return self.send_commands({name: value}, force)
 
@@ -126,6 +121,19 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
             self._scada.send_commands(commands, self.spb_eon_name)
 
         def search_device_by_attribute(self, attributes: dict) -> list:
+            """
+            Search the devices of the edge node matching all the attribute values
+
+            Args:
+                attributes: dictionary of attribute name -> value ( compared by its string representation )
+
+            Returns: list of device names
+            """
+
+            # Use the application attribute index, if available. The devices are returned in discovery order.
+            if self._attribute_index is not None and attributes:
+                found = self._attribute_index.search(attributes)
+                return [eond for eond, device in list(self.entities_eond.items()) if device in found]
 
             res = []    # List of devices found
 
@@ -175,15 +183,18 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
         """
 
         # Initialized base class
-        MqttSpbEntity.__init__(
-            self,
+        super().__init__(
             spb_group_name=spb_group_name,
-            spb_eon_name=spb_scada_name,
-            spb_eon_device_name=None,
+            spb_app_name=spb_scada_name,
+            callback_birth=callback_birth,
+            callback_data=callback_data,
+            callback_death=callback_death,
+            callback_new_eon=callback_new_eon,
+            callback_new_eond=callback_new_eond,
             retain_birth=retain_birth,
-            entity_is_scada=True,
             debug=debug,
-            debug_id="MQTT_SPB_SCADA"
+            entity_is_scada=True,
+            debug_id="MQTT_SPB_SCADA",
         )
 
         self.entities_eon: Dict[str, MqttSpbEntityScada.EdgeEntity] = {}
@@ -192,16 +203,6 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
         List of current discovered edge nodes entities (EoN)
         """
 
-        self.callback_birth = callback_birth  # Save callback function references
-        self.callback_data = callback_data
-        self.callback_death = callback_death
-
-        self.callback_new_eon = callback_new_eon
-        self.callback_new_eond = callback_new_eond
-
-        self._spb_initialized = False  # Flag to mark the initialization of spb persistent messages(BIRTH, DEATH)
-        self._spb_initialized_timeout = 0  # Counter to keep initialization timeout event
-
         self._logger.info("New SCADA Application object")
 
     def send_command(self, cmd_name: str, cmd_value, eon_name: str, eond_name: str = None) -> bool:
@@ -274,64 +275,39 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
             return False
 
 
-    def _register_edge_node(self, eon_name) -> EdgeEntity:
+    def _new_group(self, group_name: str):
         """
-        If not discovered, it will create the entity and return a reference
-
-        Args:
-            eon_name:       EoN name
-
-        Returns:    reference to the entity
+        Create the SCADA application entity of a new spB group
         """
+        return MqttSpbEntityScada(
+            spb_group_name=group_name,
+            spb_scada_name=self.spb_eon_name,
+            retain_birth=self._retain_birth,
+            debug=self._debug_enabled,
+        )
 
-        # EDGE NODE - Let's check if the EdgeNode is already discovered, if not create it
-        if eon_name not in self.entities_eon.keys():
-            self._logger.debug("Unknown EoN entity, registering edge node: " + eon_name)
-            self.entities_eon[eon_name] = self.EdgeEntity(
-                spb_group_name=self.spb_group_name,
-                spb_eon_name=eon_name,
-                scada_entity=self,
-                debug=self._debug_enabled
-            )
-
-            # If callback is configured
-            if self.callback_new_eon is not None:
-                self.callback_new_eon(eon_name)
-
-            self._logger.debug("New edge node <%s>" % eon_name)
-
-        return self.entities_eon[eon_name]  # Return EoN
-
-    def _register_edge_device(self, eon_name, eond_name) -> DeviceEntity:
+    def _new_edge_node(self, eon_name) -> EdgeEntity:
         """
-            If not discovered, it will create the entity and return a reference
-
-        Args:
-            eon_name:       EoN name
-            eond_name:      EoND name
-
-        Returns:    reference to the entity
-
+        Create a new virtual EoN entity, linked to the SCADA application to send commands
         """
+        return self.EdgeEntity(
+            spb_group_name=self.spb_group_name,
+            spb_eon_name=eon_name,
+            scada_entity=self,
+            debug=self._debug_enabled
+        )
 
-        # DEVICE ENTITY - Let's check if the Device entity is already discovered, if not create it
-        if eond_name not in self.entities_eon[eon_name].entities_eond.keys():
-
-            self.entities_eon[eon_name].entities_eond[eond_name] = self.DeviceEntity(
-                spb_group_name=self.spb_group_name,
-                spb_eon_name=eon_name,
-                spb_eon_device_name=eond_name,
-                scada_entity=self,
-                debug=self._debug_enabled
-            )
-
-            # If callback is configured
-            if self.callback_new_eond is not None:
-                self.callback_new_eond(eon_name, eond_name)
-
-            self._logger.debug("New device <%s> for edge node <%s>" % (eond_name, eon_name))
-
-        return self.entities_eon[eon_name].entities_eond[eond_name]  # Return EoND
+    def _new_edge_device(self, eon_name, eond_name) -> DeviceEntity:
+        """
+        Create a new virtual EoND entity, linked to the SCADA application to send commands
+        """
+        return self.DeviceEntity(
+            spb_group_name=self.spb_group_name,
+            spb_eon_name=eon_name,
+            spb_eon_device_name=eond_name,
+            scada_entity=self,
+            debug=self._debug_enabled
+        )
 
     def get_edge_node(self, eon_name: str) -> EdgeEntity:
         """
@@ -341,7 +317,7 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
 
         Returns:    Reference for the EoN Entity.
         """
-        return self._register_edge_node(eon_name)  # Get reference for the
+        return super().get_edge_node(eon_name)
 
     def get_edge_device(self, eon_name: str, eond_name: str) -> DeviceEntity:
         """
@@ -351,8 +327,4 @@ class MqttSpbEntityScada(MqttSpbEntityApp):
             eon_name:   EoN name
             eond_name:  EoN Device name
         """
-        # If not created EoN, create it
-        self._register_edge_node(eon_name=eon_name)
-
-        # Create EoND and return reference
-        return self._register_edge_device(eon_name=eon_name,eond_name=eond_name)
+        return super().get_edge_device(eon_name, eond_name)
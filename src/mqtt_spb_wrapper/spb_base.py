@@ -1,5 +1,9 @@
 import logging
 import time
+import functools
+import itertools
+import threading
+from collections import OrderedDict
 from io import TextIOWrapper, BufferedReader
 from typing import Callable, Any
 from datetime import datetime
@@ -11,6 +15,17 @@ from .spb_protobuf import getDdataPayload, getNodeBirthPayload, getDeviceBirthPa
 from .spb_protobuf import addMetric, MetricDataType
 from .spb_protobuf.sparkplug_b import addMetricDataset_from_dict
 
+_metric_versions = itertools.count(1)   # Metric update versions, monotonic for all the metric values
+
+
+def get_metric_version() -> int:
+    """
+    Get a metric version cursor. All the metric values updated after the call have a greater version.
+
+    Returns: version
+    """
+    return next(_metric_versions)
+
 
 class MetricValue:
     """
@@ -39,8 +54,11 @@ class MetricValue:
     ):
         self.name = name
         self.is_updated = True
+        self.version = next(_metric_versions)   # Version of the last update
         self.spb_alias_num = spb_alias_num
+        self._metric_group = None   # MetricGroup of the value, tracking the updated metrics
         self._callback = callback_on_change
+        self._callback_dispatch = None  # If set, callbacks are executed through it ( i.e. callback dispatcher )
 
         # If data provided as list of values ( values + timestamps )
         if isinstance(value, list) and isinstance(timestamp, list) and len(value) == len(timestamp):
@@ -129,10 +147,17 @@ class MetricValue:
 
         # If a callback is configured, execute it and pass the value
         if self._callback is not None:
-            self._callback(self.value)
+            if self._callback_dispatch is not None:
+                self._callback_dispatch(self._callback, self.value, conflate_key=self.name)
+            else:
+                self._callback(self.value)
 
-        # Set updated flag
+        # Set updated flag and version
         self.is_updated = True
+        if self._metric_group is not None:
+            self._metric_group._changed(self)
+        else:
+            self.version = next(_metric_versions)
 
     @property
     def timestamp(self):
@@ -234,6 +259,67 @@ class MetricGroup:
         self._items = {}
         self.seq_number = None
         self.birth_prefix = birth_prefix
+        self._callback_dispatch = None  # If set, metric callbacks are executed through it
+
+        self.version = 0    # Version of the last metric update
+        self._changes = OrderedDict()   # Metric name -> version, ordered by update
+        self._changes_lock = threading.Lock()
+        self._change_log = None     # If set, OrderedDict owner -> version updated with the group updates
+        self._change_owner = None   # Key of the group in the change log ( i.e. entity )
+
+    def _set_change_log(self, change_log: OrderedDict, owner, lock):
+        """
+        Record the group updates in a shared change log, i.e. the entities updated in an application. The
+        lock is shared with the change log, so the versions are assigned and recorded atomically.
+        """
+        self._change_log = change_log
+        self._change_owner = owner
+        self._changes_lock = lock
+
+    def _changed(self, item: MetricValue):
+        """
+        A metric value was updated, assign its new version
+        """
+        with self._changes_lock:
+            item.version = version = next(_metric_versions)
+            self._changes[item.name] = version
+            self._changes.move_to_end(item.name)
+            self.version = version
+
+            if self._change_log is not None:
+                self._change_log[self._change_owner] = version
+                self._change_log.move_to_end(self._change_owner)
+
+    def _track(self, item: MetricValue):
+        """
+        Track the updates of a new metric value
+        """
+        item._metric_group = self
+        self._changed(item)
+
+    def get_changes(self, since: int = 0) -> list:
+        """
+        Get the metrics updated after a version. Only the updated metrics are visited.
+
+        Example:
+            cursor = get_metric_version()
+            ...
+            names = entity.data.get_changes(cursor)
+
+        Args:
+            since: version cursor ( see get_metric_version ), 0 for all the metrics
+
+        Returns: list of metric names, ordered by update
+        """
+        res = []
+        with self._changes_lock:
+            changes = self._changes
+            for name in reversed(changes):
+                if changes[name] <= since:
+                    break
+                res.append(name)
+        res.reverse()
+        return res
 
     def __str__(self):
         return str(self.get_dictionary())
@@ -319,6 +405,8 @@ class MetricGroup:
 
         """
         self._items = {}
+        with self._changes_lock:
+            self._changes.clear()
 
     def count(self) -> int:
         """
@@ -340,6 +428,19 @@ class MetricGroup:
         else:
             return False
 
+    def set_callback_dispatch(self, callback_dispatch: Callable = None):
+        """
+        Set the function used to execute the metric callbacks ( i.e. a callback dispatcher ).
+
+        Args:
+            callback_dispatch: function( callback, value, conflate_key=name ). If None, callbacks are executed inline.
+
+        Returns: Nothing
+        """
+        self._callback_dispatch = callback_dispatch
+        for item in self._items.values():
+            item._callback_dispatch = callback_dispatch
+
     def set_value(self,
                   name: str, value,
                   timestamp=None,
@@ -395,7 +496,9 @@ class MetricGroup:
             spb_data_type=spb_data_type,
             spb_alias_num=spb_alias_num,
         )
+        new_item._callback_dispatch = self._callback_dispatch
         self._items[name] = new_item
+        self._track(new_item)
 
         return True
 
@@ -411,6 +514,8 @@ class MetricGroup:
         """
         if name in self._items.keys():
             self._items.pop(name)
+            with self._changes_lock:
+                self._changes.pop(name, None)
             return True
         else:
             return False
@@ -439,11 +544,15 @@ class MetricGroup:
 
     # Set an item like a dictionary
     def __setitem__(self, name, value: MetricValue):
+        value._callback_dispatch = self._callback_dispatch
         self._items[name] = value
+        self._track(value)
 
     # Delete an item like a dictionary
     def __delitem__(self, name):
         del self._items[name]
+        with self._changes_lock:
+            self._changes.pop(name, None)
 
     # Optionally, allow iteration (e.g., for looping through keys)
     def __iter__(self):
@@ -500,6 +609,9 @@ class SpbEntity:
         else:
             self._entity_name = self._spb_eon_device_name
 
+        self._callback_dispatcher = None    # Callback dispatcher, if None callbacks are executed inline
+        self._metric_update_hook = None     # function( entity, value_group, name, value, timestamp ) on deserialized metrics
+
         self._debug_enabled = debug     # Debug parameters
         self._debug_id = debug_id
         self._update_debug_id()
@@ -532,6 +644,47 @@ class SpbEntity:
         temp['commands'] = self.commands.get_dictionary()
         return temp
 
+    @property
+    def version(self) -> int:
+        """
+        Version of the last metric update of the entity ( see get_metric_version )
+        """
+        return max(self.attributes.version, self.data.version, self.commands.version)
+
+    def get_changes(self, since: int = 0) -> dict:
+        """
+            Get the entity properties and the metrics updated after a version, with the same format as
+            get_dictionary(). Only the updated metrics are visited, the metric updated flags are not modified.
+
+        Example:
+            cursor = get_metric_version()
+            changes = entity.get_changes()
+            ...
+            since, cursor = cursor, get_metric_version()
+            changes = entity.get_changes(since)
+
+        Args:
+            since: version cursor ( see get_metric_version ), 0 for all the metrics
+
+        Returns:    Dictionary containing the main class properties and the updated metrics
+        """
+
+        temp = {'spb_group_name': self._spb_group_name,
+                'spb_eon_name': self._spb_eon_name}
+
+        if self._spb_eon_device_name is not None:
+            temp['spb_eon_device_name'] = self._spb_eon_device_name
+
+        for key, group in (('data', self.data), ('attributes', self.attributes), ('commands', self.commands)):
+            items = []
+            for name in group.get_changes(since):
+                item = group._items.get(name, None)
+                if item is not None:
+                    items.append(item.as_dict())
+            temp[key] = items
+
+        return temp
+
     def is_empty(self):
 
         if self.data.is_empty() and self.attributes.is_empty() and self.commands.is_empty():
@@ -539,6 +692,44 @@ class SpbEntity:
 
         return False
 
+    def set_callback_dispatcher(self, dispatcher=None):
+        """
+            Execute the entity callbacks through a callback dispatcher ( SpbCallbackDispatcher ), instead of
+            the caller thread. The callbacks of the entity are executed in order.
+
+        Args:
+            dispatcher: SpbCallbackDispatcher, if None the callbacks are executed inline.
+
+        Returns:    Nothing
+        """
+        self._callback_dispatcher = dispatcher
+
+        if dispatcher is None:
+            callback_dispatch = None
+        else:
+            callback_dispatch = functools.partial(dispatcher.submit, self._entity_domain)
+
+        self.attributes.set_callback_dispatch(callback_dispatch)
+        self.data.set_callback_dispatch(callback_dispatch)
+        self.commands.set_callback_dispatch(callback_dispatch)
+
+    def _spb_callback(self, callback: Callable, *args, key: str = None, conflate_key: str = None):
+        """
+            Execute a callback, through the callback dispatcher if configured.
+
+        Args:
+            callback: function reference
+            *args: callback arguments
+            key: ordering key for the dispatcher, by default the entity domain
+            conflate_key: key of the callbacks that can be conflated by the dispatcher ( i.e. metric name )
+
+        Returns:    Nothing
+        """
+        if self._callback_dispatcher is None:
+            callback(*args)
+        else:
+            self._callback_dispatcher.submit(key or self._entity_domain, callback, *args, conflate_key=conflate_key)
+
     def _update_debug_id(self):
         """
             Update the console debug logger
@@ -708,6 +899,10 @@ class SpbEntity:
         if metric_value.get("value", None) is None:
             return
 
+        value = metric_value['value']
+        timestamp = metric_value.get('timestamp', None)
+        data_type = metric_value.get('datatype')
+
         # DATASET - DICT / VALUE LIST - Check if multiple values are being send as DataSet or Metric
         if metric_value.get("datatype") == MetricDataType.DataSet:
 
@@ -734,41 +929,33 @@ class SpbEntity:
 
             # LIST VALUES - They should contain the "timestamps" and "values" items, otherwise it is a dictionary
             if "timestamps" in columns_data.keys() and "values" in columns_data.keys():
-                if len(columns_data['timestamps']) == len(columns_data['values']):
-                    # Get the values data type
-                    values_data_type = metric_value['datasetValue']['types'][
-                        metric_value['datasetValue']['columns'].index('values')]
-                    # Add the values
-                    value_group.set_value(
-                        name=metric_value['name'],
-                        value=columns_data["values"],
-                        timestamp=[int(k) for k in columns_data['timestamps']],  # Force as integer
-                        spb_data_type=values_data_type,
-                        skip_callback=skip_callback,  # Dont trigger value update callback ( typically on birth data)
-                    )
+                if len(columns_data['timestamps']) != len(columns_data['values']):
+                    return
+
+                # Get the values data type
+                data_type = metric_value['datasetValue']['types'][
+                    metric_value['datasetValue']['columns'].index('values')]
+                value = columns_data["values"]
+                timestamp = [int(k) for k in columns_data['timestamps']]  # Force as integer
 
             # DICT DataSet - The values are a dictionary/dataset
             else:
-                # Add value to the group
-                value_group.set_value(
-                    name=metric_value['name'],
-                    value=columns_data,
-                    timestamp=metric_value['timestamp'],
-                    spb_data_type=metric_value['datatype'],
-                    skip_callback=skip_callback,  # Dont trigger value update callback ( typically on birth data)
-                )  # update field
-
-        # DEFAULT - Add it and keep the original data type
-        else:
+                value = columns_data
+
+        # Add value to the group ( DEFAULT - keep the original data type )
+        value_group.set_value(
+            name=metric_value['name'],
+            value=value,
+            timestamp=timestamp,
+            spb_data_type=data_type,
+            skip_callback=skip_callback,  # Dont trigger value update callback ( typically on birth data)
+        )  # update field
 
-            # Add value to the group
-            value_group.set_value(
-                name=metric_value['name'],
-                value=metric_value['value'],
-                timestamp=metric_value['timestamp'],
-                spb_data_type=metric_value['datatype'],
-                skip_callback=skip_callback,  # Dont trigger value update callback ( typically on birth data)
-            )  # update field
+        # Notify the metric update ( 64 bits timestamps are decoded as strings )
+        if self._metric_update_hook is not None:
+            if isinstance(timestamp, str):
+                timestamp = int(timestamp)
+            self._metric_update_hook(self, value_group, metric_value['name'], value, timestamp)
 
     def serialize_payload_birth(self):
         """
@@ -815,49 +1002,38 @@ class SpbEntity:
         return payload_bytes
 
     def deserialize_payload_birth(self, data_bytes):
+        """
+            De-serialize a BIRTH message and update the entity metric values
+
+        Args:
+            data_bytes: payload bytes, or payload dictionary already parsed by SpbPayloadParser
 
-        payload = SpbPayloadParser(data_bytes).payload
+        Returns: payload dictionary
+        """
+
+        if isinstance(data_bytes, dict):
+            payload = data_bytes
+        else:
+            payload = SpbPayloadParser(data_bytes).payload
 
         if payload is not None:
 
             # Iterate over the metrics to update the data fields
             for field in payload.get('metrics', []):
 
-                if field['name'].startswith(self.attributes.birth_prefix):
-
-                    # remove the prefix
-                    field['name'] = field['name'].replace(self.attributes.birth_prefix + "/", '')
-
-                    # Insert the element in the metric group
-                    self._deserialize_payload_metric(
-                        value_group=self.attributes,
-                        metric_value=field,
-                        skip_callback=True,     # Dont trigger value update callback on birth data.
-                    )
-
-                elif field['name'].startswith(self.commands.birth_prefix):
-
-                    # remove the prefix
-                    field['name'] = field['name'].replace(self.commands.birth_prefix + "/", '')
-
-                    # Insert the element in the metric group
-                    self._deserialize_payload_metric(
-                        value_group=self.commands,
-                        metric_value=field,
-                        skip_callback=True,  # Dont trigger value update callback on birth data.
-                    )
-
-                elif field['name'].startswith(self.data.birth_prefix):
-
-                    # remove the prefix
-                    field['name'] = field['name'].replace(self.data.birth_prefix + "/", '')
+                # Select the metric group from the name prefix
+                for value_group in (self.attributes, self.commands, self.data):
+                    if field['name'].startswith(value_group.birth_prefix):
+                        break
+                else:
+                    continue
 
-                    # Insert the element in the metric group
-                    self._deserialize_payload_metric(
-                        value_group=self.data,
-                        metric_value=field,
-                        skip_callback=True,  # Dont trigger value update callback on birth data.
-                    )
+                # Insert the element in the metric group, with the prefix removed ( original payload not modified )
+                self._deserialize_payload_metric(
+                    value_group=value_group,
+                    metric_value=dict(field, name=field['name'].replace(value_group.birth_prefix + "/", '')),
+                    skip_callback=True,  # Dont trigger value update callback on birth data.
+                )
 
         return payload
 
@@ -882,8 +1058,19 @@ class SpbEntity:
         return payload_bytes
 
     def deserialize_payload_data(self, data_bytes):
+        """
+            De-serialize a DATA message and update the entity data values
+
+        Args:
+            data_bytes: payload bytes, or payload dictionary already parsed by SpbPayloadParser
+
+        Returns: payload dictionary, None if not valid
+        """
 
-        payload = SpbPayloadParser(data_bytes).payload
+        if isinstance(data_bytes, dict):
+            payload = data_bytes
+        else:
+            payload = SpbPayloadParser(data_bytes).payload
 
         if payload:
 
@@ -921,8 +1108,19 @@ class SpbEntity:
         return payload_bytes
 
     def deserialize_payload_cmd(self, data_bytes):
+        """
+            De-serialize a CMD message and update the entity command values
+
+        Args:
+            data_bytes: payload bytes, or payload dictionary already parsed by SpbPayloadParser
 
-        payload = SpbPayloadParser(data_bytes).payload
+        Returns: payload dictionary
+        """
+
+        if isinstance(data_bytes, dict):
+            payload = data_bytes
+        else:
+            payload = SpbPayloadParser(data_bytes).payload
 
         if payload is not None:
 
@@ -0,0 +1,383 @@
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterator, List, Optional
+
+import paho.mqtt.client as mqtt
+
+CAPTURE_MAGIC = b"SPBCAP01"
+INDEX_MAGIC = b"SPBIDX01"
+
+_BLOCK = struct.Struct("<Bq")       # kind, block timestamp ( us )
+_TOPIC = struct.Struct("<BIH")      # kind, topic id, topic length, followed by the topic
+_MESSAGE = struct.Struct("<BBIqI")  # kind, flags, topic id, timestamp ( us ), payload length, followed by the payload
+_INDEX = struct.Struct("<qQ")       # block timestamp ( us ), block file offset
+
+_KIND_BLOCK = 0
+_KIND_TOPIC = 1
+_KIND_MESSAGE = 2
+
+_FLAG_RETAIN = 0x01
+
+
+class SpbTrafficRecorder:
+    """
+    Traffic recorder class
+
+    Append the raw received MQTT messages ( topic, payload bytes, receive timestamp ) to a binary capture file,
+    to be replayed later by SpbTrafficPlayer.
+
+    The file is a sequence of records, grouped in blocks started every block interval or block size. The topics
+    are interned per block, so each message only stores a topic id, and each block can be decoded on its own.
+    The start of each block is registered in a sparse time index ( "<path>.idx" ), used to seek by time.
+
+    Args:
+        path: capture file path, the messages are appended if it exists
+        block_interval: maximum duration of a block in seconds
+        block_size: maximum size of a block in bytes
+    """
+
+    def __init__(self, path: str, block_interval: float = 1.0, block_size: int = 1024 * 1024):
+
+        self.path = path
+        self.block_interval = int(block_interval * 1000000)
+        self.block_size = block_size
+
+        self.count = 0  # Number of messages recorded
+
+        self._file = open(path, "ab", buffering=1024 * 1024)
+        if self._file.tell() == 0:
+            self._file.write(CAPTURE_MAGIC)
+        self._offset = self._file.tell()
+
+        self._index = open(path + ".idx", "ab")
+        if self._index.tell() == 0:
+            self._index.write(INDEX_MAGIC)
+
+        self._topics = {}   # Topic -> id, of the current block
+        self._block_ts = None
+        self._block_offset = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, topic: str, payload: bytes, timestamp: float = None, retain: bool = False):
+        """
+        Append a message to the capture
+
+        Args:
+            topic: MQTT topic
+            payload: message payload
+            timestamp: receive timestamp in milliseconds, None for the current time
+            retain: MQTT retain flag of the message
+
+        Returns: Nothing
+        """
+        ts = time.time_ns() // 1000 if timestamp is None else int(timestamp * 1000)
+
+        with self._lock:
+
+            if self._file is None:  # Closed
+                return
+
+            write = self._file.write
+
+            # Start a new block
+            if self._block_ts is None or ts - self._block_ts >= self.block_interval \
+                    or self._offset - self._block_offset >= self.block_size:
+                self._block_ts = ts
+                self._block_offset = self._offset
+                self._topics = {}
+                write(_BLOCK.pack(_KIND_BLOCK, ts))
+                self._offset += _BLOCK.size
+                self._index.write(_INDEX.pack(ts, self._block_offset))
+
+            topic_id = self._topics.get(topic, None)
+            if topic_id is None:
+                topic_id = self._topics[topic] = len(self._topics)
+                topic_bytes = topic.encode("utf-8")
+                write(_TOPIC.pack(_KIND_TOPIC, topic_id, len(topic_bytes)))
+                write(topic_bytes)
+                self._offset += _TOPIC.size + len(topic_bytes)
+
+            write(_MESSAGE.pack(_KIND_MESSAGE, _FLAG_RETAIN if retain else 0, topic_id, ts, len(payload)))
+            write(payload)
+            self._offset += _MESSAGE.size + len(payload)
+            self.count += 1
+
+    def on_message(self, msg):
+        """
+        Record a received paho MQTT message
+
+        Args:
+            msg: MQTTMessage
+
+        Returns: Nothing
+        """
+        self.record(msg.topic, msg.payload, retain=bool(msg.retain))
+
+    def flush(self):
+        """
+        Write the buffered records to the files
+
+        Returns: Nothing
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index.flush()
+
+    def close(self):
+        """
+        Flush and close the capture files
+
+        Returns: Nothing
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+
+class SpbTrafficPlayer:
+    """
+    Traffic player class
+
+    Replay a capture file written by SpbTrafficRecorder into an application entity ( i.e. MqttSpbEntityApp ),
+    as if the messages were received from the broker, or publish them to a broker with a paho MQTT client. The
+    messages are replayed at the recorded pace, N times faster, or as fast as possible.
+
+    The file is memory-mapped, and the time index is used to seek to the block of a start time, so only the
+    replayed part of the file is read. If the index is missing or incomplete ( i.e. the recorder was not
+    closed ), the missing blocks are found by scanning the end of the file.
+
+    Args:
+        path: capture file path
+    """
+
+    def __init__(self, path: str):
+
+        self.path = path
+
+        self._file = open(path, "rb")
+        self._map = None
+        if os.fstat(self._file.fileno()).st_size < len(CAPTURE_MAGIC):
+            self.close()
+            raise ValueError("File %s is not a spB capture file" % path)
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError("File %s is not a spB capture file" % path)
+
+        self._stop = threading.Event()
+
+        self._logger = logging.getLogger("SPB_PLAYER")
+
+        # Time index - Block timestamps and offsets
+        self._index_ts: List[int] = []
+        self._index_offsets: List[int] = []
+        self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _load_index(self):
+
+        size = len(self._map)
+
+        try:
+            with open(self.path + ".idx", "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+
+        if data[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+            for ts, offset in _INDEX.iter_unpack(data[len(INDEX_MAGIC):
+                                                      len(data) - (len(data) - len(INDEX_MAGIC)) % _INDEX.size]):
+                if offset + _BLOCK.size > size:     # Block not written to the capture file
+                    break
+                self._index_ts.append(ts)
+                self._index_offsets.append(offset)
+
+        # Blocks not in the index, scan the file from the last indexed block
+        offset = self._index_offsets[-1] if self._index_offsets else len(CAPTURE_MAGIC)
+        for kind, position, ts in self._scan(offset):
+            if kind == _KIND_BLOCK and (not self._index_offsets or position > self._index_offsets[-1]):
+                self._index_ts.append(ts)
+                self._index_offsets.append(position)
+
+    def _scan(self, offset: int) -> Iterator[tuple]:
+        """
+        Iterate the records from an offset, as ( kind, offset, timestamp ), without decoding them
+        """
+        data = self._map
+        size = len(data)
+
+        while offset < size:
+            kind = data[offset]
+            if kind == _KIND_BLOCK:
+                if offset + _BLOCK.size > size:
+                    return
+                yield kind, offset, _BLOCK.unpack_from(data, offset)[1]
+                offset += _BLOCK.size
+            elif kind == _KIND_TOPIC:
+                if offset + _TOPIC.size > size:
+                    return
+                offset += _TOPIC.size + _TOPIC.unpack_from(data, offset)[2]
+            elif kind == _KIND_MESSAGE:
+                if offset + _MESSAGE.size > size:
+                    return
+                offset += _MESSAGE.size + _MESSAGE.unpack_from(data, offset)[4]
+            else:
+                self._logger.error("Invalid record at offset %d of %s, capture truncated" % (offset, self.path))
+                return
+
+    @property
+    def start_time(self) -> Optional[float]:
+        """ Timestamp of the first block in milliseconds, None if the capture is empty """
+        return self._index_ts[0] / 1000 if self._index_ts else None
+
+    def messages(self, start: float = None, end: float = None) -> Iterator[tuple]:
+        """
+        Iterate the recorded messages of a time range
+
+        Args:
+            start: start timestamp in milliseconds ( included ), None from the first message
+            end: end timestamp in milliseconds ( excluded ), None to the last message
+
+        Returns: generator of ( timestamp, topic, payload, retain ), timestamps in milliseconds
+        """
+        if not self._index_offsets:
+            return
+
+        start_us = None if start is None else int(start * 1000)
+        end_us = None if end is None else int(end * 1000)
+
+        # Seek to the last block started before the start time
+        block = 0
+        if start_us is not None:
+            block = max(bisect.bisect_right(self._index_ts, start_us) - 1, 0)
+        offset = self._index_offsets[block]
+
+        data = self._map
+        size = len(data)
+        topics = {}
+
+        while offset < size:
+            kind = data[offset]
+
+            if kind == _KIND_MESSAGE:
+                if offset + _MESSAGE.size > size:
+                    return
+                _, flags, topic_id, ts, length = _MESSAGE.unpack_from(data, offset)
+                offset += _MESSAGE.size
+                if offset + length > size:
+                    return
+                if end_us is not None and ts >= end_us:
+                    return
+                if start_us is None or ts >= start_us:
+                    yield ts / 1000, topics[topic_id], data[offset:offset + length], bool(flags & _FLAG_RETAIN)
+                offset += length
+
+            elif kind == _KIND_TOPIC:
+                if offset + _TOPIC.size > size:
+                    return
+                _, topic_id, length = _TOPIC.unpack_from(data, offset)
+                offset += _TOPIC.size
+                topics[topic_id] = data[offset:offset + length].decode("utf-8")
+                offset += length
+
+            elif kind == _KIND_BLOCK:
+                topics = {}
+                offset += _BLOCK.size
+
+            else:
+                self._logger.error("Invalid record at offset %d of %s, capture truncated" % (offset, self.path))
+                return
+
+    def play(self, target, speed: float = 1.0, start: float = None, end: float = None, qos: int = 0) -> int:
+        """
+        Replay the recorded messages of a time range
+
+        Example:
+            with SpbTrafficPlayer("line1.spbcap") as player:
+                player.play(app, speed=0)   # As fast as possible
+
+        Args:
+            target: entity receiving the messages ( i.e. MqttSpbEntityApp ), or paho MQTT client to publish them
+            speed: replay speed factor ( 1 for the recorded pace, 10 for 10x ), 0 as fast as possible
+            start: start timestamp in milliseconds, None from the first message
+            end: end timestamp in milliseconds, None to the last message
+            qos: QoS of the published messages, paho MQTT client target
+
+        Returns: number of replayed messages
+        """
+
+        if hasattr(target, "_mqtt_on_message"):
+            def deliver(topic, payload, retain):
+                msg = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+                msg.payload = payload
+                msg.retain = retain
+                target._mqtt_on_message(None, None, msg)
+        else:
+            def deliver(topic, payload, retain):
+                target.publish(topic, payload, qos=qos, retain=retain)
+
+        self._stop.clear()
+        count = 0
+        ts_first = None
+        time_start = time.monotonic()
+
+        for ts, topic, payload, retain in self.messages(start, end):
+
+            if self._stop.is_set():
+                break
+
+            # Pace the messages with the recorded timestamps
+            if speed:
+                if ts_first is None:
+                    ts_first = ts
+                delay = (ts - ts_first) / 1000 / speed - (time.monotonic() - time_start)
+                if delay > 0 and self._stop.wait(delay):
+                    break
+
+            deliver(topic, payload, retain)
+            count += 1
+
+        return count
+
+    def stop(self):
+        """
+        Stop a replay in progress, from another thread
+
+        Returns: Nothing
+        """
+        self._stop.set()
+
+    def close(self):
+        """
+        Close the capture file
+
+        Returns: Nothing
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
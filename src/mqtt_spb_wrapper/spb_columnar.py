@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from .spb_stream import SpbChangeStream
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # Optional dependency, only required by the columnar sink
+    pa = None
+    pq = None
+
+
+class SpbColumnarSink:
+    """
+    Columnar file sink class
+
+    Write the metric updates of a change stream ( SpbChangeStream ) into rolling Parquet or Arrow IPC files,
+    from a background thread. Each batch of the stream is converted into a columnar record batch, with the
+    group, EoN, EoND and metric names dictionary-encoded. The numeric and boolean values are stored in the
+    "value" column, and the rest of values in the "value_str" column ( JSON for DataSets ).
+
+    A new file is started when the current one reaches the maximum number of rows, the maximum size or the
+    maximum duration. The files are written with a ".tmp" suffix and renamed once closed, so the readers
+    never see partial files.
+
+    Requires the pyarrow package ( optional dependency ).
+
+    Args:
+        directory: output directory
+        file_format: "parquet" or "arrow" ( Arrow IPC stream )
+        prefix: file name prefix
+        max_rows: maximum number of rows per file, 0 for unlimited
+        max_bytes: maximum file size in bytes, 0 for unlimited
+        max_age: maximum duration of a file in seconds, 0 for unlimited
+        compression: Parquet compression codec
+        debug: Enable console debug messages
+    """
+
+    FORMATS = {"parquet": ".parquet", "arrow": ".arrows"}
+
+    def __init__(self, directory: str, file_format: str = "parquet", prefix: str = "spb",
+                 max_rows: int = 1000000, max_bytes: int = 0, max_age: float = 3600.0,
+                 compression: str = "snappy", debug: bool = False):
+
+        if pa is None:
+            raise ImportError("The columnar sink requires the pyarrow package ( pip install pyarrow )")
+
+        if file_format not in self.FORMATS:
+            raise ValueError("Unknown file format %s, valid formats: %s" % (file_format, ", ".join(self.FORMATS)))
+
+        self.directory = directory
+        self.file_format = file_format
+        self.prefix = prefix
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+
+        self.files = []     # Closed files
+
+        names = pa.dictionary(pa.int32(), pa.string())
+        self.schema = pa.schema([
+            ("group", names),
+            ("eon", names),
+            ("eond", names),
+            ("metric", names),
+            ("timestamp", pa.timestamp("ms")),
+            ("value", pa.float64()),
+            ("value_str", pa.string()),
+            ("seq", pa.int32()),
+        ])
+
+        self._stats = {"rows": 0, "batches": 0, "files": 0, "errors": 0}
+
+        self._writer = None     # Current file writer
+        self._file = None       # Current file ( OSFile, Arrow IPC only )
+        self._path = None       # Current file path
+        self._rows = 0          # Rows in the current file
+        self._opened = 0        # Time when the current file was opened
+        self._counter = 0
+
+        self._thread = None
+        self._stream = None
+        self._consumed = 0
+        self._idle = threading.Condition()
+
+        self._logger = logging.getLogger("SPB_COLUMNAR")
+        self._logger.setLevel(logging.DEBUG if debug else logging.ERROR)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, stream: SpbChangeStream):
+        """
+        Start the writer thread, consuming the records of a change stream until the stream is closed
+
+        Args:
+            stream: change stream
+
+        Returns: Nothing
+        """
+        if self._thread is not None:
+            return
+        self._stream = stream
+        self._thread = threading.Thread(target=self._worker, args=(stream,), name="spb-columnar", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Close the stream and stop the writer thread, once the queued records are written. The current file
+        is closed.
+
+        Returns: Nothing
+        """
+        if self._thread is None:
+            return
+        self._stream.close()
+        self._thread.join()
+        self._thread = None
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until the queued records are written ( the current file is not closed )
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait forever
+
+        Returns: True if all the records are written
+        """
+        stream = self._stream
+        if stream is None:
+            return True
+
+        target = stream.count
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._consumed + stream.dropped < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if (remaining is not None and remaining <= 0) or self._thread is None:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def get_stats(self) -> dict:
+        """
+        Get the writer statistics
+
+        Returns: dictionary with the number of rows, batches and files written, and errors
+        """
+        return dict(self._stats)
+
+    def _worker(self, stream: SpbChangeStream):
+
+        while True:
+            batch = stream.get_batch(timeout=0.5)
+
+            if batch:
+                try:
+                    self._write(self._to_record_batch(batch))
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    self._logger.error("Error writing columnar batch (%s)" % str(e))
+                finally:
+                    with self._idle:
+                        self._consumed += len(batch)
+                        self._idle.notify_all()
+
+            elif stream.is_closed() and not len(stream):
+                break
+
+            # Roll the file by age, also when no records are received
+            if self._writer is not None and self.max_age and time.time() - self._opened >= self.max_age:
+                self._roll_file()
+
+        self._roll_file()
+
+    def _roll_file(self):
+        """
+        Close the current file, the errors are logged and counted so the worker keeps running
+        """
+        try:
+            self._close_file()
+        except Exception as e:
+            self._stats["errors"] += 1
+            self._logger.error("Error closing columnar file %s (%s)" % (self._path, str(e)))
+
+    def _to_record_batch(self, batch: list):
+
+        groups, eons, eonds, metrics, timestamps, values, values_str, seqs = [], [], [], [], [], [], [], []
+        ts_now = int(time.time() * 1000)
+
+        for group, eon, eond, metric, value, timestamp, seq in batch:
+
+            # Value lists are received with the timestamps of each value
+            if isinstance(value, list) and isinstance(timestamp, list):
+                points = zip(timestamp, value)
+            else:
+                points = ((timestamp if timestamp is not None else ts_now, value),)
+
+            for ts, v in points:
+                groups.append(group)
+                eons.append(eon)
+                eonds.append(eond)
+                metrics.append(metric)
+                timestamps.append(int(ts))
+                seqs.append(seq)
+                if isinstance(v, (int, float)):     # Numeric and boolean values
+                    values.append(float(v))
+                    values_str.append(None)
+                else:
+                    values.append(None)
+                    values_str.append(v if isinstance(v, str) or v is None else json.dumps(v, default=str))
+
+        return pa.RecordBatch.from_arrays([
+            pa.array(groups, pa.string()).dictionary_encode(),
+            pa.array(eons, pa.string()).dictionary_encode(),
+            pa.array(eonds, pa.string()).dictionary_encode(),
+            pa.array(metrics, pa.string()).dictionary_encode(),
+            pa.array(timestamps, pa.timestamp("ms")),
+            pa.array(values, pa.float64()),
+            pa.array(values_str, pa.string()),
+            pa.array(seqs, pa.int32()),
+        ], schema=self.schema)
+
+    def _open_file(self):
+
+        self._counter += 1
+        name = "%s-%s-%04d%s" % (self.prefix, time.strftime("%Y%m%dT%H%M%S", time.gmtime()), self._counter,
+                                 self.FORMATS[self.file_format])
+        self._path = os.path.join(self.directory, name)
+
+        if self.file_format == "parquet":
+            self._writer = pq.ParquetWriter(self._path + ".tmp", self.schema, compression=self.compression)
+        else:
+            self._file = pa.OSFile(self._path + ".tmp", "wb")
+            self._writer = pa.ipc.new_stream(self._file, self.schema)
+
+        self._rows = 0
+        self._opened = time.time()
+
+    def _close_file(self):
+
+        if self._writer is None:
+            return
+
+        # The writer is discarded even if closing it fails, a new file is opened for the next records
+        writer, file = self._writer, self._file
+        self._writer = None
+        self._file = None
+        try:
+            writer.close()
+        finally:
+            if file is not None:
+                file.close()
+
+        os.replace(self._path + ".tmp", self._path)
+        self.files.append(self._path)
+        self._stats["files"] += 1
+        self._logger.debug("Closed file %s, %d rows" % (self._path, self._rows))
+
+    def _write(self, record_batch):
+
+        if self._writer is None:
+            self._open_file()
+
+        if self.file_format == "parquet":
+            self._writer.write_table(pa.Table.from_batches([record_batch]))
+        else:
+            self._writer.write_batch(record_batch)
+
+        self._rows += record_batch.num_rows
+        self._stats["rows"] += record_batch.num_rows
+        self._stats["batches"] += 1
+
+        # Roll the file by rows or size
+        if (self.max_rows and self._rows >= self.max_rows) or \
+                (self.max_bytes and os.path.getsize(self._path + ".tmp") >= self.max_bytes):
+            self._close_file()
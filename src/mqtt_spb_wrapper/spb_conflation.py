@@ -0,0 +1,126 @@
+import threading
+from collections import deque
+
+
+class SpbConflationQueue:
+    """
+    Last-value conflation queue class
+
+    Queue of decoded spB messages pending to be processed, grouped by edge node (EoN). While the messages of
+    an edge node are pending, a new DATA message of the same EoN or EoND is merged into the pending one, so
+    only the newest value of each metric survives until the consumer gets it. BIRTH, DEATH and other message
+    types are never merged, and the order of the messages of each edge node is preserved.
+
+    The memory used is limited by the number of entities and metrics, not by the message rate.
+    """
+
+    def __init__(self):
+
+        self._pending = {}      # Pending messages per key, key -> list of [topic, payload, msg_ts_rx]
+        self._last_data = {}    # Last pending DATA message of each topic per key, key -> { topic: message }
+        self._ready = deque()   # Keys with pending messages, in arrival order
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.messages = 0   # Number of received messages
+        self.conflated = 0  # Number of metric values overwritten by newer values
+
+    def put(self, key: str, topic, payload: dict, msg_ts_rx: int):
+        """
+        Add a decoded message to the queue
+
+        Args:
+            key: conflation group key ( EoN name )
+            topic: SpbTopic of the message
+            payload: decoded payload dictionary
+            msg_ts_rx: timestamp when the message was received, in milliseconds
+
+        Returns: Nothing
+        """
+
+        with self._cond:
+
+            self.messages += 1
+
+            events = self._pending.get(key, None)
+            if events is None:
+                events = self._pending[key] = []
+                self._last_data[key] = {}
+                self._ready.append(key)
+
+            last_data = self._last_data[key]
+
+            if topic.message_type.endswith("DATA"):
+                event = last_data.get(topic.topic, None)
+
+                # Merge with the pending DATA message of the same topic
+                if event is not None:
+                    event[1] = self._merge_data(event[1], payload)
+                    event[2] = msg_ts_rx
+                    return
+
+                event = [topic, payload, msg_ts_rx]
+                last_data[topic.topic] = event
+                events.append(event)
+
+            else:
+                # BIRTH / DEATH - previous DATA messages can not be merged with the following ones
+                last_data.clear()
+                events.append([topic, payload, msg_ts_rx])
+
+            self._cond.notify()
+
+    def get(self, timeout: float = None):
+        """
+        Get all the pending messages of the next key with pending messages.
+
+        Args:
+            timeout: maximum time to wait in seconds, None to wait until there are messages or the queue is closed
+
+        Returns: list of messages as (topic, payload, msg_ts_rx), None if timeout or closed
+        """
+
+        with self._cond:
+            if not self._ready and not self._closed:
+                self._cond.wait(timeout)
+
+            if not self._ready:
+                return None
+
+            key = self._ready.popleft()
+            self._last_data.pop(key, None)
+            return [tuple(event) for event in self._pending.pop(key)]
+
+    def pending(self) -> int:
+        """
+        Number of pending messages
+        """
+        with self._cond:
+            return sum(len(events) for events in self._pending.values())
+
+    def close(self):
+        """
+        Close the queue, waking up the consumers once the pending messages are consumed.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _merge_data(self, payload_old: dict, payload_new: dict) -> dict:
+        """
+        Merge two DATA payloads, keeping the newest value of each metric.
+        """
+
+        metrics = {}
+        for metric in payload_old.get("metrics", []):
+            metrics[metric.get("name", metric.get("alias"))] = metric
+
+        for metric in payload_new.get("metrics", []):
+            name = metric.get("name", metric.get("alias"))
+            if name in metrics:
+                self.conflated += 1
+            metrics[name] = metric
+
+        payload = dict(payload_new)
+        payload["metrics"] = list(metrics.values())
+        return payload
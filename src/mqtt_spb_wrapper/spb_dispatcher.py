@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+
+class SpbCallbackDispatcher:
+    """
+    Callback dispatcher class
+
+    Class used to execute the entity callbacks ( on_message, on_command, callback_birth, callback_data,
+    callback_death, metric callback_on_change ... ) in a pool of worker threads, instead of the MQTT network
+    thread. A slow callback will only delay the callbacks of its own worker, never the MQTT communication.
+
+    The callbacks of the same key ( entity ) are always executed by the same worker, so they are executed
+    in the same order they were submitted.
+
+    Overflow policies, when the worker queue is full:
+        - "block":          Wait until there is space in the queue ( the MQTT thread is blocked ). Callbacks
+                            submitted by a callback of the same worker are executed inline instead, the worker
+                            can not wait for itself.
+        - "drop-oldest":    Discard the oldest pending callback of the queue.
+        - "drop-newest":    Discard the new callback.
+        - "conflate":       Discard the pending callback of the same entity, function and conflate key ( i.e.
+                            metric value callbacks of the same metric ), and queue the new callback at the end,
+                            keeping the order of the entity callbacks. Only the callbacks submitted with a
+                            conflate key are conflated. If there is no pending callback to replace, the oldest
+                            pending callback is discarded.
+
+    Args:
+        workers: Number of worker threads
+        max_queue: Maximum number of pending callbacks per worker
+        overflow: Overflow policy ( block, drop-oldest, drop-newest, conflate )
+        debug: Enable console debug messages
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop-oldest", "drop-newest", "conflate")
+
+    class _Lane:
+        """
+        Worker queue
+        """
+        def __init__(self):
+            self.items = deque()    # Pending callbacks, items as [fn, args, ts_submit, conflate_key]
+            self.conflate = {}      # Pending callbacks by conflate key
+            self.cond = threading.Condition()
+            self.thread = None
+
+    def __init__(self, workers: int = 1, max_queue: int = 1000, overflow: str = "block", debug: bool = False):
+
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy '%s', valid values: %s" % (overflow, self.OVERFLOW_POLICIES))
+
+        if workers < 1 or max_queue < 1:
+            raise ValueError("Number of workers and queue size must be greater than 0")
+
+        self.workers = workers
+        self.max_queue = max_queue
+        self.overflow = overflow
+
+        self._lanes = [SpbCallbackDispatcher._Lane() for _ in range(workers)]
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+
+        self._logger = logging.getLogger("SPB_DISPATCHER")
+        self._logger.setLevel(logging.DEBUG if debug else logging.ERROR)
+
+    def start(self):
+        """
+        Start the worker threads
+
+        Returns: Nothing
+        """
+        if self._running:
+            return
+
+        self._running = True
+        for idx, lane in enumerate(self._lanes):
+            lane.thread = threading.Thread(target=self._worker, args=(lane,),
+                                           name="spb-dispatcher-%d" % idx, daemon=True)
+            lane.thread.start()
+
+    def stop(self, drain: bool = True):
+        """
+        Stop the worker threads
+
+        Args:
+            drain: If True, the pending callbacks are executed before stopping, otherwise they are discarded.
+
+        Returns: Nothing
+        """
+        if not self._running:
+            return
+
+        for lane in self._lanes:
+            with lane.cond:
+                if not drain:
+                    lane.items.clear()
+                    lane.conflate.clear()
+                self._running = False
+                lane.cond.notify_all()
+
+        for lane in self._lanes:
+            lane.thread.join()
+            lane.thread = None
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def submit(self, key: str, fn: Callable, *args, conflate_key=None) -> bool:
+        """
+        Submit a callback to be executed by the workers.
+
+        Args:
+            key: Ordering key ( entity domain ), callbacks of the same key are executed in order.
+            fn: Callback function
+            *args: Callback arguments
+            conflate_key: Optional key to identify the callbacks that can be conflated ( i.e. metric name )
+
+        Returns: True if the callback was queued, False if it was discarded
+        """
+
+        # If not running, execute the callback in the caller thread.
+        if not self._running:
+            fn(*args)
+            return True
+
+        lane = self._lanes[hash(key) % self.workers]
+        ckey = (key, fn, conflate_key) if conflate_key is not None and self.overflow == "conflate" else None
+
+        inline = False
+
+        with lane.cond:
+
+            # Queue is full, apply the overflow policy
+            if len(lane.items) >= self.max_queue:
+
+                if self.overflow == "block":
+                    if threading.current_thread() is lane.thread:
+                        inline = True   # Submitted by a callback of the lane worker, it can not wait for itself
+                    else:
+                        while len(lane.items) >= self.max_queue and self._running:
+                            lane.cond.wait()
+
+                elif self.overflow == "drop-newest":
+                    self._stats_add("dropped")
+                    return False
+
+                else:   # drop-oldest, conflate
+                    old = lane.conflate.pop(ckey, None) if ckey is not None else None
+                    if old is not None:     # Replaced by the new callback, queued at the end
+                        lane.items.remove(old)
+                        self._stats_add("conflated")
+                    else:
+                        old = lane.items.popleft()
+                        if old[3] is not None:
+                            lane.conflate.pop(old[3], None)
+                        self._stats_add("dropped")
+
+            if not inline:
+
+                if not self._running:   # Stopped, nobody drains the lane
+                    self._stats_add("dropped")
+                    return False
+
+                item = [fn, args, time.monotonic(), ckey]
+                lane.items.append(item)
+                if ckey is not None:
+                    lane.conflate[ckey] = item
+
+                self._stats_add("submitted")
+                with self._stats_lock:
+                    depth = self.queue_depth()
+                    if depth > self._stats["queue_depth_max"]:
+                        self._stats["queue_depth_max"] = depth
+
+                lane.cond.notify_all()
+                return True
+
+        self._stats_add("submitted")
+        fn(*args)   # Executed inline, in the worker thread
+        return True
+
+    def queue_depth(self) -> int:
+        """
+        Current number of pending callbacks
+
+        Returns: number of callbacks
+        """
+        return sum(len(lane.items) for lane in self._lanes)
+
+    def get_stats(self) -> dict:
+        """
+        Get the dispatcher statistics ( queue depth and callback latency in seconds )
+
+        Returns: dictionary
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        executed = stats["executed"]
+        stats["queue_depth"] = self.queue_depth()
+        stats["latency_avg"] = stats.pop("_latency_sum") / executed if executed else 0.0
+        stats["exec_time_avg"] = stats.pop("_exec_time_sum") / executed if executed else 0.0
+        return stats
+
+    def reset_stats(self):
+        """
+        Reset the dispatcher statistics
+
+        Returns: Nothing
+        """
+        with self._stats_lock:
+            self._stats = {
+                "submitted": 0,
+                "executed": 0,
+                "dropped": 0,
+                "conflated": 0,
+                "errors": 0,
+                "queue_depth_max": 0,
+                "latency_max": 0.0,
+                "exec_time_max": 0.0,
+                "_latency_sum": 0.0,
+                "_exec_time_sum": 0.0,
+            }
+
+    def _stats_add(self, name, value=1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _worker(self, lane: _Lane):
+
+        while True:
+
+            with lane.cond:
+                while not lane.items and self._running:
+                    lane.cond.wait()
+
+                if not lane.items:  # Stopped and no pending callbacks
+                    return
+
+                fn, args, ts_submit, ckey = lane.items.popleft()
+                if ckey is not None:
+                    lane.conflate.pop(ckey, None)
+                lane.cond.notify_all()  # Wake up blocked producers
+
+            ts_start = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                self._stats_add("errors")
+                self._logger.error("Error executing callback %s (%s)" % (getattr(fn, "__name__", fn), str(e)))
+            ts_end = time.monotonic()
+
+            with self._stats_lock:
+                latency = ts_end - ts_submit
+                exec_time = ts_end - ts_start
+                self._stats["executed"] += 1
+                self._stats["_latency_sum"] += latency
+                self._stats["_exec_time_sum"] += exec_time
+                if latency > self._stats["latency_max"]:
+                    self._stats["latency_max"] = latency
+                if exec_time > self._stats["exec_time_max"]:
+                    self._stats["exec_time_max"] = exec_time
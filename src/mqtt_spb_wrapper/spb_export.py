@@ -0,0 +1,174 @@
+import json
+from typing import Iterable, Iterator
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # Optional dependency, only required by the columnar formats
+    pa = None
+    pq = None
+
+EXPORT_COLUMNS = ("group", "eon", "eond", "kind", "metric", "value", "timestamp", "datatype", "version")
+EXPORT_FORMATS = ("jsonl", "parquet", "arrow")
+
+
+def iter_entity_rows(entity, group_name: str, since: int = 0) -> Iterator[tuple]:
+    """
+    Get the metrics of an entity as flat rows, without modifying the metric updated flags
+
+    Args:
+        entity: SpbEntity
+        group_name: spB group name
+        since: only the metrics updated after this version
+
+    Returns: generator of ( group, eon, eond, kind, metric, value, timestamp, datatype, version ), where kind
+             is "attributes", "data" or "commands"
+    """
+
+    eon_name = entity.spb_eon_name
+    eond_name = entity.spb_eon_device_name
+
+    for kind, metric_group in (("attributes", entity.attributes), ("data", entity.data),
+                               ("commands", entity.commands)):
+        if since:   # Only the updated metrics are visited
+            items = [metric_group._items.get(name, None) for name in metric_group.get_changes(since)]
+        else:
+            items = list(metric_group.values())
+
+        for item in items:
+            if item is None or item.version <= since:
+                continue
+
+            # Read the values directly, the value property clears the updated flag
+            values = item._value
+            timestamps = item._timestamp
+            if len(values) != 1 and len(timestamps) == len(values):
+                value, timestamp = values, timestamps
+            else:
+                value, timestamp = values[0], timestamps[0]
+
+            yield group_name, eon_name, eond_name, kind, item.name, value, timestamp, int(item.spb_data_type), \
+                item.version
+
+
+def iter_fleet_rows(apps: Iterable, since: int = 0) -> Iterator[tuple]:
+    """
+    Get the metrics of all the entities discovered by the applications as flat rows. The entities are
+    traversed incrementally, one edge node at a time.
+
+    Args:
+        apps: application entities ( MqttSpbEntityApp )
+        since: only the metrics updated after this version
+
+    Returns: generator of rows ( see iter_entity_rows )
+    """
+    for app in apps:
+        group_name = app.spb_group_name
+        for eon in list(app.entities_eon.values()):
+            yield from iter_entity_rows(eon, group_name, since)
+            for eond in list(eon.entities_eond.values()):
+                yield from iter_entity_rows(eond, group_name, since)
+
+
+def write_jsonl(rows: Iterable[tuple], fp) -> int:
+    """
+    Write the rows as JSON Lines, one object per metric
+
+    Args:
+        rows: rows ( see iter_entity_rows )
+        fp: text file object
+
+    Returns: number of rows written
+    """
+    count = 0
+    dumps = json.JSONEncoder(default=str, separators=(",", ":")).encode
+    for row in rows:
+        fp.write(dumps(dict(zip(EXPORT_COLUMNS, row))))
+        fp.write("\n")
+        count += 1
+    return count
+
+
+def write_columnar(rows: Iterable[tuple], path: str, file_format: str = "parquet", batch_rows: int = 10000) -> int:
+    """
+    Write the rows as a Parquet or Arrow IPC file, in record batches of bounded size. The names are dictionary
+    encoded, the numeric and boolean values are stored in the "value" column, and the rest of values in the
+    "value_str" column ( JSON for DataSets and lists ).
+
+    Requires the pyarrow package ( optional dependency ).
+
+    Args:
+        rows: rows ( see iter_entity_rows )
+        path: file path
+        file_format: "parquet" or "arrow"
+        batch_rows: maximum number of rows per record batch
+
+    Returns: number of rows written
+    """
+
+    if pa is None:
+        raise ImportError("The %s export format requires the pyarrow package ( pip install pyarrow )" % file_format)
+
+    names = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([
+        ("group", names),
+        ("eon", names),
+        ("eond", names),
+        ("kind", names),
+        ("metric", names),
+        ("value", pa.float64()),
+        ("value_str", pa.string()),
+        ("timestamp", pa.timestamp("ms")),
+        ("datatype", pa.int32()),
+        ("version", pa.int64()),
+    ])
+
+    def _record_batch(batch):
+        columns = list(zip(*batch))
+        values, values_str = [], []
+        for v in columns[5]:
+            if isinstance(v, (int, float)):
+                values.append(float(v))
+                values_str.append(None)
+            else:
+                values.append(None)
+                values_str.append(v if isinstance(v, str) else json.dumps(v, default=str))
+        timestamps = [ts[-1] if isinstance(ts, list) else ts for ts in columns[6]]  # Last timestamp of lists
+        return pa.RecordBatch.from_arrays(
+            [pa.array(columns[i], pa.string()).dictionary_encode() for i in range(5)] + [
+                pa.array(values, pa.float64()),
+                pa.array(values_str, pa.string()),
+                pa.array(timestamps, pa.timestamp("ms")),
+                pa.array(columns[7], pa.int32()),
+                pa.array(columns[8], pa.int64()),
+            ], schema=schema)
+
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(path, schema)
+        write = lambda b: writer.write_table(pa.Table.from_batches([b]))
+        sink = None
+    elif file_format == "arrow":
+        sink = pa.OSFile(path, "wb")
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    else:
+        raise ValueError("Unknown export format %s" % file_format)
+
+    count = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                write(_record_batch(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            write(_record_batch(batch))
+            count += len(batch)
+    finally:
+        writer.close()
+        if sink is not None:
+            sink.close()
+
+    return count
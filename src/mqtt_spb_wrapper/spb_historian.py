@@ -0,0 +1,286 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+from .spb_stream import SpbChangeStream
+
+_TS_MIN = -2 ** 62  # Range of the stored timestamps, the partition bounds must fit in a SQLite integer
+_TS_MAX = 2 ** 62
+
+
+class SpbSqliteHistorian:
+    """
+    SQLite historian class
+
+    Persist the metric updates of a change stream ( SpbChangeStream ) into a local SQLite database, written
+    in batches by a background thread, one transaction per batch.
+
+    The database uses a narrow schema: the entities and metrics are interned into the "entities" and
+    "metrics" tables, and each point is stored as ( metric id, timestamp, value, seq ) in a data table per
+    time partition ( i.e. one table per day ), with the primary key ( metric id, timestamp ) used by the
+    range queries. Old partitions are dropped as a whole by the retention. The database is opened in WAL mode,
+    so the queries do not block the writer.
+
+    Args:
+        path: database file path
+        partition: duration of the time partitions in seconds
+        retention: time to keep the partitions in seconds, relative to the current time. 0 to keep all.
+        debug: Enable console debug messages
+    """
+
+    def __init__(self, path: str, partition: int = 86400, retention: int = 0, debug: bool = False):
+
+        self.path = path
+        self.partition = int(partition * 1000)  # Partition duration in ms
+        self.retention = int(retention * 1000)  # Retention in ms
+
+        self._stats = {"written": 0, "batches": 0, "errors": 0, "discarded": 0}
+
+        self._entities: Dict[tuple, int] = {}   # ( group, eon, eond ) -> entity id
+        self._metrics: Dict[tuple, int] = {}    # ( entity id, name ) -> metric id
+        self._partitions: Dict[int, str] = {}   # Partition start -> table name
+
+        self._stream = None
+        self._thread = None
+        self._consumed = 0  # Number of records consumed from the stream
+        self._idle = threading.Condition()
+
+        self._logger = logging.getLogger("SPB_HISTORIAN")
+        self._logger.setLevel(logging.DEBUG if debug else logging.ERROR)
+
+        # Create the schema
+        db = self._connect()
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS entities ("
+                       "id INTEGER PRIMARY KEY, grp TEXT NOT NULL, eon TEXT NOT NULL, eond TEXT NOT NULL, "
+                       "UNIQUE (grp, eon, eond))")
+            db.execute("CREATE TABLE IF NOT EXISTS metrics ("
+                       "id INTEGER PRIMARY KEY, entity_id INTEGER NOT NULL, name TEXT NOT NULL, "
+                       "UNIQUE (entity_id, name))")
+            db.execute("CREATE TABLE IF NOT EXISTS partitions ("
+                       "ts_start INTEGER PRIMARY KEY, ts_end INTEGER NOT NULL, name TEXT NOT NULL)")
+        db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def start(self, stream: SpbChangeStream):
+        """
+        Start the writer thread, consuming the records of a change stream until the stream is closed
+
+        Args:
+            stream: change stream
+
+        Returns: Nothing
+        """
+        if self._thread is not None:
+            return
+        self._stream = stream
+        self._thread = threading.Thread(target=self._writer, args=(stream,), name="spb-historian", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Close the stream and stop the writer thread, once the queued records are written
+
+        Returns: Nothing
+        """
+        if self._thread is None:
+            return
+        self._stream.close()
+        self._thread.join()
+        self._thread = None
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until the queued records are written
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait forever
+
+        Returns: True if all the records are written
+        """
+        stream = self._stream
+        if stream is None:
+            return True
+
+        target = stream.count
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._consumed + stream.dropped < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if (remaining is not None and remaining <= 0) or self._thread is None:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def get_stats(self) -> dict:
+        """
+        Get the writer statistics
+
+        Returns: dictionary with the number of points written, batches, errors and points discarded ( invalid
+                 timestamps )
+        """
+        return dict(self._stats)
+
+    def _writer(self, stream: SpbChangeStream):
+
+        db = self._connect()
+
+        while True:
+            batch = stream.get_batch(timeout=0.1)
+            if not batch:
+                if stream.is_closed() and not len(stream):
+                    break
+                continue
+
+            try:
+                with db:
+                    self._write_batch(db, batch)
+                self._stats["batches"] += 1
+            except Exception as e:
+                self._stats["errors"] += 1
+                self._logger.error("Error writing historian batch (%s)" % str(e))
+                # Interned ids of the rolled back transaction are not valid
+                self._entities.clear()
+                self._metrics.clear()
+                self._partitions.clear()
+            finally:
+                with self._idle:
+                    self._consumed += len(batch)
+                    self._idle.notify_all()
+
+        db.close()
+
+    def _metric_id(self, db, group: str, eon: str, eond: str, name: str) -> int:
+
+        key = (group, eon, eond or "")
+        entity_id = self._entities.get(key, None)
+        if entity_id is None:
+            db.execute("INSERT OR IGNORE INTO entities (grp, eon, eond) VALUES (?, ?, ?)", key)
+            entity_id = db.execute("SELECT id FROM entities WHERE grp = ? AND eon = ? AND eond = ?",
+                                   key).fetchone()[0]
+            self._entities[key] = entity_id
+
+        key = (entity_id, name)
+        metric_id = self._metrics.get(key, None)
+        if metric_id is None:
+            db.execute("INSERT OR IGNORE INTO metrics (entity_id, name) VALUES (?, ?)", key)
+            metric_id = db.execute("SELECT id FROM metrics WHERE entity_id = ? AND name = ?", key).fetchone()[0]
+            self._metrics[key] = metric_id
+
+        return metric_id
+
+    def _partition_table(self, db, ts: int) -> str:
+
+        ts_start = ts - ts % self.partition
+        name = self._partitions.get(ts_start, None)
+        if name is None:
+            name = "data_%d" % ts_start if ts_start >= 0 else "data_m%d" % -ts_start    # Valid SQL identifier
+            db.execute("CREATE TABLE IF NOT EXISTS %s ("
+                       "metric_id INTEGER NOT NULL, ts INTEGER NOT NULL, value, seq INTEGER, "
+                       "PRIMARY KEY (metric_id, ts)) WITHOUT ROWID" % name)
+            db.execute("INSERT OR IGNORE INTO partitions (ts_start, ts_end, name) VALUES (?, ?, ?)",
+                       (ts_start, ts_start + self.partition, name))
+            self._partitions[ts_start] = name
+        return name
+
+    @staticmethod
+    def _sql_value(value):
+        if value is None or isinstance(value, (int, float, str, bytes)):
+            return value
+        if isinstance(value, bytearray):
+            return bytes(value)
+        return json.dumps(value, default=str)   # DataSets and other values
+
+    def _write_batch(self, db, batch: list):
+
+        rows: Dict[str, list] = {}  # Partition table -> rows
+        ts_now = int(time.time() * 1000)
+
+        for group, eon, eond, metric, value, timestamp, seq in batch:
+
+            metric_id = self._metric_id(db, group, eon, eond, metric)
+
+            # Value lists are received with the timestamps of each value
+            if isinstance(value, list) and isinstance(timestamp, list):
+                points = zip(timestamp, value)
+            else:
+                points = ((timestamp if timestamp is not None else ts_now, value),)
+
+            for ts, v in points:
+                try:
+                    ts = int(ts)
+                except (TypeError, ValueError):
+                    ts = None
+                if ts is None or not _TS_MIN <= ts <= _TS_MAX:  # Only the invalid point is discarded
+                    self._stats["discarded"] += 1
+                    continue
+                rows.setdefault(self._partition_table(db, ts), []).append(
+                    (metric_id, ts, self._sql_value(v), seq))
+
+        count = 0
+        for table, table_rows in rows.items():
+            db.executemany("INSERT OR REPLACE INTO %s (metric_id, ts, value, seq) VALUES (?, ?, ?, ?)" % table,
+                           table_rows)
+            count += len(table_rows)
+        self._stats["written"] += count
+
+        # Retention - Drop the old partitions, relative to the current time ( not the received timestamps, a
+        # device with a clock in the future would drop all the stored data )
+        if self.retention:
+            limit = ts_now - ts_now % self.partition - self.retention
+            for ts_start, name in db.execute("SELECT ts_start, name FROM partitions WHERE ts_end <= ?",
+                                             (limit,)).fetchall():
+                db.execute("DROP TABLE IF EXISTS %s" % name)
+                db.execute("DELETE FROM partitions WHERE ts_start = ?", (ts_start,))
+                self._partitions.pop(ts_start, None)
+
+    def query(self, eon: str, eond: str = None, metric: str = None, start: int = None, end: int = None,
+              group: str = None) -> List[tuple]:
+        """
+        Get the stored points of a metric, in a time range
+
+        Args:
+            eon: EoN name
+            eond: EoND name, None for the edge node metrics
+            metric: metric name
+            start: range start timestamp in milliseconds ( included ), None from the first point
+            end: range end timestamp in milliseconds ( excluded ), None to the last point
+            group: spB group name, None for any group
+
+        Returns: list of ( timestamp, value ) ordered by timestamp
+        """
+
+        db = self._connect()
+        try:
+            sql = "SELECT m.id FROM metrics m JOIN entities e ON e.id = m.entity_id " \
+                  "WHERE e.eon = ? AND e.eond = ? AND m.name = ?"
+            args = [eon, eond or "", metric]
+            if group is not None:
+                sql += " AND e.grp = ?"
+                args.append(group)
+            metric_ids = [row[0] for row in db.execute(sql, args)]
+            if not metric_ids:
+                return []
+
+            start = start if start is not None else -2 ** 63
+            end = end if end is not None else 2 ** 63 - 1
+
+            res = []
+            for (name,) in db.execute("SELECT name FROM partitions WHERE ts_end > ? AND ts_start < ? "
+                                      "ORDER BY ts_start", (start, end)).fetchall():
+                for metric_id in metric_ids:
+                    res.extend(db.execute("SELECT ts, value FROM %s WHERE metric_id = ? AND ts >= ? AND ts < ? "
+                                          "ORDER BY ts" % name, (metric_id, start, end)))
+            if len(metric_ids) > 1:
+                res.sort(key=lambda p: p[0])
+            return res
+        finally:
+            db.close()
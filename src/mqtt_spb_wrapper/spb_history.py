@@ -0,0 +1,591 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class _BitWriter:
+    """
+    Bit stream writer, used by the block compression
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._acc = 0   # Pending bits
+        self._n = 0     # Number of pending bits
+
+    def write(self, value: int, nbits: int):
+        self._acc = (self._acc << nbits) | value
+        self._n += nbits
+
+        # Flush the complete bytes, keeping the accumulator small
+        if self._n >= 256:
+            rem = self._n & 7
+            self._buf += (self._acc >> rem).to_bytes(self._n >> 3, "big")
+            self._acc &= (1 << rem) - 1
+            self._n = rem
+
+    def getvalue(self) -> bytes:
+        pad = -self._n & 7
+        return bytes(self._buf) + (self._acc << pad).to_bytes((self._n + pad) >> 3, "big")
+
+
+class _BitReader:
+    """
+    Bit stream reader, used by the block decompression
+    """
+
+    def __init__(self, data: bytes):
+        # Bits as a string of "0" / "1", slicing and parsing it is faster than shifting a big integer
+        self._bits = format(int.from_bytes(data, "big"), "0%db" % (len(data) * 8))
+        self._pos = 0   # Current bit position
+
+    def read(self, nbits: int) -> int:
+        pos = self._pos
+        self._pos = pos + nbits
+        return int(self._bits[pos:pos + nbits], 2)
+
+    def read_bit(self) -> bool:
+        pos = self._pos
+        self._pos = pos + 1
+        return self._bits[pos] == "1"
+
+    def read_signed(self, nbits: int) -> int:
+        value = self.read(nbits)
+        return value - (1 << nbits) if value >> (nbits - 1) else value
+
+
+# Delta-of-delta timestamp buckets, as ( prefix, prefix bits, value bits )
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+_MASK64 = (1 << 64) - 1
+
+
+def _encode_block(timestamps: array, values: array) -> bytes:
+    """
+    Compress a block of points: delta-of-delta encoded timestamps and XOR encoded float values.
+    """
+
+    bits = array("Q", values.tobytes())     # Float values as 64bit integers
+
+    w = _BitWriter()
+    w.write(timestamps[0] & _MASK64, 64)
+    w.write(bits[0], 64)
+
+    prev_ts = timestamps[0]
+    prev_delta = 0
+    prev_bits = bits[0]
+    prev_lead = prev_trail = -1     # Previous XOR meaningful bits window
+
+    for i in range(1, len(timestamps)):
+
+        # Timestamp
+        delta = timestamps[i] - prev_ts
+        dod = delta - prev_delta
+        prev_ts = timestamps[i]
+        prev_delta = delta
+
+        if dod == 0:
+            w.write(0, 1)
+        else:
+            for prefix, prefix_bits, nbits in _DOD_BUCKETS:
+                if -(1 << (nbits - 1)) <= dod < (1 << (nbits - 1)):
+                    w.write(prefix, prefix_bits)
+                    w.write(dod & ((1 << nbits) - 1), nbits)
+                    break
+            else:
+                w.write(0b1111, 4)
+                w.write(dod & _MASK64, 64)
+
+        # Value
+        xor = bits[i] ^ prev_bits
+        prev_bits = bits[i]
+
+        if xor == 0:
+            w.write(0, 1)
+            continue
+
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+
+        if prev_lead >= 0 and lead >= prev_lead and trail >= prev_trail:
+            # Meaningful bits inside the previous window
+            w.write(0b10, 2)
+            w.write(xor >> prev_trail, 64 - prev_lead - prev_trail)
+        else:
+            length = 64 - lead - trail
+            w.write(0b11, 2)
+            w.write(lead, 5)
+            w.write(length - 1, 6)
+            w.write(xor >> trail, length)
+            prev_lead, prev_trail = lead, trail
+
+    return w.getvalue()
+
+
+def _decode_block(data: bytes, count: int):
+    """
+    Decompress a block of points
+
+    Returns: tuple ( timestamps array, values array )
+    """
+
+    r = _BitReader(data)
+    timestamps = array("q", [r.read_signed(64)])
+    bits = array("Q", [r.read(64)])
+
+    prev_delta = 0
+    prev_bits = bits[0]
+    prev_lead = prev_trail = 0
+
+    for _ in range(1, count):
+
+        # Timestamp
+        if not r.read_bit():
+            dod = 0
+        else:
+            for _, _, nbits in _DOD_BUCKETS:
+                if not r.read_bit():
+                    break
+            else:
+                nbits = 64
+            dod = r.read_signed(nbits)
+
+        prev_delta += dod
+        timestamps.append(timestamps[-1] + prev_delta)
+
+        # Value
+        if r.read_bit():
+            if not r.read_bit():
+                prev_bits ^= r.read(64 - prev_lead - prev_trail) << prev_trail
+            else:
+                prev_lead = r.read(5)
+                length = r.read(6) + 1
+                prev_trail = 64 - prev_lead - length
+                prev_bits ^= r.read(length) << prev_trail
+        bits.append(prev_bits)
+
+    return timestamps, array("d", bits.tobytes())
+
+
+def _lttb(timestamps: array, values: array, threshold: int):
+    """
+    Largest-Triangle-Three-Buckets downsampling, selecting the points that keep the visual shape of the series.
+
+    Returns: tuple ( timestamps array, values array )
+    """
+
+    n = len(timestamps)
+    if threshold >= n or threshold < 3:
+        return timestamps, values
+
+    res_ts = array("q", [timestamps[0]])
+    res_values = array("d", [values[0]])
+
+    every = (n - 2) / (threshold - 2)  # Bucket size, first and last points are always selected
+    a = 0   # Previous selected point
+
+    for i in range(threshold - 2):
+
+        # Average point of the next bucket
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(timestamps[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        # Point of the current bucket with the largest triangle area
+        ax = timestamps[a]
+        ay = values[a]
+        max_area = -1.0
+        for j in range(int(i * every) + 1, next_start):
+            area = abs((ax - avg_x) * (values[j] - ay) - (ax - timestamps[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                a = j
+
+        res_ts.append(timestamps[a])
+        res_values.append(values[a])
+
+    res_ts.append(timestamps[-1])
+    res_values.append(values[-1])
+
+    return res_ts, res_values
+
+
+class _Block:
+    """
+    Sealed block of points, with the precomputed block statistics
+    """
+
+    __slots__ = ("ts_first", "ts_last", "count", "vcount", "vmin", "vmax", "vsum", "vlast", "data")
+
+    def __init__(self, timestamps: array, values: array, compression: bool):
+
+        self.ts_first = timestamps[0]
+        self.ts_last = timestamps[-1]
+        self.count = len(timestamps)
+
+        valid = [v for v in values if v == v]   # Skip NaN values
+        self.vcount = len(valid)
+        self.vmin = min(valid) if valid else None
+        self.vmax = max(valid) if valid else None
+        self.vsum = sum(valid)
+        self.vlast = valid[-1] if valid else None
+
+        self.data = _encode_block(timestamps, values) if compression else (timestamps, values)
+
+    def nbytes(self) -> int:
+        if isinstance(self.data, bytes):
+            return len(self.data)
+        return self.count * 16
+
+    def points(self):
+        if isinstance(self.data, bytes):
+            return _decode_block(self.data, self.count)
+        return self.data
+
+
+class SpbMetricHistory:
+    """
+    Metric history class
+
+    Time series of the values of a numeric metric, stored in compact arrays ( 64bit integer timestamps and
+    64bit float values ). The points are grouped in blocks, the newest block is kept uncompressed and the full
+    blocks are sealed, optionally compressed ( delta-of-delta timestamps and XOR float values ). Compressed
+    blocks are decoded on the queries, trading query time for memory.
+
+    The retention is configured by count, age and memory budget. The oldest blocks are discarded when all its
+    points are out of the retention limits, and the queries only return the points inside the limits.
+
+    Timestamps are in milliseconds. Points older than the newest point are discarded.
+
+    Args:
+        max_count: Maximum number of points, 0 for no limit
+        max_age: Maximum age of the points in milliseconds, relative to the newest point, 0 for no limit
+        max_bytes: Memory budget for the stored points in bytes, 0 for no limit
+        compression: Compress the sealed blocks of points
+        block_size: Number of points per block
+    """
+
+    def __init__(self, max_count: int = 0, max_age: int = 0, max_bytes: int = 0,
+                 compression: bool = False, block_size: int = 256):
+
+        self.max_count = max_count
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.compression = compression
+
+        # Small count limits do not need big blocks
+        self._block_size = max(min(block_size, max_count), 16) if max_count else block_size
+
+        self._blocks = []   # Sealed blocks, oldest first
+        self._ts = array("q")   # Current block timestamps
+        self._values = array("d")   # Current block values
+        self._count = 0     # Number of stored points
+        self._nbytes = 0    # Memory used by the sealed blocks
+
+        self.discarded = 0  # Number of points discarded as out of order
+
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            count = 0
+            for block, skip, start_limit in self._iter_blocks(None, None):
+                ts = self._ts if block is None else None
+                if block is not None:
+                    if start_limit is None or block.ts_first >= start_limit:
+                        count += block.count - skip
+                        continue
+                    ts = block.points()[0]
+                i = skip if start_limit is None else max(skip, bisect_left(ts, start_limit))
+                count += len(ts) - i
+            return count
+
+    def append(self, timestamp: int, value):
+        """
+        Add a point to the history
+
+        Args:
+            timestamp: point timestamp in milliseconds
+            value: numeric value
+
+        Returns: True if the point was added
+        """
+
+        with self._lock:
+            if self._ts:
+                last = self._ts[-1]
+            elif self._blocks:
+                last = self._blocks[-1].ts_last
+            else:
+                last = None
+
+            if last is not None and timestamp < last:
+                self.discarded += 1
+                return False
+
+            self._ts.append(timestamp)
+            self._values.append(value)
+            self._count += 1
+
+            if len(self._ts) >= self._block_size:
+                self._seal()
+
+            return True
+
+    def _seal(self):
+        """
+        Seal the current block and apply the retention limits
+        """
+        block = _Block(self._ts, self._values, self.compression)
+        self._blocks.append(block)
+        self._nbytes += block.nbytes()
+        self._ts = array("q")
+        self._values = array("d")
+
+        # Discard the oldest blocks, keeping space in the memory budget for the next block
+        newest = block.ts_last
+        while self._blocks:
+            oldest = self._blocks[0]
+            if (self.max_count and self._count - oldest.count >= self.max_count) \
+                    or (self.max_age and oldest.ts_last < newest - self.max_age) \
+                    or (self.max_bytes and self._nbytes + self._block_size * 16 > self.max_bytes):
+                self._blocks.pop(0)
+                self._count -= oldest.count
+                self._nbytes -= oldest.nbytes()
+            else:
+                break
+
+    def memory_usage(self) -> int:
+        """
+        Memory used by the stored points, in bytes
+        """
+        return self._nbytes + len(self._ts) * 16
+
+    def _newest(self):
+        if self._ts:
+            return self._ts[-1]
+        if self._blocks:
+            return self._blocks[-1].ts_last
+        return None
+
+    def _iter_blocks(self, start, end):
+        """
+        Iterate the blocks, and current block, inside the retention limits and overlapping a time range.
+
+        Returns: iterator of ( block, skip ), where block is None for the current block and skip is the number
+                 of points of the block out of the count limit.
+        """
+
+        newest = self._newest()
+        if newest is None:
+            return
+
+        # Retention limits
+        if self.max_age and (start is None or start < newest - self.max_age):
+            start = newest - self.max_age
+        skip = self._count - self.max_count if self.max_count and self._count > self.max_count else 0
+
+        for block in self._blocks:
+            if skip >= block.count:
+                skip -= block.count
+                continue
+            if (start is None or block.ts_last >= start) and (end is None or block.ts_first <= end):
+                yield block, skip, start
+            skip = 0
+
+        if self._ts and (end is None or self._ts[0] <= end):
+            yield None, skip, start
+
+    def get_window(self, start: int = None, end: int = None):
+        """
+        Get the points in a time range ( start <= timestamp <= end )
+
+        Args:
+            start: range start timestamp in milliseconds, None for no limit
+            end: range end timestamp in milliseconds, None for no limit
+
+        Returns: tuple of arrays ( timestamps, values )
+        """
+
+        with self._lock:
+            res_ts = array("q")
+            res_values = array("d")
+
+            for block, skip, start_limit in self._iter_blocks(start, end):
+
+                ts, values = (self._ts, self._values) if block is None else block.points()
+
+                i = skip if start_limit is None else max(skip, bisect_left(ts, start_limit))
+                j = len(ts) if end is None else bisect_right(ts, end)
+
+                res_ts.extend(ts[i:j])
+                res_values.extend(values[i:j])
+
+            return res_ts, res_values
+
+    def get_last(self, duration: int, now: int = None):
+        """
+        Get the points of the last period of time, i.e. the last 10 minutes ( duration=600000 )
+
+        Args:
+            duration: period duration in milliseconds
+            now: current timestamp in milliseconds, None for the current time
+
+        Returns: tuple of arrays ( timestamps, values )
+        """
+        if now is None:
+            now = int(time.time() * 1000)
+        return self.get_window(now - duration, now)
+
+    def aggregate(self, start: int = None, end: int = None) -> dict:
+        """
+        Get the count, min, max and average of the values in a time range. Blocks fully inside the range use
+        their precomputed statistics, without decompressing them.
+
+        Args:
+            start: range start timestamp in milliseconds, None for no limit
+            end: range end timestamp in milliseconds, None for no limit
+
+        Returns: dictionary with count, min, max and avg values ( None if there are no values )
+        """
+
+        with self._lock:
+            count = 0
+            vsum = 0.0
+            vmin = vmax = None
+
+            for block, skip, start_limit in self._iter_blocks(start, end):
+
+                if block is not None and skip == 0 \
+                        and (start_limit is None or block.ts_first >= start_limit) \
+                        and (end is None or block.ts_last <= end):
+                    # Full block, use the block statistics
+                    if block.vmin is None:
+                        continue
+                    valid = block.vcount
+                    bmin, bmax, bsum = block.vmin, block.vmax, block.vsum
+                else:
+                    ts, values = (self._ts, self._values) if block is None else block.points()
+                    i = skip if start_limit is None else max(skip, bisect_left(ts, start_limit))
+                    j = len(ts) if end is None else bisect_right(ts, end)
+                    values = [v for v in values[i:j] if v == v]
+                    if not values:
+                        continue
+                    valid = len(values)
+                    bmin, bmax, bsum = min(values), max(values), sum(values)
+
+                count += valid
+                vsum += bsum
+                vmin = bmin if vmin is None or bmin < vmin else vmin
+                vmax = bmax if vmax is None or bmax > vmax else vmax
+
+            return {
+                "count": count,
+                "min": vmin,
+                "max": vmax,
+                "avg": vsum / count if count else None,
+            }
+
+    AGGREGATIONS = ("mean", "min", "max", "last")
+
+    def downsample(self, bucket: int, aggregation: str = "mean", start: int = None, end: int = None):
+        """
+        Aggregate the values in time buckets. Blocks fully inside a bucket use their precomputed statistics,
+        without decompressing them.
+
+        Args:
+            bucket: bucket duration in milliseconds, buckets are aligned to the epoch
+            aggregation: aggregation function ( mean, min, max, last )
+            start: range start timestamp in milliseconds, None for no limit
+            end: range end timestamp in milliseconds, None for no limit
+
+        Returns: tuple of arrays ( bucket start timestamps, aggregated values ), empty buckets are not included
+        """
+
+        if aggregation not in self.AGGREGATIONS:
+            raise ValueError("Unknown aggregation '%s', valid values: %s" % (aggregation, self.AGGREGATIONS))
+        if bucket <= 0:
+            raise ValueError("Bucket duration must be greater than 0")
+
+        res_ts = array("q")
+        res_values = array("d")
+
+        # Current bucket accumulators
+        key = None
+        count = 0
+        vsum = 0.0
+        vmin = vmax = vlast = None
+
+        def _emit():
+            if aggregation == "mean":
+                value = vsum / count
+            elif aggregation == "min":
+                value = vmin
+            elif aggregation == "max":
+                value = vmax
+            else:
+                value = vlast
+            res_ts.append(key * bucket)
+            res_values.append(value)
+
+        with self._lock:
+            for block, skip, start_limit in self._iter_blocks(start, end):
+
+                if block is not None and skip == 0 \
+                        and (start_limit is None or block.ts_first >= start_limit) \
+                        and (end is None or block.ts_last <= end) \
+                        and block.ts_first // bucket == block.ts_last // bucket:
+                    # Block inside a single bucket, use the block statistics
+                    if block.vmin is None:
+                        continue
+                    points = ((block.ts_first, block.vcount, block.vsum, block.vmin, block.vmax, block.vlast),)
+                else:
+                    ts, values = (self._ts, self._values) if block is None else block.points()
+                    i = skip if start_limit is None else max(skip, bisect_left(ts, start_limit))
+                    j = len(ts) if end is None else bisect_right(ts, end)
+                    points = ((t, 1, v, v, v, v) for t, v in zip(ts[i:j], values[i:j]) if v == v)
+
+                for t, c, bsum, bmin, bmax, blast in points:
+                    k = t // bucket
+                    if k != key:
+                        if key is not None:
+                            _emit()
+                        key = k
+                        count = 0
+                        vsum = 0.0
+                        vmin = vmax = None
+                    count += c
+                    vsum += bsum
+                    vmin = bmin if vmin is None or bmin < vmin else vmin
+                    vmax = bmax if vmax is None or bmax > vmax else vmax
+                    vlast = blast
+
+            if key is not None:
+                _emit()
+
+        return res_ts, res_values
+
+    def downsample_lttb(self, points: int, start: int = None, end: int = None):
+        """
+        Downsample the values to a number of points with the Largest-Triangle-Three-Buckets algorithm, keeping
+        the visual shape of the series ( i.e. to draw a trend with one point per pixel ). NaN values are skipped.
+
+        Args:
+            points: maximum number of points
+            start: range start timestamp in milliseconds, None for no limit
+            end: range end timestamp in milliseconds, None for no limit
+
+        Returns: tuple of arrays ( timestamps, values )
+        """
+
+        ts, values = self.get_window(start, end)
+
+        # Skip NaN values
+        if any(v != v for v in values):
+            valid = [i for i, v in enumerate(values) if v == v]
+            ts = array("q", [ts[i] for i in valid])
+            values = array("d", [values[i] for i in valid])
+
+        return _lttb(ts, values, points)
@@ -0,0 +1,450 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Set
+
+OPERATORS = ("==", "!=", "<", "<=", ">", ">=")  # Comparison operators supported by the index queries
+
+
+class SpbAttributeIndex:
+    """
+    Inverted attribute index class
+
+    Index of entities by attribute value ( attribute name -> value -> set of entities ), updated incrementally
+    when the entity attributes change. Values are compared by their string representation, and numeric values
+    are also kept sorted to support range queries.
+
+    The index is updated by the MQTT thread and queried from the user threads, all the methods are thread safe.
+    """
+
+    def __init__(self):
+
+        self._values: Dict[str, Dict[str, Set[Any]]] = {}   # name -> str(value) -> set of entities
+        self._numeric: Dict[str, list] = {}     # name -> sorted list of (value, id(entity), entity)
+        self._entities: Dict[Any, Dict[str, Any]] = {}  # entity -> name -> value, current indexed values
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entities)
+
+    @staticmethod
+    def _is_numeric(value) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def update(self, entity, name: str, value):
+        """
+        Index an entity attribute value
+
+        Args:
+            entity: entity reference
+            name: attribute name
+            value: attribute value
+
+        Returns: Nothing
+        """
+
+        with self._lock:
+            values = self._entities.setdefault(entity, {})
+
+            if name in values:
+                if values[name] == value and type(values[name]) is type(value):
+                    return  # Not changed
+                self.remove(entity, name)
+                values = self._entities.setdefault(entity, {})
+
+            values[name] = value
+            self._values.setdefault(name, {}).setdefault(str(value), set()).add(entity)
+
+            if self._is_numeric(value):
+                insort(self._numeric.setdefault(name, []), (value, id(entity), entity))
+
+    def remove(self, entity, name: str):
+        """
+        Remove an entity attribute from the index
+
+        Args:
+            entity: entity reference
+            name: attribute name
+
+        Returns: Nothing
+        """
+
+        with self._lock:
+            values = self._entities.get(entity, None)
+            if values is None or name not in values:
+                return
+
+            value = values.pop(name)
+            if not values:
+                self._entities.pop(entity)
+
+            entities = self._values[name][str(value)]
+            entities.discard(entity)
+            if not entities:
+                self._values[name].pop(str(value))
+
+            if self._is_numeric(value):
+                items = self._numeric[name]
+                idx = bisect_left(items, (value, id(entity)))
+                if idx < len(items) and items[idx][2] is entity:
+                    items.pop(idx)
+
+    def remove_entity(self, entity):
+        """
+        Remove all the attributes of an entity from the index
+
+        Args:
+            entity: entity reference
+
+        Returns: Nothing
+        """
+        with self._lock:
+            for name in list(self._entities.get(entity, {}).keys()):
+                self.remove(entity, name)
+
+    def find(self, name: str, value) -> Set[Any]:
+        """
+        Find the entities with an attribute value
+
+        Args:
+            name: attribute name
+            value: attribute value ( compared by its string representation )
+
+        Returns: set of entities
+        """
+        with self._lock:
+            return set(self._values.get(name, {}).get(str(value), ()))
+
+    def find_range(self, name: str, min_value=None, max_value=None) -> Set[Any]:
+        """
+        Find the entities with a numeric attribute value in a range ( min_value <= value <= max_value )
+
+        Args:
+            name: attribute name
+            min_value: minimum value, None for no lower limit
+            max_value: maximum value, None for no upper limit
+
+        Returns: set of entities
+        """
+        with self._lock:
+            items = self._numeric.get(name, [])
+
+            start = 0 if min_value is None else bisect_left(items, (min_value,))
+            end = len(items) if max_value is None else bisect_right(items, (max_value, float("inf")))
+
+            return {item[2] for item in items[start:end]}
+
+    def get(self, entity, name: str, default=None):
+        """
+        Get the indexed value of an entity attribute
+        """
+        with self._lock:
+            return self._entities.get(entity, {}).get(name, default)
+
+    def select(self, name: str, op: str, value) -> Set[Any]:
+        """
+        Find the entities with an attribute value matching a condition
+
+        Args:
+            name: attribute name
+            op: comparison operator ( ==, !=, <, <=, >, >= ), the order operators are only supported for
+                numeric values
+            value: value to compare with
+
+        Returns: set of entities
+        """
+
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator '%s', valid values: %s" % (op, OPERATORS))
+
+        with self._lock:
+            if op == "==":
+                return self.find(name, value)
+
+            if op == "!=":
+                entities = {e for entities in self._values.get(name, {}).values() for e in entities}
+                return entities - self.find(name, value)
+
+            if not self._is_numeric(value):
+                raise ValueError("Operator '%s' is only supported for numeric values" % op)
+
+            if op in ("<", "<="):
+                entities = self.find_range(name, None, value)
+            else:
+                entities = self.find_range(name, value, None)
+
+            if op in ("<", ">"):    # Exclude the limit
+                entities = {e for e in entities if self._entities[e][name] != value}
+
+            return entities
+
+    def search(self, attributes: dict) -> Set[Any]:
+        """
+        Find the entities matching all the attribute values
+
+        Args:
+            attributes: dictionary of attribute name -> value
+
+        Returns: set of entities, all indexed entities if no attributes are provided
+        """
+
+        with self._lock:
+            if not attributes:
+                return set(self._entities.keys())
+
+            # Intersect starting with the smallest set
+            results = sorted((self._values.get(k, {}).get(str(v), set()) for k, v in attributes.items()), key=len)
+
+            res = set(results[0])
+            for entities in results[1:]:
+                if not res:
+                    break
+                res &= entities
+            return res
+
+
+class _SortedBuckets:
+    """
+    Sorted list of items, split in buckets of limited size so insertions and removals only move the items
+    of a single bucket ( instead of the whole list ) when the values change at high rates.
+    """
+
+    LOAD = 256  # Target bucket size, buckets are split when they reach twice this size
+
+    def __init__(self):
+        self._buckets = []  # List of sorted buckets
+        self._maxes = []    # Last ( maximum ) item of each bucket
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, item):
+        if not self._buckets:
+            self._buckets.append([item])
+            self._maxes.append(item)
+            self._len = 1
+            return
+
+        pos = bisect_left(self._maxes, item)
+        if pos == len(self._maxes):     # Greater than all the items, add it to the last bucket
+            pos -= 1
+            self._buckets[pos].append(item)
+            self._maxes[pos] = item
+        else:
+            insort(self._buckets[pos], item)
+
+        self._len += 1
+
+        # Split the bucket if it is too big
+        bucket = self._buckets[pos]
+        if len(bucket) >= 2 * self.LOAD:
+            half = bucket[self.LOAD:]
+            del bucket[self.LOAD:]
+            self._maxes[pos] = bucket[-1]
+            self._buckets.insert(pos + 1, half)
+            self._maxes.insert(pos + 1, half[-1])
+
+    def remove(self, item) -> bool:
+        pos = bisect_left(self._maxes, item)
+        if pos == len(self._maxes):
+            return False
+
+        bucket = self._buckets[pos]
+        idx = bisect_left(bucket, item)
+        if idx >= len(bucket) or bucket[idx] != item:
+            return False
+
+        del bucket[idx]
+        self._len -= 1
+
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+        return True
+
+    def irange(self, min_item=None, max_item=None):
+        """
+        Iterate the items in a range ( min_item <= item < max_item ), None for no limit
+        """
+        pos = 0 if min_item is None else bisect_left(self._maxes, min_item)
+
+        for bucket in self._buckets[pos:]:
+            start = 0 if min_item is None else bisect_left(bucket, min_item)
+            if max_item is not None and bucket[-1] >= max_item:
+                yield from bucket[start:bisect_left(bucket, max_item)]
+                return
+            yield from bucket[start:]
+            min_item = None
+
+
+class SpbMetricIndex:
+    """
+    Metric value index class
+
+    Index of the current metric values of the entities, updated on every received value. Numeric values are
+    kept sorted per metric name to answer range queries, other values ( strings, booleans ) are indexed by
+    value for equality queries.
+
+    Operators supported by find(): ==, !=, <, <=, >, >=
+
+    The index is updated by the MQTT thread and queried from the user threads, all the methods are thread safe.
+    """
+
+    OPERATORS = OPERATORS
+
+    def __init__(self):
+
+        self._current: Dict[str, Dict[Any, Any]] = {}   # name -> entity -> current value
+        self._numeric: Dict[str, _SortedBuckets] = {}   # name -> sorted (value, entity id)
+        self._values: Dict[str, Dict[Any, Set[Any]]] = {}   # name -> value -> set of entities, non numeric values
+        self._ids: Dict[Any, int] = {}  # entity -> entity id, used to sort the entities with the same value
+        self._entities: Dict[int, Any] = {}     # entity id -> entity
+        self._next_id = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    @staticmethod
+    def _is_numeric(value) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def _entity_id(self, entity) -> int:
+        eid = self._ids.get(entity, None)
+        if eid is None:
+            eid = self._ids[entity] = self._next_id
+            self._entities[eid] = entity
+            self._next_id += 1
+        return eid
+
+    def update(self, entity, name: str, value):
+        """
+        Index an entity metric value. Values that are not numeric, string or boolean ( lists, datasets ) are
+        not indexed.
+
+        Args:
+            entity: entity reference
+            name: metric name
+            value: metric value
+
+        Returns: Nothing
+        """
+
+        with self._lock:
+            if not isinstance(value, (int, float, str)):
+                self.remove(entity, name)
+                return
+
+            current = self._current.setdefault(name, {})
+
+            if entity in current:
+                old = current[entity]
+                if old == value and type(old) is type(value):
+                    return  # Not changed
+                self._remove_value(entity, name, old)
+
+            current[entity] = value
+
+            if self._is_numeric(value):
+                if value != value:  # NaN values can not be sorted
+                    return
+                self._numeric.setdefault(name, _SortedBuckets()).add((value, self._entity_id(entity)))
+            else:
+                self._values.setdefault(name, {}).setdefault(value, set()).add(entity)
+
+    def _remove_value(self, entity, name: str, value):
+
+        if self._is_numeric(value):
+            if value == value:
+                self._numeric[name].remove((value, self._ids[entity]))
+        else:
+            entities = self._values[name][value]
+            entities.discard(entity)
+            if not entities:
+                self._values[name].pop(value)
+
+    def remove(self, entity, name: str):
+        """
+        Remove an entity metric from the index
+
+        Args:
+            entity: entity reference
+            name: metric name
+
+        Returns: Nothing
+        """
+        with self._lock:
+            current = self._current.get(name, None)
+            if current is None or entity not in current:
+                return
+
+            self._remove_value(entity, name, current.pop(entity))
+
+    def remove_entity(self, entity):
+        """
+        Remove all the metrics of an entity from the index
+
+        Args:
+            entity: entity reference
+
+        Returns: Nothing
+        """
+        with self._lock:
+            for name, current in self._current.items():
+                if entity in current:
+                    self._remove_value(entity, name, current.pop(entity))
+
+            eid = self._ids.pop(entity, None)
+            if eid is not None:
+                self._entities.pop(eid)
+
+    def get(self, entity, name: str, default=None):
+        """
+        Get the indexed value of an entity metric
+        """
+        with self._lock:
+            return self._current.get(name, {}).get(entity, default)
+
+    def find(self, name: str, op: str, value) -> Set[Any]:
+        """
+        Find the entities with a metric value matching a condition
+
+        Args:
+            name: metric name
+            op: comparison operator ( ==, !=, <, <=, >, >= )
+            value: value to compare with
+
+        Returns: set of entities
+        """
+
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator '%s', valid values: %s" % (op, OPERATORS))
+
+        with self._lock:
+            if op == "!=":
+                return set(self._current.get(name, {}).keys()) - self.find(name, "==", value)
+
+            if not self._is_numeric(value):
+                if op != "==":
+                    raise ValueError("Operator '%s' is only supported for numeric values" % op)
+                return set(self._values.get(name, {}).get(value, ()))
+
+            items = self._numeric.get(name, None)
+            if items is None:
+                return set()
+
+            if op == "==":
+                ranges = items.irange((value,), (value, float("inf")))
+            elif op == "<":
+                ranges = items.irange(None, (value,))
+            elif op == "<=":
+                ranges = items.irange(None, (value, float("inf")))
+            elif op == ">":
+                ranges = items.irange((value, float("inf")), None)
+            else:   # >=
+                ranges = items.irange((value,), None)
+
+            entities = self._entities
+            return {entities[eid] for _, eid in ranges}
@@ -0,0 +1,336 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+
+class SpbTimerWheel:
+    """
+    Hashed timer wheel class
+
+    Timers are stored in a circular list of slots, one slot per tick. Scheduling and cancelling a timer are
+    O(1), and advancing the wheel only visits the slots of the elapsed ticks, so the cost does not depend on
+    the total number of timers. Timers further than a full turn stay in their slot until their turn arrives.
+
+    Args:
+        resolution: Tick duration in milliseconds
+        slots: Number of slots of the wheel
+    """
+
+    def __init__(self, resolution: int = 500, slots: int = 512):
+
+        self.resolution = resolution
+
+        self._slots = [set() for _ in range(slots)]
+        self._timers: Dict[Any, tuple] = {}     # key -> ( deadline, tick )
+        self._tick = None   # Next tick to be processed
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def schedule(self, key, deadline: int):
+        """
+        Schedule a timer, replacing the previous timer of the key
+
+        Args:
+            key: timer key
+            deadline: expiration timestamp in milliseconds
+
+        Returns: Nothing
+        """
+        self.cancel(key)
+
+        tick = deadline // self.resolution
+        if self._tick is None:
+            self._tick = tick
+        elif tick < self._tick:     # Already expired, process it on the next tick
+            tick = self._tick
+
+        self._timers[key] = (deadline, tick)
+        self._slots[tick % len(self._slots)].add(key)
+
+    def cancel(self, key):
+        """
+        Cancel the timer of a key, if any
+
+        Args:
+            key: timer key
+
+        Returns: Nothing
+        """
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            self._slots[timer[1] % len(self._slots)].discard(key)
+
+    def advance(self, now: int) -> List[Any]:
+        """
+        Advance the wheel to a timestamp, and get the expired timers
+
+        Args:
+            now: current timestamp in milliseconds
+
+        Returns: list of keys of the expired timers
+        """
+
+        now_tick = now // self.resolution
+        if self._tick is None:
+            self._tick = now_tick
+            return []
+
+        expired = []
+        n_slots = len(self._slots)
+
+        # Visit each slot at most once
+        first = max(self._tick, now_tick - n_slots + 1)
+        for tick in range(first, now_tick + 1):
+            slot = self._slots[tick % n_slots]
+            for key in [k for k in slot if self._timers[k][1] <= now_tick]:
+                slot.discard(key)
+                self._timers.pop(key)
+                expired.append(key)
+
+        self._tick = max(self._tick, now_tick + 1)
+
+        return expired
+
+
+class SpbLivenessTracker:
+    """
+    Liveness tracker class
+
+    Track the state of the entities from the messages received: ONLINE when a message is received, STALE when
+    no message is received for stale_factor times the expected interval, and OFFLINE after offline_factor
+    times the expected interval or when a DEATH message is received.
+
+    The expected interval of each entity can be fixed, or learned from the time between its messages. The
+    timeouts are implemented with a timer wheel, and the timers are not moved on every message: when a timer
+    expires, it is rescheduled if the entity received messages since it was scheduled.
+
+    Args:
+        interval: Expected interval between messages in seconds, None to learn it for each entity
+        stale_factor: Number of intervals without messages to mark an entity as STALE
+        offline_factor: Number of intervals without messages to mark an entity as OFFLINE
+        resolution: Timer resolution in seconds
+        callback: Function( key, old_state, new_state ) called on the state transitions
+        debug: Enable console debug messages
+    """
+
+    ONLINE = "online"
+    STALE = "stale"
+    OFFLINE = "offline"
+
+    _ALPHA = 0.2    # Weight of the new samples on the learned interval ( exponential moving average )
+
+    def __init__(self, interval: float = None, stale_factor: float = 2.0, offline_factor: float = 5.0,
+                 resolution: float = 0.5, callback: Callable[[Any, str, str], None] = None, debug: bool = False):
+
+        if offline_factor < stale_factor:
+            raise ValueError("The offline factor must be greater than the stale factor")
+
+        self.interval = int(interval * 1000) if interval else None
+        self.stale_factor = stale_factor
+        self.offline_factor = offline_factor
+        self.resolution = resolution
+        self.callback = callback
+
+        self._wheel = SpbTimerWheel(resolution=max(int(resolution * 1000), 1))
+        self._entries: Dict[Any, list] = {}     # key -> [ state, last message ts, interval, fixed interval ]
+        self._counts = {self.ONLINE: 0, self.STALE: 0, self.OFFLINE: 0}
+        self._lock = threading.Lock()
+
+        self._thread = None
+        self._stop = None
+
+        self._logger = logging.getLogger("SPB_LIVENESS")
+        self._logger.setLevel(logging.DEBUG if debug else logging.ERROR)
+
+    def start(self):
+        """
+        Start the thread advancing the timers
+
+        Returns: Nothing
+        """
+        if self._thread is not None:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._worker, args=(self._stop,), name="spb-liveness", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the timers thread
+
+        Returns: Nothing
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _worker(self, stop: threading.Event):
+        while not stop.wait(self._wheel.resolution / 1000):
+            self.advance(int(time.time() * 1000))
+
+    def _set_state(self, key, entry: list, state: str, transitions: list):
+        old_state = entry[0]
+        if old_state == state:
+            return
+        if old_state is not None:
+            self._counts[old_state] -= 1
+        self._counts[state] += 1
+        entry[0] = state
+        transitions.append((key, old_state, state))
+
+    def _notify(self, transitions: list):
+        if self.callback is None:
+            return
+        for key, old_state, new_state in transitions:
+            try:
+                self.callback(key, old_state, new_state)
+            except Exception as e:
+                self._logger.error("Error executing liveness callback (%s)" % str(e))
+
+    def seen(self, key, ts: int):
+        """
+        A message was received from an entity
+
+        Args:
+            key: entity key
+            ts: message timestamp in milliseconds
+
+        Returns: Nothing
+        """
+
+        transitions = []
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                entry = self._entries[key] = [None, ts, self.interval, self.interval is not None]
+
+            else:
+                # Learn the interval between messages
+                if not entry[3] and ts > entry[1]:
+                    gap = ts - entry[1]
+                    entry[2] = gap if entry[2] is None else int(entry[2] + self._ALPHA * (gap - entry[2]))
+                entry[1] = ts
+
+            if entry[0] != self.ONLINE:
+                self._set_state(key, entry, self.ONLINE, transitions)
+                if entry[2] is not None:
+                    self._wheel.schedule(key, ts + int(entry[2] * self.stale_factor))
+
+            elif entry[2] is not None and key not in self._wheel:
+                # First interval learned
+                self._wheel.schedule(key, ts + int(entry[2] * self.stale_factor))
+
+        self._notify(transitions)
+
+    def dead(self, key, ts: int = None):
+        """
+        A DEATH message was received from an entity, it is marked as OFFLINE
+
+        Args:
+            key: entity key
+            ts: message timestamp in milliseconds
+
+        Returns: Nothing
+        """
+
+        transitions = []
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                entry = self._entries[key] = [None, ts or 0, self.interval, self.interval is not None]
+            self._wheel.cancel(key)
+            self._set_state(key, entry, self.OFFLINE, transitions)
+
+        self._notify(transitions)
+
+    def remove(self, key):
+        """
+        Stop tracking an entity
+
+        Args:
+            key: entity key
+
+        Returns: Nothing
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._wheel.cancel(key)
+                if entry[0] is not None:
+                    self._counts[entry[0]] -= 1
+
+    def set_interval(self, key, interval: float):
+        """
+        Set the expected interval between messages of an entity
+
+        Args:
+            key: entity key
+            interval: interval in seconds
+
+        Returns: Nothing
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, [None, int(time.time() * 1000), None, True])
+            entry[2] = int(interval * 1000)
+            entry[3] = True
+
+    def advance(self, now: int):
+        """
+        Process the expired timers, executing the transition callbacks
+
+        Args:
+            now: current timestamp in milliseconds
+
+        Returns: Nothing
+        """
+
+        transitions = []
+
+        with self._lock:
+            for key in self._wheel.advance(now):
+                entry = self._entries.get(key, None)
+                if entry is None or entry[2] is None:
+                    continue
+
+                ts_stale = entry[1] + int(entry[2] * self.stale_factor)
+                ts_offline = entry[1] + int(entry[2] * self.offline_factor)
+
+                if now < ts_stale:
+                    self._wheel.schedule(key, ts_stale)     # Messages received since it was scheduled
+                elif now < ts_offline:
+                    self._set_state(key, entry, self.STALE, transitions)
+                    self._wheel.schedule(key, ts_offline)
+                else:
+                    self._set_state(key, entry, self.OFFLINE, transitions)
+
+        self._notify(transitions)
+
+    def get_state(self, key) -> str:
+        """
+        Get the state of an entity
+
+        Args:
+            key: entity key
+
+        Returns: state ( online, stale, offline ), None if unknown
+        """
+        entry = self._entries.get(key, None)
+        return entry[0] if entry is not None else None
+
+    def get_counts(self) -> dict:
+        """
+        Get the number of entities in each state
+
+        Returns: dictionary state -> count
+        """
+        with self._lock:
+            return dict(self._counts)
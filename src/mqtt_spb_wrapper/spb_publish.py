@@ -0,0 +1,199 @@
+import threading
+from concurrent.futures import Future
+
+
+class SpbPublishFuture(Future):
+    """
+    Publish future class
+
+    Future resolved when a published message is delivered to the MQTT broker ( PUBACK for QoS 1, PUBCOMP for
+    QoS 2, or when the message is sent for QoS 0 ). The result is True if delivered, and False if the message
+    could not be published.
+
+    Use future.result(timeout) to wait for the delivery, future.add_done_callback(fn) to be notified, or
+    asyncio.wrap_future(future) to await it from asyncio code.
+
+    Args:
+        topic: MQTT topic
+        qos: Quality of service
+    """
+
+    def __init__(self, topic: str, qos: int):
+        super().__init__()
+        self.topic = topic
+        self.qos = qos
+        self.mid = None     # MQTT message id, once handed to the MQTT client
+
+
+class SpbPublishWindow:
+    """
+    Publish window class
+
+    Keep track of the messages published and not yet delivered ( in-flight ), and limit their number. When the
+    window is full, new publish calls wait until a message is delivered, so the producer is slowed down to the
+    broker delivery rate instead of growing the MQTT client queue without limit.
+
+    Args:
+        max_inflight: Maximum number of in-flight messages, 0 for unlimited
+    """
+
+    def __init__(self, max_inflight: int = 0):
+
+        self.max_inflight = max_inflight
+
+        self._cond = threading.Condition(threading.RLock())
+        self._inflight = {}     # In-flight messages, mid -> SpbPublishFuture
+        self._delivered = set()     # Message ids delivered before being registered
+        self._queued = 0    # Number of publish calls waiting for space in the window
+        self._reserved = 0  # Number of window slots acquired, not yet registered
+
+        self.published = 0  # Number of delivered messages
+        self.failed = 0     # Number of messages that could not be published
+
+    def _has_space(self) -> bool:
+        return self.max_inflight <= 0 or (len(self._inflight) + self._reserved) < self.max_inflight
+
+    def acquire(self, timeout: float = None) -> bool:
+        """
+        Wait until there is space in the window for a new message, and reserve it. The slot is released by
+        register() or release().
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait forever, 0 to not wait
+
+        Returns: True if there is space
+        """
+        with self._cond:
+            if not self._has_space():
+
+                if timeout is not None and timeout <= 0:
+                    return False
+
+                self._queued += 1
+                try:
+                    if not self._cond.wait_for(self._has_space, timeout):
+                        return False
+                finally:
+                    self._queued -= 1
+
+            self._reserved += 1
+            return True
+
+    def release(self):
+        """
+        Release a reserved slot of the window, the message was not handed to the MQTT client.
+
+        Returns: Nothing
+        """
+        with self._cond:
+            self._reserved -= 1
+            self._cond.notify_all()
+
+    def register(self, future: SpbPublishFuture, mid: int):
+        """
+        Register a message handed to the MQTT client
+
+        Args:
+            future: publish future
+            mid: MQTT message id
+
+        Returns: Nothing
+        """
+        with self._cond:
+            future.mid = mid
+            self._reserved -= 1
+
+            # Delivered before being registered
+            if mid in self._delivered:
+                self._delivered.discard(mid)
+                self.published += 1
+                self._cond.notify_all()
+            else:
+                self._inflight[mid] = future
+                return
+
+        future.set_result(True)
+
+    def delivered(self, mid: int):
+        """
+        Mark a message as delivered ( MQTT client on_publish event )
+
+        Args:
+            mid: MQTT message id
+
+        Returns: Nothing
+        """
+        with self._cond:
+            future = self._inflight.pop(mid, None)
+            if future is None:
+                self._delivered.add(mid)
+                return
+            self.published += 1
+            self._cond.notify_all()
+
+        future.set_result(True)
+
+    def fail(self, future: SpbPublishFuture):
+        """
+        Mark a message as not published
+
+        Args:
+            future: publish future
+
+        Returns: Nothing
+        """
+        with self._cond:
+            self.failed += 1
+        future.set_result(False)
+
+    def fail_all(self):
+        """
+        Mark all the in-flight messages as not published ( i.e. the MQTT client is destroyed )
+
+        Returns: Nothing
+        """
+        with self._cond:
+            futures = list(self._inflight.values())
+            self._inflight = {}
+            self._delivered = set()
+            self.failed += len(futures)
+            self._cond.notify_all()
+
+        for future in futures:
+            future.set_result(False)
+
+    def fail_qos0(self):
+        """
+        Mark the in-flight QoS 0 messages as not published ( i.e. the connection is lost ). The MQTT client
+        discards the unsent QoS 0 messages on reconnection, while QoS>0 messages are retransmitted.
+
+        Returns: Nothing
+        """
+        with self._cond:
+            futures = [f for f in self._inflight.values() if f.qos == 0]
+            if not futures:
+                return
+            self._inflight = {mid: f for mid, f in self._inflight.items() if f.qos != 0}
+            self.failed += len(futures)
+            self._cond.notify_all()
+
+        for future in futures:
+            future.set_result(False)
+
+    def is_full(self) -> bool:
+        with self._cond:
+            return not self._has_space()
+
+    def get_stats(self) -> dict:
+        """
+        Get the publish statistics
+
+        Returns: dictionary with the number of queued, in-flight, published and failed messages
+        """
+        with self._cond:
+            return {
+                "queued": self._queued,
+                "inflight": len(self._inflight),
+                "published": self.published,
+                "failed": self.failed,
+            }
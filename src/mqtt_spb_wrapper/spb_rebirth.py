@@ -0,0 +1,196 @@
+import heapq
+import logging
+import threading
+import time
+from typing import Callable
+
+
+class SpbRebirthScheduler:
+    """
+    Rebirth request scheduler class
+
+    Class used to send the rebirth requests ( NCMD Node Control/Rebirth ) to the edge nodes (EoN) without
+    flooding the broker. The requests are:
+        - Coalesced:    A request for an EoN with a request already pending or in-flight is discarded.
+        - Rate limited: Requests to the same EoN are separated at least min_interval seconds.
+        - Capped:       At most max_inflight requests, fleet-wide, are waiting for the EoN BIRTH message. A
+                        request is completed when the NBIRTH is received, or expires after the timeout.
+
+    Args:
+        send: Function( eon_name ) -> bool, sending the rebirth request to an EoN
+        min_interval: Minimum time between requests to the same EoN, in seconds
+        max_inflight: Maximum number of requests waiting for the BIRTH message, fleet-wide
+        timeout: Time to wait for the BIRTH message of a request, in seconds
+        debug: Enable console debug messages
+    """
+
+    def __init__(self, send: Callable[[str], bool],
+                 min_interval: float = 30.0, max_inflight: int = 10, timeout: float = 10.0,
+                 debug: bool = False):
+
+        if max_inflight < 1:
+            raise ValueError("Maximum number of in-flight requests must be greater than 0")
+
+        self.min_interval = min_interval
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+
+        self._send = send
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self._pending = {}  # Pending requests, eon_name -> time when it can be sent
+        self._heap = []     # Pending requests ordered by time, as ( time, eon_name ), lazy deleted
+        self._inflight = {}     # Requests sent, eon_name -> expiration time
+        self._last_sent = {}    # Time of the last request sent to each EoN
+
+        self._stats = {"requested": 0, "coalesced": 0, "sent": 0, "failed": 0, "completed": 0, "expired": 0}
+
+        self._logger = logging.getLogger("SPB_REBIRTH")
+        self._logger.setLevel(logging.DEBUG if debug else logging.ERROR)
+
+    def start(self):
+        """
+        Start the scheduler thread
+
+        Returns: Nothing
+        """
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+
+        self._thread = threading.Thread(target=self._worker, name="spb-rebirth", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the scheduler thread, the pending requests are kept
+
+        Returns: Nothing
+        """
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+
+        self._thread.join()
+        self._thread = None
+
+    def request(self, eon_name: str) -> bool:
+        """
+        Request a rebirth of an EoN
+
+        Args:
+            eon_name: EoN name
+
+        Returns: True if a new request was scheduled, False if coalesced with a pending or in-flight request
+        """
+        with self._cond:
+            self._stats["requested"] += 1
+
+            if eon_name in self._pending or eon_name in self._inflight:
+                self._stats["coalesced"] += 1
+                return False
+
+            ts = time.monotonic()
+            last = self._last_sent.get(eon_name, None)
+            if last is not None and last + self.min_interval > ts:
+                ts = last + self.min_interval
+
+            self._pending[eon_name] = ts
+            heapq.heappush(self._heap, (ts, eon_name))
+            self._cond.notify_all()
+
+        return True
+
+    def completed(self, eon_name: str):
+        """
+        The BIRTH message of an EoN was received, completing its request
+
+        Args:
+            eon_name: EoN name
+
+        Returns: Nothing
+        """
+        with self._cond:
+            self._pending.pop(eon_name, None)  # Not needed anymore
+            if self._inflight.pop(eon_name, None) is not None:
+                self._stats["completed"] += 1
+                self._cond.notify_all()
+
+    def get_stats(self) -> dict:
+        """
+        Get the scheduler statistics
+
+        Returns: dictionary
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["inflight"] = len(self._inflight)
+        return stats
+
+    def _next_requests(self) -> tuple:
+        """
+        Get the requests to be sent, and the time to wait for the next event. Called with the lock acquired.
+        """
+        ts = time.monotonic()
+
+        # Expire the in-flight requests without BIRTH
+        for eon_name, ts_expire in list(self._inflight.items()):
+            if ts_expire <= ts:
+                self._inflight.pop(eon_name)
+                self._stats["expired"] += 1
+                self._logger.debug("Rebirth request of %s expired" % eon_name)
+
+        requests = []
+        while self._heap and len(self._inflight) < self.max_inflight:
+            ts_send, eon_name = self._heap[0]
+            if self._pending.get(eon_name, None) != ts_send:   # Deleted entry
+                heapq.heappop(self._heap)
+                continue
+            if ts_send > ts:
+                break
+            heapq.heappop(self._heap)
+            self._pending.pop(eon_name)
+            self._inflight[eon_name] = ts + self.timeout
+            self._last_sent[eon_name] = ts
+            requests.append(eon_name)
+
+        # Time to the next event
+        events = list(self._inflight.values())
+        if self._heap and len(self._inflight) < self.max_inflight:
+            events.append(self._heap[0][0])
+        timeout = max(min(events) - ts, 0.001) if events else None
+
+        return requests, timeout
+
+    def _worker(self):
+
+        while True:
+
+            with self._cond:
+                if not self._running:
+                    return
+                requests, timeout = self._next_requests()
+                if not requests:
+                    self._cond.wait(timeout)
+                    continue
+
+            # Send the requests without the lock
+            for eon_name in requests:
+                try:
+                    sent = self._send(eon_name)
+                except Exception as e:
+                    self._logger.error("Error sending rebirth request to %s (%s)" % (eon_name, str(e)))
+                    sent = False
+
+                with self._cond:
+                    if sent:
+                        self._stats["sent"] += 1
+                    else:
+                        self._stats["failed"] += 1
+                        self._inflight.pop(eon_name, None)
@@ -0,0 +1,191 @@
+import threading
+from typing import Callable, Dict, List
+
+from .spb_base import SpbTopic
+
+
+class SpbRoute:
+    """
+    Route of a topic string, resolved once and cached by the topic router.
+
+    The router fills the parsed topic, the message kind and the matching handlers. The remaining fields are
+    filled by the application the first time the route is used, and are reset when the cache is invalidated.
+    """
+
+    __slots__ = ("topic", "kind", "handlers", "group", "accepted", "entity", "handler")
+
+    def __init__(self, topic: SpbTopic, handlers: list):
+        self.topic = topic
+        self.handlers = handlers    # User handlers matching the topic
+
+        # Message kind, without the EoN / EoND prefix ( BIRTH, DATA, DEATH, CMD ) or the message type
+        message_type = topic.message_type
+        if message_type[:1] in ("N", "D") and message_type[1:] in ("BIRTH", "DATA", "DEATH", "CMD"):
+            self.kind = message_type[1:]
+        else:
+            self.kind = message_type
+
+        self.group = None       # Application of the group, if routed to another group
+        self.accepted = None    # Message accepted by the application filters, None if not resolved yet
+        self.entity = None      # Entity ( EoN or EoND ) of the topic
+        self.handler = None     # Message handler of the kind
+
+
+class _TrieNode:
+
+    __slots__ = ("children", "handlers", "handlers_multi")
+
+    def __init__(self):
+        self.children: Dict[str, _TrieNode] = {}
+        self.handlers = []          # Handlers of the filters ending at this level
+        self.handlers_multi = []    # Handlers of the filters ending with "#" at this level
+
+
+class SpbTopicRouter:
+    """
+    Topic router class
+
+    Resolve the topic strings of the received messages into routes ( SpbRoute ), cached per topic string, so
+    the messages of a known topic are routed with a single dictionary lookup, without parsing the topic.
+
+    User handlers are registered with MQTT topic filters ( "+" and "#" wildcards ), stored in a trie of topic
+    levels. The trie is only walked the first time a topic is received, the matching handlers are part of
+    the cached route.
+
+    Args:
+        max_routes: Maximum number of cached routes, the cache is cleared when it is full
+    """
+
+    def __init__(self, max_routes: int = 100000):
+
+        self.max_routes = max_routes
+
+        self._root = _TrieNode()
+        self._routes: Dict[str, SpbRoute] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._routes)
+
+    def invalidate(self):
+        """
+        Clear the cached routes, they are resolved again on the next message
+
+        Returns: Nothing
+        """
+        self._routes = {}
+
+    def add_handler(self, topic_filter: str, handler: Callable):
+        """
+        Register a handler for the topics matching a MQTT topic filter
+
+        Args:
+            topic_filter: MQTT topic filter, "+" matches a single level and "#" the remaining levels
+            handler: handler reference
+
+        Returns: Nothing
+        """
+        levels = topic_filter.split("/")
+        if "#" in levels[:-1]:
+            raise ValueError("Invalid topic filter %s, '#' must be the last level" % topic_filter)
+
+        with self._lock:
+            node = self._root
+            for level in levels:
+                if level == "#":
+                    node.handlers_multi.append(handler)
+                    break
+                node = node.children.setdefault(level, _TrieNode())
+            else:
+                node.handlers.append(handler)
+
+            self.invalidate()
+
+    def remove_handler(self, topic_filter: str, handler: Callable) -> bool:
+        """
+        Remove a handler registered with add_handler()
+
+        Args:
+            topic_filter: MQTT topic filter
+            handler: handler reference
+
+        Returns: True if removed
+        """
+        with self._lock:
+            node = self._root
+            handlers = None
+            for level in topic_filter.split("/"):
+                if level == "#":
+                    handlers = node.handlers_multi
+                    break
+                node = node.children.get(level, None)
+                if node is None:
+                    return False
+            else:
+                handlers = node.handlers
+
+            if handler not in handlers:
+                return False
+            handlers.remove(handler)
+
+            self.invalidate()
+
+        return True
+
+    def match(self, topic_str: str) -> List[Callable]:
+        """
+        Get the handlers matching a topic string, walking the trie
+
+        Args:
+            topic_str: topic string
+
+        Returns: list of handlers
+        """
+        res = []
+        self._match(self._root, topic_str.split("/"), 0, res)
+        return res
+
+    def _match(self, node: _TrieNode, levels: list, i: int, res: list):
+
+        res.extend(node.handlers_multi)     # "#" also matches the parent level
+
+        if i == len(levels):
+            res.extend(node.handlers)
+            return
+
+        child = node.children.get(levels[i], None)
+        if child is not None:
+            self._match(child, levels, i + 1, res)
+
+        child = node.children.get("+", None)
+        if child is not None:
+            self._match(child, levels, i + 1, res)
+
+    def resolve(self, topic_str: str) -> SpbRoute:
+        """
+        Get the route of a topic string, from the cache or resolved if not cached
+
+        Args:
+            topic_str: topic string
+
+        Returns: SpbRoute, None if the topic is not a valid spB topic
+        """
+
+        route = self._routes.get(topic_str, None)
+        if route is not None:
+            return route
+
+        try:
+            topic = SpbTopic(topic_str)
+        except ValueError:
+            return None
+
+        with self._lock:
+            route = SpbRoute(topic, self.match(topic_str))
+
+        routes = self._routes
+        if len(routes) >= self.max_routes:
+            routes = self._routes = {}
+        routes[topic_str] = route
+
+        return route
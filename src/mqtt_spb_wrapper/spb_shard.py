@@ -0,0 +1,83 @@
+import hashlib
+from bisect import bisect
+from typing import Dict, List
+
+
+class SpbHashRing:
+    """
+    Consistent hash ring class
+
+    Class used to partition the spB edge nodes (EoN) of a group between several cooperating application
+    members. Each EoN is assigned to a single member, and when members join or leave the group only the
+    edge nodes of the affected members are reassigned.
+
+    Args:
+        members: List of member names ( application instances ) in the ring
+        replicas: Number of virtual nodes per member, used to balance the partitions.
+    """
+
+    def __init__(self, members: List[str] = None, replicas: int = 64):
+
+        self.replicas = replicas
+
+        self._members = []
+        self._ring_keys = []    # Sorted list of virtual node hashes
+        self._ring_members = []     # Member of each virtual node, same order as _ring_keys
+        self._owners: Dict[str, str] = {}   # Cache of resolved owners, eon_name -> member
+
+        self.set_members(members or [])
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        """
+        Stable hash function ( the same across processes and hosts, unlike python hash() )
+        """
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    @property
+    def members(self) -> List[str]:
+        return list(self._members)
+
+    def set_members(self, members: List[str]):
+        """
+        Set the list of members and rebuild the ring.
+
+        Args:
+            members: List of member names
+
+        Returns: Nothing
+        """
+
+        ring = []
+        for member in sorted(set(members)):
+            for i in range(self.replicas):
+                ring.append((self._hash("%s#%d" % (member, i)), member))
+        ring.sort()
+
+        self._members = sorted(set(members))
+        self._ring_keys = [k for k, _ in ring]
+        self._ring_members = [m for _, m in ring]
+        self._owners = {}
+
+    def get_owner(self, key: str) -> str:
+        """
+        Get the member owning a key ( EoN name )
+
+        Args:
+            key: key to be resolved
+
+        Returns: Member name, or None if the ring is empty
+        """
+
+        owner = self._owners.get(key, None)
+        if owner is not None:
+            return owner
+
+        if not self._ring_keys:
+            return None
+
+        idx = bisect(self._ring_keys, self._hash(key)) % len(self._ring_keys)
+        owner = self._ring_members[idx]
+        self._owners[key] = owner
+
+        return owner
@@ -0,0 +1,377 @@
+import logging
+import struct
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:     # Python < 3.8
+    shared_memory = None
+
+_MAGIC = b"SPBLVT01"
+_HEADER = struct.Struct("<8sIIII")  # magic, slots, directory size, used slots, directory length
+_HEADER_SIZE = 64
+_SEQ = struct.Struct("<Q")          # Slot sequence, odd while the slot is being written
+_BODY = struct.Struct("<B7x8sq")    # Value type, value bytes, timestamp
+_SLOT_SIZE = 32
+_ENTRY = struct.Struct("<HI")       # Directory entry: key length, slot index, followed by the key
+_INT64 = struct.Struct("<q")
+_DOUBLE = struct.Struct("<d")
+_USED_OFFSET = 16                   # Header offset of the used slots and directory length
+
+TYPE_EMPTY = 0
+TYPE_FLOAT = 1
+TYPE_INT = 2
+TYPE_BOOL = 3
+
+
+def _key(group: str, eon: str, eond: Optional[str], metric: str) -> bytes:
+    return "\0".join((group, eon, eond or "", metric)).encode("utf-8")
+
+
+def _attach(name: str):
+    """
+    Attach to an existing shared memory segment, unregistered from the resource tracker of this process
+    ( it would be removed when the process exits )
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)     # Python >= 3.13
+    except TypeError:
+        pass
+
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SpbSharedTable:
+    """
+    Shared-memory last value table class
+
+    Publish the last values of numeric and boolean metrics into a shared memory segment
+    ( multiprocessing.shared_memory ), so other processes of the host can read the fleet values without their
+    own MQTT connection ( see SpbSharedTableReader ).
+
+    Each ( group, EoN, EoND, metric ) is assigned a stable slot the first time it is written, and the slot is
+    registered in an append-only directory ( key -> slot ) stored in the same segment. The slots are
+    protected by a seqlock: the slot sequence is odd while the value is being written, so the readers retry
+    when the sequence is odd or changes during the read. There is a single writer, the readers never block it.
+
+    Args:
+        name: shared memory segment name, None for a random name ( see name property )
+        slots: maximum number of metrics
+        directory_size: size of the directory in bytes, by default 64 bytes per slot
+        debug: Enable console debug messages
+    """
+
+    def __init__(self, name: str = None, slots: int = 65536, directory_size: int = None, debug: bool = False):
+
+        if shared_memory is None:
+            raise ImportError("The shared memory table requires Python 3.8 or newer")
+
+        self.slots = slots
+        self.directory_size = directory_size or slots * 64
+
+        self._directory_offset = _HEADER_SIZE + slots * _SLOT_SIZE
+        self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                               size=self._directory_offset + self.directory_size)
+        self._buf = self._shm.buf
+
+        _HEADER.pack_into(self._buf, 0, _MAGIC, slots, self.directory_size, 0, 0)
+
+        self._slots: Dict[tuple, int] = {}  # ( group, eon, eond, metric ) -> slot offset
+        self._used = 0
+        self._directory_length = 0
+        self._lock = threading.Lock()
+
+        self._stats = {"written": 0, "discarded": 0}
+
+        self._logger = logging.getLogger("SPB_SHAREDMEM")
+        self._logger.setLevel(logging.DEBUG if debug else logging.ERROR)
+
+    @property
+    def name(self) -> str:
+        """ Shared memory segment name, used by the readers to attach to the table """
+        return self._shm.name
+
+    def __len__(self):
+        return self._used
+
+    def get_stats(self) -> dict:
+        """
+        Get the writer statistics
+
+        Returns: dictionary with the number of values written, the values discarded ( unsupported types or
+                 table full ) and the slots used
+        """
+        stats = dict(self._stats)
+        stats["slots"] = self._used
+        return stats
+
+    def _new_slot(self, key: tuple) -> Optional[int]:
+
+        key_bytes = _key(*key)
+        entry_size = _ENTRY.size + len(key_bytes)
+
+        if self._used >= self.slots or self._directory_length + entry_size > self.directory_size:
+            self._logger.error("Shared table full, metric %s discarded" % "/".join(k or "" for k in key))
+            self._slots[key] = None     # Do not retry on every update
+            return None
+
+        slot = self._used
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+
+        # Register the slot in the directory, then publish the new lengths
+        entry_offset = self._directory_offset + self._directory_length
+        _ENTRY.pack_into(self._buf, entry_offset, len(key_bytes), slot)
+        self._buf[entry_offset + _ENTRY.size:entry_offset + entry_size] = key_bytes
+
+        self._used += 1
+        self._directory_length += entry_size
+        struct.pack_into("<II", self._buf, _USED_OFFSET, self._used, self._directory_length)
+
+        self._slots[key] = offset
+        return offset
+
+    def write(self, group: str, eon: str, eond: Optional[str], metric: str, value, timestamp: int = None) -> bool:
+        """
+        Write the last value of a metric
+
+        Args:
+            group: spB group name
+            eon: EoN name
+            eond: EoND name, None for the edge node metrics
+            metric: metric name
+            value: numeric or boolean value. For value lists, the last value is written.
+            timestamp: value timestamp in milliseconds, None for the current time
+
+        Returns: True if written, False if the value type is not supported or the table is full
+        """
+
+        if isinstance(value, list):     # Value lists, with the timestamps of each value
+            if not value:
+                return False
+            if isinstance(timestamp, list):
+                timestamp = timestamp[-1]
+            value = value[-1]
+
+        if isinstance(value, bool):
+            value_type, value_bytes = TYPE_BOOL, _INT64.pack(int(value))
+        elif isinstance(value, int):
+            if not -2 ** 63 <= value < 2 ** 63:
+                value_type, value_bytes = TYPE_FLOAT, _DOUBLE.pack(float(value))
+            else:
+                value_type, value_bytes = TYPE_INT, _INT64.pack(value)
+        elif isinstance(value, float):
+            value_type, value_bytes = TYPE_FLOAT, _DOUBLE.pack(value)
+        else:
+            self._stats["discarded"] += 1
+            return False
+
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+
+        key = (group, eon, eond, metric)
+
+        with self._lock:
+
+            if self._shm is None:   # Closed
+                return False
+
+            offset = self._slots.get(key, -1)
+            if offset == -1:
+                offset = self._new_slot(key)
+            if offset is None:
+                self._stats["discarded"] += 1
+                return False
+
+            # Seqlock write - odd sequence while the slot is updated
+            buf = self._buf
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            _SEQ.pack_into(buf, offset, seq + 1)
+            _BODY.pack_into(buf, offset + _SEQ.size, value_type, value_bytes, int(timestamp))
+            _SEQ.pack_into(buf, offset, seq + 2)
+
+            self._stats["written"] += 1
+
+        return True
+
+    def close(self):
+        """
+        Close and remove the shared memory segment. The attached readers keep their mapping until they close.
+
+        Returns: Nothing
+        """
+        with self._lock:
+            if self._shm is None:
+                return
+            self._buf = None
+            self._shm.close()
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = None
+
+
+class SpbSharedTableReader:
+    """
+    Shared-memory last value table reader class
+
+    Attach to a table published by another process ( see SpbSharedTable ) and read the metric values directly
+    from the shared memory, without copies of the table. The directory is loaded incrementally, only the
+    entries added since the last lookup are parsed.
+
+    Example:
+        table = SpbSharedTableReader("spb_fleet")
+        value, timestamp = table.read("Group1", "Line1", "Device1", "Temperature")
+
+    Args:
+        name: shared memory segment name
+        retries: maximum number of attempts of a consistent read, while the slot is being written
+    """
+
+    def __init__(self, name: str, retries: int = 1000):
+
+        if shared_memory is None:
+            raise ImportError("The shared memory table requires Python 3.8 or newer")
+
+        self.retries = retries
+
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+
+        magic, self.slots, self.directory_size, _, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC:
+            self._shm.close()
+            raise ValueError("Shared memory segment %s is not a spB shared table" % name)
+
+        self._directory_offset = _HEADER_SIZE + self.slots * _SLOT_SIZE
+        self._directory_length = 0  # Directory length already loaded
+        self._slots: Dict[tuple, int] = {}  # ( group, eon, eond, metric ) -> slot index
+
+    def __len__(self):
+        return struct.unpack_from("<I", self._buf, _USED_OFFSET)[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _load_directory(self):
+
+        buf = self._buf
+        length = struct.unpack_from("<I", buf, _USED_OFFSET + 4)[0]
+        position = self._directory_length
+
+        while position < length:
+            offset = self._directory_offset + position
+            key_length, slot = _ENTRY.unpack_from(buf, offset)
+            group, eon, eond, metric = bytes(buf[offset + _ENTRY.size:offset + _ENTRY.size + key_length]) \
+                .decode("utf-8").split("\0", 3)
+            self._slots[(group, eon, eond or None, metric)] = slot
+            position += _ENTRY.size + key_length
+
+        self._directory_length = position
+
+    def get_slot(self, group: str, eon: str, eond: Optional[str], metric: str) -> Optional[int]:
+        """
+        Get the slot index of a metric, stable while the table exists
+
+        Args:
+            group: spB group name
+            eon: EoN name
+            eond: EoND name, None for the edge node metrics
+            metric: metric name
+
+        Returns: slot index, None if the metric is not in the table
+        """
+        key = (group, eon, eond, metric)
+        slot = self._slots.get(key, None)
+        if slot is None:
+            self._load_directory()
+            slot = self._slots.get(key, None)
+        return slot
+
+    def read_slot(self, slot: int) -> Optional[tuple]:
+        """
+        Read the value of a slot, consistent with a single write
+
+        Args:
+            slot: slot index
+
+        Returns: tuple ( value, timestamp ), None if the slot is empty or a consistent read was not possible
+        """
+        buf = self._buf
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+
+        for _ in range(self.retries):
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            if seq & 1:     # Write in progress
+                continue
+            value_type, value_bytes, timestamp = _BODY.unpack_from(buf, offset + _SEQ.size)
+            if _SEQ.unpack_from(buf, offset)[0] != seq:
+                continue
+
+            if value_type == TYPE_FLOAT:
+                return _DOUBLE.unpack(value_bytes)[0], timestamp
+            elif value_type == TYPE_INT:
+                return _INT64.unpack(value_bytes)[0], timestamp
+            elif value_type == TYPE_BOOL:
+                return bool(_INT64.unpack(value_bytes)[0]), timestamp
+            return None
+
+        return None
+
+    def read(self, group: str, eon: str, eond: Optional[str], metric: str) -> Optional[tuple]:
+        """
+        Read the last value of a metric
+
+        Args:
+            group: spB group name
+            eon: EoN name
+            eond: EoND name, None for the edge node metrics
+            metric: metric name
+
+        Returns: tuple ( value, timestamp ), None if the metric is not in the table
+        """
+        slot = self.get_slot(group, eon, eond, metric)
+        if slot is None:
+            return None
+        return self.read_slot(slot)
+
+    def keys(self) -> list:
+        """
+        Get the metrics of the table
+
+        Returns: list of ( group, eon, eond, metric )
+        """
+        self._load_directory()
+        return list(self._slots.keys())
+
+    def items(self) -> Iterator[tuple]:
+        """
+        Read all the metrics of the table
+
+        Returns: generator of ( ( group, eon, eond, metric ), ( value, timestamp ) )
+        """
+        self._load_directory()
+        for key, slot in list(self._slots.items()):
+            value = self.read_slot(slot)
+            if value is not None:
+                yield key, value
+
+    def close(self):
+        """
+        Detach from the shared memory segment
+
+        Returns: Nothing
+        """
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm = None
@@ -0,0 +1,81 @@
+import base64
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+
+SNAPSHOT_MAGIC = b"SPBSNAP2"    # File header, identifies the snapshot format version
+
+
+def _json_default(value):
+    # Metric values without a JSON type, tagged to be restored with the type decoded from the spB payloads
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, datetime):     # DateTime, as epoch milliseconds
+        return {"__datetime__": int(round(value.timestamp() * 1000))}
+    if isinstance(value, uuid.UUID):
+        return {"__uuid__": str(value)}
+    return str(value)
+
+
+def _json_object_hook(obj: dict):
+    if len(obj) == 1:
+        if "__bytes__" in obj:
+            return base64.b64decode(obj["__bytes__"])
+        if "__datetime__" in obj:
+            return datetime.fromtimestamp(obj["__datetime__"] / 1000)
+        if "__uuid__" in obj:
+            return uuid.UUID(obj["__uuid__"])
+    return obj
+
+
+def write_snapshot(path: str, state: dict):
+    """
+    Write a state snapshot to a file. The file is replaced atomically, so a crash while writing never leaves
+    a truncated snapshot.
+
+    Args:
+        path: file path
+        state: state dictionary ( JSON types, bytes, datetime and UUID values )
+
+    Returns: Nothing
+    """
+
+    data = SNAPSHOT_MAGIC + zlib.compress(
+        json.dumps(state, default=_json_default, separators=(",", ":")).encode("utf-8"), 1)
+
+    path_tmp = path + ".tmp"
+    with open(path_tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(path_tmp, path)
+
+
+def read_snapshot(path: str) -> dict:
+    """
+    Read a state snapshot from a file. The snapshot is stored as compressed JSON, the lists are restored as
+    lists ( not tuples ).
+
+    Args:
+        path: file path
+
+    Returns: state dictionary, None if the file does not exist
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if not data.startswith(SNAPSHOT_MAGIC):
+        raise ValueError("Not a valid snapshot file: %s" % path)
+
+    state = json.loads(zlib.decompress(data[len(SNAPSHOT_MAGIC):]).decode("utf-8"), object_hook=_json_object_hook)
+    if not isinstance(state, dict):
+        raise ValueError("Not a valid snapshot file: %s" % path)
+
+    return state
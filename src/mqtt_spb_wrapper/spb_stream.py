@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Callable, List
+
+SpbChange = namedtuple("SpbChange", ("group", "eon", "eond", "metric", "value", "timestamp", "seq"))
+SpbChange.__doc__ = "Metric update record, eond is None for the edge node metrics and seq is the spB message sequence"
+
+
+class SpbChangeStream:
+    """
+    Change data capture stream class
+
+    Queue of flat metric update records ( SpbChange ), filled by the application as the messages are received
+    and consumed in batches by a downstream sink. If the consumer is slower than the updates, the oldest
+    records are discarded once the queue is full ( see dropped ).
+
+    Iterating the stream yields batches ( lists of records ) until it is closed, records() yields single
+    records, and the stream can also be consumed with "async for".
+
+    Args:
+        batch_size: Maximum number of records per batch
+        window: Time to wait for a full batch once a record is available, in seconds. If 0, the batches are
+                returned as soon as records are available.
+        max_queue: Maximum number of queued records
+        on_close: Function( stream ) called when the stream is closed
+    """
+
+    ASYNC_POLL_INTERVAL = 0.5  # Maximum time the async iterator waits for records in an executor thread, seconds
+
+    def __init__(self, batch_size: int = 1000, window: float = 0.0, max_queue: int = 100000,
+                 on_close: Callable = None):
+
+        if batch_size < 1:
+            raise ValueError("The batch size must be greater than 0")
+
+        self.batch_size = batch_size
+        self.window = window
+        self.max_queue = max_queue
+
+        self.count = 0      # Number of records added
+        self.dropped = 0    # Number of records discarded, queue full
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._on_close = on_close
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def close(self):
+        """
+        Close the stream, the queued records can still be consumed
+
+        Returns: Nothing
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        if self._on_close is not None:
+            self._on_close(self)
+
+    def put(self, record: SpbChange):
+        """
+        Add a record to the stream
+
+        Args:
+            record: update record
+
+        Returns: Nothing
+        """
+        with self._cond:
+            if self._closed:
+                return
+            queue = self._queue
+            queue.append(record)
+            self.count += 1
+            if len(queue) > self.max_queue:
+                queue.popleft()
+                self.dropped += 1
+            if len(queue) == 1 or len(queue) == self.batch_size:   # Wake up the consumer
+                self._cond.notify()
+
+    def get_batch(self, timeout: float = None) -> List[SpbChange]:
+        """
+        Get the next batch of records
+
+        Args:
+            timeout: Maximum time to wait for a record in seconds, None to wait forever
+
+        Returns: list of records, empty on timeout or if the stream is closed and empty
+        """
+        with self._cond:
+            if not self._wait_batch(timeout):
+                return []
+            return self._pop_batch()
+
+    def _wait_batch(self, timeout: float = None) -> bool:
+        """
+        Wait for the first record, and for a full batch during the batch window. The condition lock must be held.
+
+        Returns: True if there are records available
+        """
+        queue = self._queue
+
+        # Wait for the first record
+        if not queue:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not queue:
+                if self._closed:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+        # Wait for a full batch
+        if self.window > 0 and len(queue) < self.batch_size:
+            deadline = time.monotonic() + self.window
+            while len(queue) < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        return bool(queue)
+
+    def _pop_batch(self) -> List[SpbChange]:
+        queue = self._queue
+        return [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+
+    def _wait_ready(self, timeout: float) -> bool:
+        with self._cond:
+            return self._wait_batch(timeout)
+
+    def __iter__(self):
+        while True:
+            batch = self.get_batch()
+            if not batch:
+                return
+            yield batch
+
+    def records(self):
+        """
+        Generator of single records, until the stream is closed
+
+        Returns: generator of SpbChange
+        """
+        for batch in self:
+            yield from batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> List[SpbChange]:
+
+        # The records are only waited for in the executor thread, with a limited timeout, and taken from the
+        # queue in the event loop. A cancelled consumer does not lose a batch, nor leave a thread blocked.
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self._wait_ready, self.ASYNC_POLL_INTERVAL)
+            with self._cond:
+                if self._queue:
+                    return self._pop_batch()
+                if self._closed:
+                    raise StopAsyncIteration
@@ -0,0 +1,171 @@
+from fnmatch import fnmatchcase
+from typing import Set
+
+from .spb_base import SpbTopic
+
+
+class SpbSubscriptionFilter:
+    """
+    Subscription filter class
+
+    Compute the MQTT topic filters for a selection of edge nodes (EoN), devices (EoND), message types and
+    glob patterns of a spB group, so the application only receives the messages it is interested in.
+
+    Edge nodes and devices are subscribed with topic filters, so the broker only sends their messages. Glob
+    patterns ( i.e. "Line1-*" for EoN names or "Line1-*/Pump*" for EoN/EoND names ) can not be expressed as
+    MQTT topic filters, so all the nodes of the message types are subscribed and the messages are filtered by
+    the application with match(), before decoding the payloads.
+
+    Args:
+        namespace: spB namespace
+        group_name: spB group name
+        edge_nodes: List of EoN names, None for all the edge nodes
+        devices: List of devices as ( EoN name, EoND name ), None for all the devices
+        message_types: List of message types, None for all the BIRTH, DATA and DEATH messages
+        patterns: List of glob patterns of EoN names or EoN/EoND names
+    """
+
+    MESSAGE_TYPES = ("NBIRTH", "NDEATH", "NDATA", "DBIRTH", "DDEATH", "DDATA")
+    SEQUENCE_TYPES = ("NBIRTH", "NDATA", "DBIRTH", "DDEATH", "DDATA")  # Message types with the EoN sequence number
+
+    def __init__(self, namespace: str, group_name: str, edge_nodes: list = None, devices: list = None,
+                 message_types: list = None, patterns: list = None):
+
+        self.namespace = namespace
+        self.group_name = group_name
+
+        # All the nodes if no node selection is provided
+        self.all_nodes = edge_nodes is None and devices is None and patterns is None
+
+        self.edge_nodes: Set[str] = set(edge_nodes or [])
+        self.devices: Set[tuple] = set(tuple(d) for d in devices or [])
+        self.message_types = tuple(message_types or self.MESSAGE_TYPES)
+        self.patterns = list(patterns or [])
+
+        self._device_nodes = {eon for eon, _ in self.devices}  # EoNs with subscribed devices
+
+    @property
+    def client_filter(self) -> bool:
+        """
+        True if the messages must be filtered by the application with match()
+        """
+        return bool(self.patterns)
+
+    def covers(self, eon_name: str, eond_name: str = None) -> bool:
+        """
+        Check if the messages of an entity are already subscribed
+
+        Args:
+            eon_name: EoN name
+            eond_name: EoND name, None for the EoN
+
+        Returns: True if subscribed
+        """
+        if self.all_nodes or eon_name in self.edge_nodes:
+            return True
+        if eond_name is not None and (eon_name, eond_name) in self.devices:
+            return True
+        return self._match_pattern(eon_name, eond_name)
+
+    def covers_sequence(self, eon_name: str) -> bool:
+        """
+        Check if all the sequenced messages of an edge node are subscribed. The spB sequence number is shared by
+        the messages of the EoN and all its devices, so it can only be checked on the full message stream.
+
+        Args:
+            eon_name: EoN name
+
+        Returns: True if all the messages with sequence numbers of the EoN are subscribed
+        """
+        if any(t not in self.message_types for t in self.SEQUENCE_TYPES):
+            return False
+        if self.all_nodes or eon_name in self.edge_nodes:
+            return True
+        return any("/" not in pattern and fnmatchcase(eon_name, pattern) for pattern in self.patterns)
+
+    def add_edge_node(self, eon_name: str) -> bool:
+        """
+        Add an edge node, and its devices, to the subscription
+
+        Args:
+            eon_name: EoN name
+
+        Returns: True if the subscription changed
+        """
+        if self.covers(eon_name):
+            return False
+        self.edge_nodes.add(eon_name)
+        return True
+
+    def add_device(self, eon_name: str, eond_name: str) -> bool:
+        """
+        Add a device to the subscription
+
+        Args:
+            eon_name: EoN name
+            eond_name: EoND name
+
+        Returns: True if the subscription changed
+        """
+        if self.covers(eon_name, eond_name):
+            return False
+        self.devices.add((eon_name, eond_name))
+        self._device_nodes.add(eon_name)
+        return True
+
+    def topics(self) -> Set[str]:
+        """
+        Get the MQTT topic filters of the subscription
+
+        Returns: set of topic filters
+        """
+
+        prefix = "%s/%s/" % (self.namespace, self.group_name)
+
+        if self.all_nodes or self.patterns:
+            return {prefix + "%s/#" % t for t in self.message_types}
+
+        topics = set()
+        for eon_name in self.edge_nodes:
+            topics.update(prefix + "%s/%s/#" % (t, eon_name) for t in self.message_types)
+
+        for eon_name, eond_name in self.devices:
+            if eon_name in self.edge_nodes:
+                continue
+            topics.update(prefix + "%s/%s/%s" % (t, eon_name, eond_name)
+                          for t in self.message_types if t.startswith("D"))
+            # Edge node BIRTH and DEATH, the devices depend on them
+            topics.update(prefix + "%s/%s" % (t, eon_name)
+                          for t in self.message_types if t in ("NBIRTH", "NDEATH"))
+
+        return topics
+
+    def _match_pattern(self, eon_name: str, eond_name: str = None) -> bool:
+        for pattern in self.patterns:
+            if "/" in pattern:
+                if eond_name is not None and fnmatchcase("%s/%s" % (eon_name, eond_name), pattern):
+                    return True
+            elif fnmatchcase(eon_name, pattern):
+                return True
+        return False
+
+    def match(self, topic: SpbTopic) -> bool:
+        """
+        Check if a received message is part of the subscription
+
+        Args:
+            topic: message topic
+
+        Returns: True if the message is part of the subscription
+        """
+
+        if topic.message_type not in self.message_types:
+            return False
+
+        eon_name = topic.eon_name
+        eond_name = topic.eon_device_name
+
+        if eond_name is None and eon_name in self._device_nodes and topic.message_type in ("NBIRTH", "NDEATH"):
+            return True
+
+        return self.covers(eon_name, eond_name)
@@ -0,0 +1,133 @@
+import itertools
+import threading
+from fnmatch import fnmatchcase
+from typing import Callable, Dict
+
+
+def _is_pattern(value: str) -> bool:
+    return value is not None and any(c in value for c in "*?[")
+
+
+class SpbMetricWatch:
+    """
+    Metric callbacks registry class
+
+    Register callbacks for metric patterns ( EoN name, EoND name, metric name ), where each field can be a glob
+    pattern ( i.e. ("Line1", "*", "Temperature") ). The registrations are indexed by metric name, so the
+    metrics not watched by any registration are discarded with a single dictionary lookup. Only the
+    registrations with a metric name pattern are matched one by one, and their results are cached.
+
+    The registrations are replaced, not modified, so the matching can run without locks while callbacks are
+    added or removed from other threads.
+
+    Args:
+        max_cache: Maximum number of cached results of the metric name patterns
+    """
+
+    def __init__(self, max_cache: int = 100000):
+
+        self.max_cache = max_cache
+
+        self._by_name: Dict[str, tuple] = {}    # Metric name -> registrations ( id, eon, eond, metric, callback )
+        self._patterns = ()     # Registrations with a metric name pattern
+        self._cache = {}        # ( eon, eond, metric ) -> callbacks, results including the metric name patterns
+
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(r) for r in self._by_name.values()) + len(self._patterns)
+
+    def add(self, eon_name: str, eond_name: str, metric_name: str, callback: Callable) -> int:
+        """
+        Register a callback for a metric pattern
+
+        Args:
+            eon_name: EoN name or glob pattern
+            eond_name: EoND name or glob pattern, None for the metrics of the edge nodes
+            metric_name: metric name or glob pattern
+            callback: callback reference
+
+        Returns: registration id
+        """
+        with self._lock:
+            registration = (next(self._ids), eon_name, eond_name, metric_name, callback)
+            if _is_pattern(metric_name):
+                self._patterns = self._patterns + (registration,)
+            else:
+                by_name = dict(self._by_name)
+                by_name[metric_name] = by_name.get(metric_name, ()) + (registration,)
+                self._by_name = by_name
+            self._cache = {}
+        return registration[0]
+
+    def remove(self, registration_id: int) -> bool:
+        """
+        Remove a registration
+
+        Args:
+            registration_id: id returned by add()
+
+        Returns: True if removed
+        """
+        with self._lock:
+            for i, registration in enumerate(self._patterns):
+                if registration[0] == registration_id:
+                    self._patterns = self._patterns[:i] + self._patterns[i + 1:]
+                    self._cache = {}
+                    return True
+
+            for name, registrations in self._by_name.items():
+                for registration in registrations:
+                    if registration[0] == registration_id:
+                        by_name = dict(self._by_name)
+                        by_name[name] = tuple(r for r in registrations if r is not registration)
+                        if not by_name[name]:
+                            del by_name[name]
+                        self._by_name = by_name
+                        self._cache = {}
+                        return True
+
+        return False
+
+    @staticmethod
+    def _match_entity(registration: tuple, eon_name: str, eond_name: str) -> bool:
+        _, eon, eond, _, _ = registration
+        if eond is None or eond_name is None:
+            if eond is not None or eond_name is not None:
+                return False
+        elif not fnmatchcase(eond_name, eond):
+            return False
+        return fnmatchcase(eon_name, eon)
+
+    def match(self, eon_name: str, eond_name: str, metric_name: str) -> tuple:
+        """
+        Get the callbacks watching a metric
+
+        Args:
+            eon_name: EoN name
+            eond_name: EoND name, None for the edge node metrics
+            metric_name: metric name
+
+        Returns: tuple of callbacks
+        """
+
+        registrations = self._by_name.get(metric_name, ())
+
+        if not self._patterns:
+            if not registrations:
+                return ()   # Metric not watched
+            return tuple(r[4] for r in registrations if self._match_entity(r, eon_name, eond_name))
+
+        key = (eon_name, eond_name, metric_name)
+        cache = self._cache
+        callbacks = cache.get(key, None)
+        if callbacks is None:
+            callbacks = tuple(r[4] for r in registrations if self._match_entity(r, eon_name, eond_name)) \
+                + tuple(r[4] for r in self._patterns
+                        if fnmatchcase(metric_name, r[3]) and self._match_entity(r, eon_name, eond_name))
+            if len(cache) >= self.max_cache:
+                cache.clear()
+            cache[key] = callbacks
+
+        return callbacks
@@ -445,6 +445,140 @@ class TestMqttSpbEntity(unittest.TestCase):
         # Assert that the payload argument is 'ONLINE'
         self.assertEqual(payload_arg, 'ONLINE')
 
+    def test_connect_mqtt_v5(self):
+        """Test connecting to the MQTT broker with MQTT v5.0 protocol."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        self.mock_mqtt_client.is_connected.return_value = True
+
+        connected = entity.connect(host='test.mqtt.broker', port=1883, mqtt_v5=True)
+        self.assertTrue(connected)
+        _, kwargs = self.mock_mqtt_client_class.call_args
+        self.assertEqual(kwargs.get("protocol"), 5)
+
+    def test_mqtt_v5_subscribe_no_local(self):
+        """Test that MQTT v5.0 subscriptions set the no-local flag."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt_v5 = True
+        mock_client = MagicMock()
+        entity._mqtt_on_connect(mock_client, None, None, 0, None)
+
+        for args, kwargs in mock_client.subscribe.call_args_list:
+            self.assertTrue(kwargs["options"].noLocal)
+
+    def test_mqtt_v5_topic_alias(self):
+        """Test that MQTT v5.0 topic aliases are used after the first publish."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt = self.mock_mqtt_client
+        entity._mqtt.is_connected.return_value = True
+        entity._mqtt_v5 = True
+
+        properties = MagicMock()
+        properties.TopicAliasMaximum = 10
+        entity._mqtt_on_connect(MagicMock(), None, None, 0, properties)
+
+        entity.data.set_value(name="temperature", value=25.5)
+        entity.publish_data(send_all=True)
+        args, kwargs = self.mock_mqtt_client.publish.call_args
+        self.assertEqual(args[0], "spBv1.0/Group1/NDATA/EoN1")
+        self.assertEqual(kwargs["properties"].TopicAlias, 1)
+
+        entity.publish_data(send_all=True)
+        args, kwargs = self.mock_mqtt_client.publish.call_args
+        self.assertEqual(args[0], "")
+        self.assertEqual(kwargs["properties"].TopicAlias, 1)
+
+        # QoS>0 messages always send the full topic
+        entity.publish_data(send_all=True, qos=1)
+        args, kwargs = self.mock_mqtt_client.publish.call_args
+        self.assertEqual(args[0], "spBv1.0/Group1/NDATA/EoN1")
+
+        # Aliases are reset on a new connection
+        entity._mqtt_on_connect(MagicMock(), None, None, 0, properties)
+        entity.publish_data(send_all=True)
+        args, kwargs = self.mock_mqtt_client.publish.call_args
+        self.assertEqual(args[0], "spBv1.0/Group1/NDATA/EoN1")
+
+    def test_mqtt_v5_message_expiry(self):
+        """Test that the DATA message expiry interval is set on MQTT v5.0."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt = self.mock_mqtt_client
+        entity._mqtt.is_connected.return_value = True
+        entity._mqtt_v5 = True
+
+        entity.data.set_value(name="temperature", value=25.5)
+        entity.publish_data(message_expiry=30)
+        args, kwargs = self.mock_mqtt_client.publish.call_args
+        self.assertEqual(kwargs["properties"].MessageExpiryInterval, 30)
+        self.assertFalse(hasattr(kwargs["properties"], "TopicAlias"))
+
+    def test_mqtt_v5_skip_loopback_check(self):
+        """Test that MQTT v5.0 does not rely on the loopback topic check."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt_v5 = True
+        entity._loopback_topic = 'spBv1.0/Group1/STATE/SCADA'
+        mock_msg = MagicMock()
+        mock_msg.topic = 'spBv1.0/Group1/STATE/SCADA'
+        mock_msg.payload = b'ONLINE'
+        entity.on_message = MagicMock()
+
+        entity._mqtt_on_message(None, None, mock_msg)
+        entity.on_message.assert_called_once()
+
+    def test_publish_data_future(self):
+        """Test that the publish future is resolved when the message is delivered."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt = self.mock_mqtt_client
+        entity._mqtt.is_connected.return_value = True
+        self.mock_mqtt_client.publish.return_value = MagicMock(rc=0, mid=7)
+
+        entity.data.set_value(name="temperature", value=25.5)
+        future = entity.publish_data_future(qos=1)
+        self.assertFalse(future.done())
+        self.assertEqual(entity.get_publish_stats()["inflight"], 1)
+
+        entity._mqtt_on_publish(None, None, 7)
+        self.assertTrue(future.result(timeout=0))
+        self.assertEqual(entity.get_publish_stats()["published"], 1)
+
+    def test_publish_window_full(self):
+        """Test that publish_data fails when the publish window is full and not waiting."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt = self.mock_mqtt_client
+        entity._mqtt.is_connected.return_value = True
+        self.mock_mqtt_client.publish.return_value = MagicMock(rc=0, mid=1)
+        entity.set_publish_window(max_inflight=1, timeout=0)
+
+        entity.data.set_value(name="temperature", value=25.5)
+        self.assertTrue(entity.publish_data(qos=1))
+        self.assertFalse(entity.publish_data(send_all=True, qos=1))
+        self.assertEqual(self.mock_mqtt_client.publish.call_count, 1)
+
+        # Message delivered, window released
+        entity._mqtt_on_publish(None, None, 1)
+        self.assertTrue(entity.publish_data(send_all=True, qos=1))
+
+    def test_publish_qos0_connection_lost(self):
+        """Test that in-flight QoS 0 messages are failed when the connection is lost."""
+        entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity._mqtt = self.mock_mqtt_client
+        entity._mqtt.is_connected.return_value = True
+        entity.set_publish_window(max_inflight=1, timeout=0)
+
+        entity.data.set_value(name="temperature", value=25.5)
+        self.mock_mqtt_client.publish.return_value = MagicMock(rc=0, mid=1)
+        future = entity.publish_data_future(qos=0)
+        self.assertFalse(future.done())
+
+        # Connection lost before the message was sent, the MQTT client never reports it
+        entity._mqtt_on_disconnect(self.mock_mqtt_client, None, 1)
+        self.assertFalse(future.result(timeout=0))
+        self.assertEqual(entity.get_publish_stats()["inflight"], 0)
+
+        # Window released after the reconnection
+        entity._mqtt_on_connect(self.mock_mqtt_client, None, {}, 0)
+        self.mock_mqtt_client.publish.return_value = MagicMock(rc=0, mid=2)
+        self.assertTrue(entity.publish_data(send_all=True, qos=0))
+
     def test_entity_str_repr(self):
         """Test __str__ and __repr__ methods of MqttSpbEntity."""
         entity = MqttSpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
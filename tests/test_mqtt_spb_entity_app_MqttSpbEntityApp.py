@@ -0,0 +1,925 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from mqtt_spb_wrapper import *
+
+
+def _mqtt_msg(topic, payload):
+    msg = MagicMock()
+    msg.topic = topic
+    msg.payload = payload
+    return msg
+
+
+class TestMqttSpbEntityApp(unittest.TestCase):
+
+    def setUp(self):
+        self.app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App1")
+        self.app._spb_initialized = True
+
+        # Payloads from a simulated device
+        self.device = SpbEntity(spb_group_name="Group1", spb_eon_name="EoN1", spb_eon_device_name="Device1")
+        self.device.attributes.set_value("site", "A")
+        self.device.data.set_value("temperature", 25.5)
+        self.device.commands.set_value("reset", False)
+
+    def _send_birth(self, eon_name="EoN1", eond_name="Device1"):
+        self.app._mqtt_on_message(None, None, _mqtt_msg(
+            "spBv1.0/Group1/DBIRTH/%s/%s" % (eon_name, eond_name), self.device.serialize_payload_birth()))
+
+    def _send_data(self, eon_name="EoN1", eond_name="Device1", **values):
+        for k, v in values.items():
+            self.device.data.set_value(k, v)
+        self.app._mqtt_on_message(None, None, _mqtt_msg(
+            "spBv1.0/Group1/DDATA/%s/%s" % (eon_name, eond_name), self.device.serialize_payload_data()))
+
+    def test_discover_device(self):
+        """Test that devices are discovered and mirrored from BIRTH and DATA messages."""
+        self.app.callback_new_eond = MagicMock()
+        self._send_birth()
+
+        self.app.callback_new_eond.assert_called_with("EoN1", "Device1")
+        device = self.app.entities_eon["EoN1"].entities_eond["Device1"]
+        self.assertTrue(device.is_alive())
+        self.assertEqual(device.attributes.get_value("site"), "A")
+        self.assertEqual(device.data.get_value("temperature"), 25.5)
+
+        self._send_data(temperature=30.0)
+        self.assertEqual(device.data.get_value("temperature"), 30.0)
+
+    def test_callbacks(self):
+        """Test the application and entity callbacks."""
+        self.app.callback_birth = MagicMock()
+        self.app.callback_data = MagicMock()
+        device = self.app.get_edge_device("EoN1", "Device1")
+        device.callback_data = MagicMock()
+
+        self._send_birth()
+        self._send_data(temperature=30.0)
+
+        self.app.callback_birth.assert_called_once()
+        self.app.callback_data.assert_called_once()
+        payload = device.callback_data.call_args[0][0]
+        self.assertEqual(payload["metrics"][0]["name"], "temperature")
+        self.assertEqual(payload["metrics"][0]["value"], 30.0)
+
+    def test_birth_callback_payload_not_modified(self):
+        """Test that the BIRTH callback receives the original metric names."""
+        self.app.callback_birth = MagicMock()
+        self._send_birth()
+
+        names = [m["name"] for m in self.app.callback_birth.call_args[0][1]["metrics"]]
+        self.assertIn("ATTR/site", names)
+        self.assertIn("DATA/temperature", names)
+
+    def test_decode_pool(self):
+        """Test that payloads decoded by the worker processes are processed in order."""
+        self.app.callback_data = MagicMock()
+        self.app.set_decode_workers(2)
+        try:
+            # Worker processes started eagerly, not forked from the MQTT network thread
+            self.assertEqual(len(self.app._decode_pool._processes), 2)
+            self.assertNotEqual(self.app._decode_pool._mp_context.get_start_method(), "fork")
+
+            self._send_birth()
+            for i in range(20):
+                self._send_data(temperature=float(i))
+        finally:
+            self.app.set_decode_workers(0)  # Stop the pool, processing the pending messages
+
+        device = self.app.entities_eon["EoN1"].entities_eond["Device1"]
+        self.assertEqual(device.data.get_value("temperature"), 19.0)
+        values = [c[0][1]["metrics"][0]["value"] for c in self.app.callback_data.call_args_list]
+        self.assertEqual(values, [float(i) for i in range(20)])
+
+        # Pool stopped, decoded by the MQTT network thread
+        self._send_data(temperature=20.0)
+        self.assertEqual(device.data.get_value("temperature"), 20.0)
+
+    def test_callback_dispatcher(self):
+        """Test that the application and entity callbacks are executed by the callback dispatcher."""
+        threads = []
+        dispatcher = SpbCallbackDispatcher(workers=2)
+        dispatcher.start()
+        self.app.set_callback_dispatcher(dispatcher)
+
+        self.app.callback_data = lambda topic, payload: threads.append(threading.current_thread().name)
+        device = self.app.get_edge_device("EoN1", "Device1")
+        self._send_birth()
+        device.data.set_callback("temperature", lambda value: threads.append((threading.current_thread().name, value)))
+        self._send_data(temperature=30.0)
+        dispatcher.stop()
+
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(threads[0][0].startswith("spb-dispatcher"))
+        self.assertEqual(threads[0][1], 30.0)
+        self.assertTrue(threads[1].startswith("spb-dispatcher"))
+
+    def test_inbound_conflation(self):
+        """Test that the conflation mode processes all messages and keeps the latest values."""
+        values = []
+        self.app.callback_data = lambda topic, payload: values.append(payload["metrics"][0]["value"])
+        self.app.set_inbound_conflation(True)
+        self._send_birth()
+        for i in range(50):
+            self._send_data(temperature=float(i))
+        self.app.set_inbound_conflation(False)  # Process the pending messages
+
+        device = self.app.entities_eon["EoN1"].entities_eond["Device1"]
+        self.assertEqual(device.data.get_value("temperature"), 49.0)
+        self.assertEqual(values[-1], 49.0)
+        self.assertEqual(values, sorted(values))
+
+    def test_search_device_by_attribute(self):
+        """Test the attribute index searches, across edge nodes and per edge node."""
+        for eon, eond, site, floor in [("EoN1", "Device1", "A", 1), ("EoN1", "Device2", "B", 2),
+                                       ("EoN2", "Device3", "A", 3)]:
+            self.device.attributes.set_value("site", site)
+            self.device.attributes.set_value("floor", floor)
+            self._send_birth(eon_name=eon, eond_name=eond)
+
+        devices = self.app.search_device_by_attribute({"site": "A"})
+        self.assertEqual(sorted(d.spb_eon_device_name for d in devices), ["Device1", "Device3"])
+
+        devices = self.app.search_device_by_attribute_range("floor", 2, 3)
+        self.assertEqual(sorted(d.spb_eon_device_name for d in devices), ["Device2", "Device3"])
+
+        eon = self.app.entities_eon["EoN1"]
+        self.assertEqual(eon.search_device_by_attribute({"site": "A"}), ["Device1"])
+        self.assertEqual(eon.search_device_by_attribute({"site": "A", "floor": "1"}), ["Device1"])
+        self.assertEqual(eon.search_device_by_attribute({"site": "C"}), [])
+        self.assertEqual(eon.search_device_by_attribute({}), ["Device1", "Device2"])
+
+        # Updated values on a new BIRTH
+        self.device.attributes.set_value("site", "C")
+        self._send_birth(eon_name="EoN1", eond_name="Device1")
+        self.assertEqual(eon.search_device_by_attribute({"site": "A"}), [])
+        self.assertEqual(eon.search_device_by_attribute({"site": "C"}), ["Device1"])
+
+    def test_search_device_by_attribute_order(self):
+        """Test that the indexed edge node searches return the devices in discovery order."""
+        for eond in ("Pump2", "Pump10", "Pump1"):
+            self._send_birth(eon_name="EoN1", eond_name=eond)
+
+        eon = self.app.entities_eon["EoN1"]
+        self.assertEqual(eon.search_device_by_attribute({"site": "A"}), ["Pump2", "Pump10", "Pump1"])
+
+    def test_query(self):
+        """Test the fleet queries combining data and attribute conditions."""
+        self._send_birth("EoN1", "Device1")
+        self._send_data("EoN1", "Device1", temperature=85.0)
+        self._send_birth("EoN2", "Device2")
+        self._send_data("EoN2", "Device2", temperature=70.0)
+        self.device.attributes.set_value("site", "B")
+        self._send_birth("EoN2", "Device3")
+        self._send_data("EoN2", "Device3", temperature=90.0)
+
+        device1 = self.app.get_edge_device("EoN1", "Device1")
+        res = self.app.query([("data.temperature", ">", 80), ("attributes.site", "==", "A")])
+        self.assertEqual(res, [(device1, "data.temperature", 85.0), (device1, "attributes.site", "A")])
+
+        res = self.app.query([("data.temperature", ">", 80)])
+        self.assertEqual([d.spb_eon_device_name for d, _, _ in res], ["Device1", "Device3"])
+
+        # Values updated on DATA messages
+        self._send_data("EoN2", "Device3", temperature=60.0)
+        res = self.app.query([("data.temperature", "<=", 70)])
+        self.assertEqual([(d.spb_eon_device_name, v) for d, _, v in res], [("Device2", 70.0), ("Device3", 60.0)])
+
+        with self.assertRaises(ValueError):
+            self.app.query([("unknown.temperature", ">", 80)])
+
+    def test_query_edge_nodes(self):
+        """Test the queries of the edge node metrics."""
+        for eon_name, load in (("EoN1", 0.9), ("EoN2", 0.2)):
+            node = SpbEntity(spb_group_name="Group1", spb_eon_name=eon_name)
+            node.attributes.set_value("site", "A")
+            node.data.set_value("cpu_load", load)
+            self.app._mqtt_on_message(None, None, _mqtt_msg("spBv1.0/Group1/NBIRTH/%s" % eon_name,
+                                                            node.serialize_payload_birth()))
+        self._send_birth("EoN1", "Device1")
+
+        eon1 = self.app.get_edge_node("EoN1")
+        res = self.app.query([("data.cpu_load", ">", 0.5), ("attributes.site", "==", "A")], edge_nodes=True)
+        self.assertEqual(res, [(eon1, "data.cpu_load", 0.9), (eon1, "attributes.site", "A")])
+
+        # Devices and edge nodes are indexed separately
+        self.assertEqual(self.app.query([("data.cpu_load", ">", 0.5)]), [])
+        self.assertEqual(self.app.query([("data.temperature", ">", 0)], edge_nodes=True), [])
+
+    def test_metric_history(self):
+        """Test the history of the numeric data metrics."""
+        self.assertIsNone(self.app.get_metric_history("EoN1", "Device1", "temperature"))
+
+        self.app.set_metric_history(max_count=100)
+        self._send_birth()
+        for i in range(5):
+            self._send_data(temperature=20.0 + i)
+
+        history = self.app.get_metric_history("EoN1", "Device1", "temperature")
+        ts, values = history.get_window()
+        self.assertEqual(list(values), [25.5, 20.0, 21.0, 22.0, 23.0, 24.0])
+        self.assertEqual(history.aggregate()["max"], 25.5)
+
+        self.app.set_metric_history(enabled=False)
+        self.assertIsNone(self.app.get_metric_history("EoN1", "Device1", "temperature"))
+
+    def test_snapshot(self):
+        """Test that the discovered entities and values are restored from a snapshot."""
+        self._send_birth()
+        self._send_data(temperature=30.0)
+        device = self.app.get_edge_device("EoN1", "Device1")
+        device.data.set_value("trend", [1.0, 2.0], timestamp=[1000, 2000])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "app.snapshot")
+            self.assertTrue(self.app.save_snapshot(path))
+
+            app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App2")
+            self.assertEqual(app.set_snapshot(path, interval=0), 2)
+
+            restored = app.entities_eon["EoN1"].entities_eond["Device1"]
+            self.assertFalse(restored.is_alive())
+            self.assertEqual(restored.attributes.get_value("site"), "A")
+            self.assertEqual(restored.data.get_value("temperature"), 30.0)
+            self.assertEqual(restored.data["temperature"].spb_data_type, device.data["temperature"].spb_data_type)
+            self.assertEqual(restored.data["trend"].timestamp, [1000, 2000])
+            self.assertIn("reset", restored.commands.get_names())
+            self.assertEqual(app.search_device_by_attribute({"site": "A"}), [restored])
+            self.assertEqual(len(app.query([("data.temperature", "==", 30.0)])), 1)
+
+            # Snapshot from another group is ignored
+            app = MqttSpbEntityApp(spb_group_name="Group2", spb_app_name="App2")
+            self.assertEqual(app.load_snapshot(path), 0)
+
+            self.assertEqual(app.load_snapshot(os.path.join(tmp, "missing")), 0)
+
+    def test_snapshot_format(self):
+        """Test that the snapshot is stored as data ( bytes values included ), not as pickled objects."""
+        import json
+        import zlib
+
+        self._send_birth()
+        device = self.app.get_edge_device("EoN1", "Device1")
+        device.data.set_value("raw", b"\x00\x01", spb_data_type=MetricDataType.Bytes)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "app.snapshot")
+            self.assertTrue(self.app.save_snapshot(path))
+            with open(path, "rb") as f:
+                state = json.loads(zlib.decompress(f.read()[8:]))
+            self.assertEqual(state["group"], "Group1")
+
+            app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App2")
+            self.assertEqual(app.load_snapshot(path), 2)
+            self.assertEqual(app.entities_eon["EoN1"].entities_eond["Device1"].data.get_value("raw"), b"\x00\x01")
+
+            # Invalid content is not restored
+            with open(path, "wb") as f:
+                f.write(b"SPBSNAP2" + zlib.compress(b"[1, 2]"))
+            self.assertEqual(app.load_snapshot(path), 0)
+
+    def test_snapshot_types(self):
+        """Test that DateTime and UUID metrics are restored with their types, and can be published again."""
+        import uuid
+        from datetime import datetime
+
+        ts = datetime.fromtimestamp(1704164645)
+        device_id = uuid.UUID("12345678-1234-5678-1234-567812345678")
+        self.device.data.set_value("started", ts, spb_data_type=MetricDataType.DateTime)
+        self.device.data.set_value("id", device_id, spb_data_type=MetricDataType.UUID)
+        self._send_birth()
+        device = self.app.get_edge_device("EoN1", "Device1")
+        device.data.set_value("uid", device_id, spb_data_type=MetricDataType.UUID)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "app.snapshot")
+            self.assertTrue(self.app.save_snapshot(path))
+
+            app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App2")
+            self.assertEqual(app.load_snapshot(path), 2)
+
+        restored = app.get_edge_device("EoN1", "Device1")
+        self.assertEqual(restored.data.get_value("started"), ts)
+        self.assertEqual(restored.data.get_value("id"), device.data.get_value("id"))
+        self.assertEqual(restored.data.get_value("uid"), device_id)
+        self.assertTrue(restored.serialize_payload_birth())
+
+    def test_snapshot_restore_not_notified(self):
+        """Test that the restored values are indexed, but not notified as new updates."""
+        self._send_birth()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "app.snapshot")
+            self.assertTrue(self.app.save_snapshot(path))
+
+            app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App2")
+            app.set_metric_history(max_count=10)
+            callback = MagicMock()
+            app.add_metric_callback(("EoN1", "Device1", "temperature"), callback)
+            stream = app.open_change_stream()
+            self.assertEqual(app.load_snapshot(path), 2)
+
+        callback.assert_not_called()
+        self.assertEqual(len(stream), 0)
+        stream.close()
+        self.assertEqual(len(app.query([("data.temperature", "==", 25.5)])), 1)
+        self.assertEqual(len(app.get_metric_history("EoN1", "Device1", "temperature")), 1)
+
+    def test_snapshot_loop_errors(self):
+        """Test that the periodic snapshot thread keeps running after an error."""
+        calls = []
+
+        def save_snapshot(path=None):
+            calls.append(path)
+            raise RuntimeError("dictionary changed size during iteration")
+
+        self.app.save_snapshot = save_snapshot
+        stop = threading.Event()
+        thread = threading.Thread(target=self.app._snapshot_loop, args=(stop, 0.01), daemon=True)
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertGreater(len(calls), 1)
+        stop.set()
+        thread.join(timeout=1)
+
+    def test_initialization(self):
+        """Test that the initialization finishes when the retained messages stop arriving."""
+        app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App1")
+        app._mqtt = MagicMock()
+        app.callback_initialized = MagicMock()
+        app.set_initialization(quiet_period=0.2, adaptive=False)
+
+        # Entities alive from a previous connection
+        device = app.get_edge_device("EoN1", "Device1")
+        device._is_alive = True
+
+        app._mqtt_on_connect(None, None, None, 0)
+        for _ in range(5):
+            msg = _mqtt_msg("spBv1.0/Group1/DBIRTH/EoN1/Device1", self.device.serialize_payload_birth())
+            msg.retain = True
+            app._mqtt_on_message(None, None, msg)
+            self.assertFalse(app.is_initialized())
+            time.sleep(0.1)
+
+        self.assertFalse(device.is_alive())
+        self.assertTrue(app.wait_initialized(2))
+        self.assertTrue(app.is_initialized())
+        app.callback_initialized.assert_called_once()
+        self.assertEqual(app._spb_init_rx_count, 5)
+
+        # Live messages update the entity state
+        msg = _mqtt_msg("spBv1.0/Group1/DDATA/EoN1/Device1", self.device.serialize_payload_data(send_all=True))
+        msg.retain = False
+        app._mqtt_on_message(None, None, msg)
+        self.assertTrue(device.is_alive())
+
+    def test_initialization_max_time(self):
+        """Test the maximum initialization time."""
+        app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App1")
+        app._mqtt = MagicMock()
+        app.set_initialization(quiet_period=10, max_time=0.2)
+        app._mqtt_on_connect(None, None, None, 0)
+        self.assertTrue(app.wait_initialized(2))
+
+        app.disconnect()
+        self.assertFalse(app.is_initialized())
+
+    def test_initialization_alive_reset(self):
+        """Test that the alive status of the entities is reset by a new initialization, and set again per entity."""
+        app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App1")
+        app._mqtt = MagicMock()
+        app.set_initialization(quiet_period=0.05, adaptive=False)
+        app._mqtt_on_connect(None, None, None, 0)
+        self.assertTrue(app.wait_initialized(2))
+
+        for eond_name in ("Device1", "Device2"):
+            msg = _mqtt_msg("spBv1.0/Group1/DBIRTH/EoN1/" + eond_name, self.device.serialize_payload_birth())
+            msg.retain = False
+            app._mqtt_on_message(None, None, msg)
+        device1 = app.get_edge_device("EoN1", "Device1")
+        device2 = app.get_edge_device("EoN1", "Device2")
+        self.assertTrue(device1.is_alive() and device2.is_alive())
+
+        # Reconnection, no entity is alive until its live messages are received
+        app.disconnect()
+        app._mqtt_on_connect(None, None, None, 0)
+        self.assertFalse(device1.is_alive() or device2.is_alive())
+        self.assertTrue(app.wait_initialized(2))
+
+        msg = _mqtt_msg("spBv1.0/Group1/DDATA/EoN1/Device1", self.device.serialize_payload_data(send_all=True))
+        msg.retain = False
+        app._mqtt_on_message(None, None, msg)
+        self.assertTrue(device1.is_alive())
+        self.assertFalse(device2.is_alive())
+
+    def test_sequence_tracking(self):
+        """Test the detection of sequence gaps and messages without BIRTH, requesting a rebirth."""
+        edge = SpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        edge.data.set_value("counter", 0)
+
+        def _send(message_type, seq, eond_name=None):
+            payload = {"seq": str(seq), "timestamp": "0", "metrics": []}
+            topic = "spBv1.0/Group1/%s/EoN1" % message_type + ("/" + eond_name if eond_name else "")
+            self.app._spb_inbound_message(SpbTopic(topic), payload, 0)
+
+        self.app._rebirth = MagicMock()
+
+        _send("NDATA", 5)
+        self.assertEqual(self.app.get_sequence_stats()["no_birth"], 1)
+        self.app._rebirth.request.assert_called_with("EoN1")
+
+        _send("NBIRTH", 0)
+        self.app._rebirth.completed.assert_called_with("EoN1")
+        _send("DBIRTH", 1, "Device1")
+        _send("DDATA", 2, "Device1")
+        _send("NDATA", 3)
+        self.assertEqual(self.app.get_sequence_stats(), {"gaps": 0, "out_of_order": 0, "no_birth": 1})
+
+        _send("NDATA", 6)   # Gap
+        _send("NDATA", 5)   # Out of order
+        _send("NDATA", 7)
+        _send("DDATA", 8, "Device2")    # Device without BIRTH
+        self.assertEqual(self.app.get_sequence_stats(), {"gaps": 1, "out_of_order": 1, "no_birth": 2})
+
+        # Sequence wraps at 255
+        _send("NBIRTH", 254)
+        _send("NDATA", 255)
+        _send("NDATA", 0)
+        self.assertEqual(self.app._rebirth.request.call_count, 4)
+
+    def test_send_rebirth_request(self):
+        """Test the rebirth request message."""
+        self.app._mqtt = MagicMock()
+        self.app._mqtt.publish.return_value.rc = 0
+        self.app.is_connected = MagicMock(return_value=True)
+
+        self.assertTrue(self.app.send_rebirth_request("EoN1"))
+        topic, payload = self.app._mqtt.publish.call_args[0][:2]
+        self.assertEqual(topic, "spBv1.0/Group1/NCMD/EoN1")
+        metric = SpbPayloadParser().parse_payload(payload)["metrics"][0]
+        self.assertEqual((metric["name"], metric["value"]), ("Node Control/Rebirth", True))
+
+    def test_liveness(self):
+        """Test that silent devices become stale and offline."""
+        self.app.set_liveness(interval=1.0)
+        self.app._liveness.stop()   # Advanced by the test
+        self.app.callback_liveness = MagicMock()
+        try:
+            self._send_birth()
+            device = self.app.get_edge_device("EoN1", "Device1")
+            self.assertTrue(device.is_alive())
+            self.assertEqual(self.app.get_liveness_state("EoN1", "Device1"), "online")
+
+            ts = int(time.time() * 1000)
+            self.app._liveness.advance(ts + 2500)
+            self.app.callback_liveness.assert_any_call(device, "online", "stale")
+            self.assertTrue(device.is_alive())
+
+            self.app._liveness.advance(ts + 6000)
+            self.assertEqual(self.app.get_liveness_state("EoN1", "Device1"), "offline")
+            self.assertFalse(device.is_alive())
+            self.assertEqual(self.app.get_liveness_counts(), {"online": 0, "stale": 0, "offline": 2})
+        finally:
+            self.app.set_liveness(enabled=False)
+
+    def test_liveness_edge_node_device_data(self):
+        """Test that an edge node only publishing device data stays online."""
+        from unittest.mock import patch
+
+        self.app.set_liveness(interval=1.0)
+        self.app._liveness.stop()   # Advanced by the test
+        try:
+            ts = int(time.time() * 1000)
+            with patch("time.time", return_value=ts / 1000):
+                self._send_birth()
+            eon = self.app.get_edge_node("EoN1")
+            eon._is_alive = True
+
+            for i in range(1, 6):   # DDATA every interval, no NDATA
+                with patch("time.time", return_value=(ts + i * 1000) / 1000):
+                    self._send_data(temperature=20.0 + i)
+                self.app._liveness.advance(ts + i * 1000 + 500)
+                self.assertEqual(self.app.get_liveness_state("EoN1"), "online")
+                self.assertEqual(self.app.get_liveness_state("EoN1", "Device1"), "online")
+
+            self.assertTrue(eon.is_alive())
+        finally:
+            self.app.set_liveness(enabled=False)
+
+    def test_subscriptions(self):
+        """Test the selective subscriptions, updated when the entities are requested."""
+        self.app._mqtt = MagicMock()
+        self.app._mqtt.subscribe.return_value = (0, 1)
+        self.app._mqtt.is_connected.return_value = True
+        self.app._mqtt_on_connect(None, None, None, 0)
+        self.app._spb_init_cancel()
+
+        self.app.set_subscriptions(edge_nodes=[], message_types=["DBIRTH", "DDATA"])
+        self.app._mqtt.unsubscribe.assert_called_once_with("spBv1.0/Group1/#")
+        self.assertEqual(self.app._subscription_topics, set())
+
+        self.app.get_edge_device("EoN1", "Device1")
+        self.assertEqual(self.app._subscription_topics,
+                         {"spBv1.0/Group1/DBIRTH/EoN1/Device1", "spBv1.0/Group1/DDATA/EoN1/Device1"})
+        subscribed = [c[0][0] for c in self.app._mqtt.subscribe.call_args_list]
+        self.assertIn("spBv1.0/Group1/DDATA/EoN1/Device1", subscribed)
+
+        # Reconnection, only the selected topics are subscribed
+        self.app._mqtt.subscribe.reset_mock()
+        self.app._mqtt_on_connect(None, None, None, 0)
+        self.app._spb_init_cancel()
+        subscribed = sorted(c[0][0] for c in self.app._mqtt.subscribe.call_args_list)
+        self.assertEqual(subscribed, ["spBv1.0/Group1/DBIRTH/EoN1/Device1", "spBv1.0/Group1/DDATA/EoN1/Device1"])
+
+    def test_subscriptions_sequence(self):
+        """Test that the sequence is not checked for the edge nodes not fully subscribed."""
+        self.app.set_subscriptions(devices=[("EoN1", "Device1")])
+        self.app._rebirth = MagicMock()
+
+        for seq in (3, 7, 12):
+            payload = {"seq": str(seq), "timestamp": "0", "metrics": []}
+            self.app._spb_inbound_message(SpbTopic("spBv1.0/Group1/DDATA/EoN1/Device1"), payload, 0)
+
+        self.assertEqual(self.app.get_sequence_stats(), {"gaps": 0, "out_of_order": 0, "no_birth": 0})
+        self.app._rebirth.request.assert_not_called()
+
+        # Edge node fully subscribed
+        self.app.set_subscriptions(edge_nodes=["EoN1"])
+        self.app._spb_inbound_message(SpbTopic("spBv1.0/Group1/DDATA/EoN1/Device1"),
+                                      {"seq": "13", "timestamp": "0", "metrics": []}, 0)
+        self.assertEqual(self.app.get_sequence_stats()["no_birth"], 1)
+        self.app._rebirth.request.assert_called_once_with("EoN1")
+
+    def test_subscriptions_patterns(self):
+        """Test that the messages not matching the glob patterns are ignored."""
+        self.app.set_subscriptions(patterns=["Line1-*"])
+
+        self._send_birth("Line1-A", "Device1")
+        self._send_birth("Line2-A", "Device1")
+
+        self.assertIn("Line1-A", self.app.entities_eon)
+        self.assertNotIn("Line2-A", self.app.entities_eon)
+
+    def test_groups(self):
+        """Test that the messages of other groups are routed to their group registry."""
+        line2 = self.app.add_group("Line2")
+        self.assertIs(self.app.add_group("Line2"), line2)
+        self.assertIs(self.app.get_group("Group1"), self.app)
+        line2._spb_initialized = True
+
+        device = SpbEntity(spb_group_name="Line2", spb_eon_name="EoN1", spb_eon_device_name="Device2")
+        device.data.set_value("pressure", 1.5)
+        self.app._mqtt_on_message(None, None, _mqtt_msg("spBv1.0/Line2/DBIRTH/EoN1/Device2",
+                                                        device.serialize_payload_birth()))
+        self._send_birth()
+
+        self.assertEqual(list(line2.entities_eon["EoN1"].entities_eond.keys()), ["Device2"])
+        self.assertEqual(list(self.app.entities_eon["EoN1"].entities_eond.keys()), ["Device1"])
+        self.assertEqual(line2.get_edge_device("EoN1", "Device2").data.get_value("pressure"), 1.5)
+
+    def test_groups_connection(self):
+        """Test that the groups share the MQTT connection and subscribe on (re)connection."""
+        self.app._mqtt = MagicMock()
+        self.app._mqtt.subscribe.return_value = (0, 1)
+        self.app._mqtt.is_connected.return_value = True
+        self.app._mqtt.publish.return_value.rc = 0
+
+        line2 = self.app.add_group("Line2")
+        line2._spb_init_cancel()
+        self.app._mqtt.subscribe.assert_called_with("spBv1.0/Line2/#")
+
+        self.app._mqtt.subscribe.reset_mock()
+        self.app._mqtt_on_connect(None, None, None, 0)
+        self.app._spb_init_cancel()
+        line2._spb_init_cancel()
+        subscribed = sorted(c[0][0] for c in self.app._mqtt.subscribe.call_args_list)
+        self.assertEqual(subscribed, ["spBv1.0/Group1/#", "spBv1.0/Line2/#"])
+
+        self.assertTrue(line2.send_rebirth_request("EoN1"))
+        self.assertEqual(self.app._mqtt.publish.call_args[0][0], "spBv1.0/Line2/NCMD/EoN1")
+
+        self.assertTrue(self.app.remove_group("Line2"))
+        self.app._mqtt.unsubscribe.assert_called_with("spBv1.0/Line2/#")
+        self.assertIsNone(self.app.get_group("Line2"))
+        self.assertFalse(line2.is_connected())
+
+    def test_groups_modes(self):
+        """Test that the groups are configured with the modes of the application."""
+        self.app.set_liveness(interval=2.0, stale_factor=3.0)
+        self.app.set_rebirth_requests(min_interval=5.0)
+        self.app.set_metric_history(max_count=10)
+        self.app.set_shard("App1", ["App1", "App2"])
+        try:
+            line2 = self.app.add_group("Line2")
+            self.assertEqual(line2._liveness.interval, 2000)
+            self.assertEqual(line2._liveness.stale_factor, 3.0)
+            self.assertEqual(line2._rebirth.min_interval, 5.0)
+            self.assertEqual(line2._history_config, self.app._history_config)
+            for i in range(20):
+                eon = "EoN%d" % i
+                self.assertEqual(line2.is_shard_owner(eon), self.app.is_shard_owner(eon))
+        finally:
+            for app in (self.app, self.app.get_group("Line2")):
+                if app is not None:
+                    app.set_liveness(enabled=False)
+                    app.set_rebirth_requests(enabled=False)
+
+    def test_groups_scada_state(self):
+        """Test that a SCADA application publishes the STATE messages of its groups."""
+        scada = MqttSpbEntityScada(spb_group_name="Group1", spb_scada_name="Scada1")
+        scada._mqtt = MagicMock()
+        scada._mqtt.subscribe.return_value = (0, 1)
+        scada._mqtt.is_connected.return_value = True
+        scada._mqtt.publish.return_value.rc = 0
+        scada.publish_birth()
+
+        line2 = scada.add_group("Line2")
+        line2._spb_init_cancel()
+        scada._mqtt.publish.assert_called_with("spBv1.0/Line2/STATE/Scada1", b"ONLINE", 0, True)
+
+        # Application BIRTH, published again for all the groups
+        scada._mqtt.publish.reset_mock()
+        scada.publish_birth()
+        topics = sorted(c[0][0] for c in scada._mqtt.publish.call_args_list)
+        self.assertEqual(topics, ["spBv1.0/Group1/STATE/Scada1", "spBv1.0/Line2/STATE/Scada1"])
+
+        scada.remove_group("Line2")
+        scada._mqtt.publish.assert_called_with("spBv1.0/Line2/STATE/Scada1", b"OFFLINE", 0, False)
+
+    def test_reconnect_fails_qos0_publishes(self):
+        """Test that the QoS 0 messages discarded on reconnection release the publish window."""
+        self.app._mqtt = MagicMock()
+        self.app._mqtt.subscribe.return_value = (0, 1)
+        self.app._mqtt.is_connected.return_value = True
+        self.app.set_publish_window(max_inflight=2, timeout=0)
+
+        futures = []
+        for mid in (1, 2):
+            self.app._mqtt.publish.return_value = MagicMock(rc=0, mid=mid)
+            futures.append(self.app._mqtt_payload_publish_future("spBv1.0/Group1/NCMD/EoN1", b"payload"))
+        self.assertEqual(self.app.get_publish_stats()["inflight"], 2)
+
+        self.app._mqtt_on_connect(None, None, None, 0)
+        self.app._spb_init_cancel()
+        self.assertEqual([f.result(timeout=0) for f in futures], [False, False])
+        self.assertEqual(self.app.get_publish_stats()["inflight"], 0)
+
+        self.app._mqtt.publish.return_value = MagicMock(rc=0, mid=3)
+        self.assertTrue(self.app.send_rebirth_request("EoN1"))
+
+    def test_topic_handlers(self):
+        """Test the user handlers registered with MQTT topic filters."""
+        handler = MagicMock()
+        self.app.add_topic_handler("spBv1.0/Group1/DDATA/+/Device1", handler)
+
+        self._send_birth()
+        self._send_data(temperature=30.0)
+        self._send_data("EoN1", "Device2", temperature=31.0)
+
+        handler.assert_called_once()
+        topic, payload = handler.call_args[0]
+        self.assertEqual(topic.eon_device_name, "Device1")
+        self.assertEqual(payload["metrics"][0]["value"], 30.0)
+
+        self.assertTrue(self.app.remove_topic_handler("spBv1.0/Group1/DDATA/+/Device1", handler))
+        self._send_data(temperature=32.0)
+        handler.assert_called_once()
+        self.assertEqual(self.app.get_edge_device("EoN1", "Device1").data.get_value("temperature"), 32.0)
+
+    def test_metric_callbacks(self):
+        """Test the callbacks of the watched metrics."""
+        callback = MagicMock()
+        sid = self.app.add_metric_callback(("EoN*", "Device1", "temperature"), callback)
+        self.app.add_metric_callback(("EoN1", "Device2", "temperature"), MagicMock(side_effect=AssertionError))
+
+        self._send_birth()
+        self._send_data(temperature=30.0)
+
+        device = self.app.get_edge_device("EoN1", "Device1")
+        self.assertEqual(callback.call_count, 2)    # BIRTH and DATA
+        entity, name, value, ts = callback.call_args[0]
+        self.assertEqual((entity, name, value), (device, "temperature", 30.0))
+        self.assertIsInstance(ts, int)
+
+        self.assertTrue(self.app.remove_metric_callback(sid))
+        self._send_data(temperature=31.0)
+        self.assertEqual(callback.call_count, 2)
+
+    def test_change_stream(self):
+        """Test the change data capture stream records."""
+        line2 = self.app.add_group("Line2")
+        line2._spb_initialized = True
+
+        with self.app.open_change_stream(batch_size=10) as stream:
+            self._send_birth()
+            self._send_data(temperature=30.0)
+
+            device = SpbEntity(spb_group_name="Line2", spb_eon_name="EoN1", spb_eon_device_name="Device2")
+            device.data.set_value("pressure", 1.5)
+            self.app._mqtt_on_message(None, None, _mqtt_msg("spBv1.0/Line2/DBIRTH/EoN1/Device2",
+                                                            device.serialize_payload_birth()))
+
+            records = stream.get_batch(timeout=1)
+            self.assertEqual([r[:5] for r in records], [
+                ("Group1", "EoN1", "Device1", "temperature", 25.5),
+                ("Group1", "EoN1", "Device1", "temperature", 30.0),
+                ("Line2", "EoN1", "Device2", "pressure", 1.5),
+            ])
+            self.assertEqual(records[1].seq, (records[0].seq + 1) & 0xFF)
+            self.assertIsInstance(records[1].timestamp, int)
+
+        self.assertEqual(self.app._streams, ())
+        self.assertEqual(line2._streams, ())
+
+    def test_historian(self):
+        """Test that the received values are persisted by the historian."""
+        with tempfile.TemporaryDirectory() as tmp:
+            self.app.set_historian(os.path.join(tmp, "historian.db"), window=0)
+            try:
+                self._send_birth()
+                time.sleep(0.01)    # Different timestamps
+                self._send_data(temperature=30.0)
+                self.assertTrue(self.app._historian.flush(timeout=5))
+
+                values = [v for ts, v in self.app.query_historian("EoN1", "Device1", "temperature")]
+                self.assertEqual(values, [25.5, 30.0])
+            finally:
+                self.app.set_historian(None)
+        self.assertEqual(self.app._streams, ())
+
+    def test_columnar_sink(self):
+        """Test that the received values are written to Parquet files."""
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.app.set_columnar_sink(tmp, window=0)
+            sink = self.app._columnar_sink
+            self._send_birth()
+            self._send_data(temperature=30.0)
+            self.app.set_columnar_sink(None)
+
+            table = pq.read_table(sink.files[0])
+            self.assertEqual(table.column("value").to_pylist(), [25.5, 30.0])
+            self.assertEqual(table.column("group").to_pylist(), ["Group1", "Group1"])
+
+    def test_export_state(self):
+        """Test the fleet export, full and changes since the last export."""
+        import json
+
+        self._send_birth()
+        self._send_birth("EoN1", "Device2")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fleet.jsonl")
+            version = self.app.export_state(path)
+            with open(path) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual(sorted((r["eond"], r["kind"], r["metric"]) for r in rows if r["kind"] != "commands"), [
+                ("Device1", "attributes", "site"), ("Device1", "data", "temperature"),
+                ("Device2", "attributes", "site"), ("Device2", "data", "temperature"),
+            ])
+
+            self._send_data(temperature=30.0)
+            self.app.export_state(path, since=version)
+            with open(path) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual([(r["eond"], r["metric"], r["value"]) for r in rows], [("Device1", "temperature", 30.0)])
+
+            with self.assertRaises(ValueError):
+                self.app.export_state(path, file_format="csv")
+
+    def test_get_changes(self):
+        """Test the polling of the metrics updated since a cursor, of the updated entities only."""
+        self._send_birth()
+        self._send_birth("EoN1", "Device2")
+
+        cursor, rows = self.app.get_changes()
+        self.assertEqual(sorted((r[2], r[4]) for r in rows if r[3] == "data"),
+                         [("Device1", "temperature"), ("Device2", "temperature")])
+
+        cursor, rows = self.app.get_changes(cursor)
+        self.assertEqual(rows, [])
+
+        self._send_data("EoN1", "Device2", temperature=30.0)
+        cursor, rows = self.app.get_changes(cursor)
+        self.assertEqual([(r[0], r[2], r[4], r[5]) for r in rows], [("Group1", "Device2", "temperature", 30.0)])
+        self.assertEqual(self.app._changed_entities(cursor), [])
+
+        # Removed entities are not tracked
+        self.app._unregister_edge_node("EoN1")
+        self.assertEqual(self.app._changed_entities(0), [])
+
+    def test_shared_table(self):
+        """Test the last values published into the shared memory table."""
+        from mqtt_spb_wrapper.spb_sharedmem import SpbSharedTableReader
+
+        self._send_birth()
+        name = self.app.set_shared_table(slots=16)
+        try:
+            with SpbSharedTableReader(name) as reader:
+                self.assertEqual(reader.read("Group1", "EoN1", "Device1", "temperature")[0], 25.5)
+
+                self._send_data(temperature=30.0)
+                self.assertEqual(reader.read("Group1", "EoN1", "Device1", "temperature")[0], 30.0)
+                self.assertIsNone(reader.read("Group1", "EoN1", "Device1", "site"))    # Attributes not published
+        finally:
+            self.assertIsNone(self.app.set_shared_table(False))
+        self.assertIsNone(self.app._shared_table)
+
+    def test_record_and_replay(self):
+        """Test the received traffic recorded and replayed into another application."""
+        from mqtt_spb_wrapper.spb_capture import SpbTrafficPlayer
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traffic.spbcap")
+            self.app.set_recorder(path)
+            self._send_birth()
+            self._send_data(temperature=30.0)
+            self.app.set_recorder(None)
+
+            app = MqttSpbEntityApp(spb_group_name="Group1", spb_app_name="App2")
+            app._spb_initialized = True
+            with SpbTrafficPlayer(path) as player:
+                self.assertEqual(player.play(app, speed=0), 2)
+
+            device = app.entities_eon["EoN1"].entities_eond["Device1"]
+            self.assertEqual(device.attributes.get_value("site"), "A")
+            self.assertEqual(device.data.get_value("temperature"), 30.0)
+
+    def test_shard_ignores_other_members_entities(self):
+        """Test that in sharded mode only the owned edge nodes are mirrored."""
+        self.app.set_shard("App1", ["App1", "App2"])
+
+        owned = [eon for eon in ("EoN%d" % i for i in range(20)) if self.app.is_shard_owner(eon)]
+        not_owned = [eon for eon in ("EoN%d" % i for i in range(20)) if not self.app.is_shard_owner(eon)]
+        self.assertTrue(owned and not_owned)
+
+        for eon in owned + not_owned:
+            self._send_birth(eon_name=eon)
+
+        self.assertEqual(sorted(self.app.entities_eon.keys()), sorted(owned))
+
+    def test_shard_rebalance(self):
+        """Test that rebalancing removes the entities no longer owned."""
+        for i in range(20):
+            self._send_birth(eon_name="EoN%d" % i)
+        self.assertEqual(len(self.app.entities_eon), 20)
+
+        self.app.set_shard("App1", ["App1", "App2", "App3"])
+        for eon in self.app.entities_eon.keys():
+            self.assertTrue(self.app.is_shard_owner(eon))
+        self.assertLess(len(self.app.entities_eon), 20)
+
+        # Disable sharded mode
+        self.app.set_shard("App1", None)
+        self.assertTrue(self.app.is_shard_owner("EoN-any"))
+
+    def test_shard_subscriptions(self):
+        """Test that only the owned edge nodes are subscribed when the EoN names are known."""
+        self.app._mqtt = MagicMock()
+        self.app._mqtt.subscribe.return_value = (0, 1)
+        self.app._mqtt.is_connected.return_value = True
+        self.app._mqtt_on_connect(None, None, None, 0)
+        self.app._spb_init_cancel()
+
+        edge_nodes = ["EoN%d" % i for i in range(20)]
+        self.app.set_shard("App1", ["App1", "App2"], edge_nodes=edge_nodes)
+        self.app._mqtt.unsubscribe.assert_any_call("spBv1.0/Group1/#")
+
+        owned = {eon for eon in edge_nodes if self.app.is_shard_owner(eon)}
+        subscribed = {topic.split("/")[3] for topic in self.app._subscription_topics}
+        self.assertEqual(subscribed, owned)
+
+        # Member joins the group, the subscriptions follow the new partition
+        self.app.set_shard("App1", ["App1", "App2", "App3"], edge_nodes=edge_nodes)
+        owned = {eon for eon in edge_nodes if self.app.is_shard_owner(eon)}
+        subscribed = {topic.split("/")[3] for topic in self.app._subscription_topics}
+        self.assertEqual(subscribed, owned)
+
+        # Sharded mode disabled, all the group topics
+        self.app.set_shard("App1", None)
+        self.assertEqual(self.app._subscription_topics, {"spBv1.0/Group1/#"})
+
+    def test_shard_invalid_member(self):
+        """Test that the member must be part of the list of members."""
+        with self.assertRaises(ValueError):
+            self.app.set_shard("App9", ["App1", "App2"])
+
+    def test_scada_initialization(self):
+        """Test that the SCADA application shares the application initialization."""
+        scada = MqttSpbEntityScada(spb_group_name="Group1", spb_scada_name="Scada1")
+        self.assertTrue(scada._entity_is_scada)
+        self.assertEqual(scada.debug_id, "MQTT_SPB_SCADA")
+        self.assertTrue(scada.is_shard_owner("EoN1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
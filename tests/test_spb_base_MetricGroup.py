@@ -3,7 +3,7 @@ import time
 from datetime import datetime
 from io import BytesIO
 
-from mqtt_spb_wrapper.spb_base import  MetricGroup, MetricValue, MetricDataType
+from mqtt_spb_wrapper.spb_base import  MetricGroup, MetricValue, MetricDataType, get_metric_version
 
 class TestMetricGroup(unittest.TestCase):
 
@@ -206,6 +206,27 @@ class TestMetricGroup(unittest.TestCase):
         mg_repr = repr(mg)
         self.assertIn("test_metric", mg_str)
         self.assertIn("test_metric", mg_repr)
+    def test_get_changes(self):
+        """Test the metrics updated since a version cursor."""
+        mg = MetricGroup()
+        mg.set_value(name="m1", value=1)
+        mg.set_value(name="m2", value=2)
+        self.assertEqual(mg.get_changes(), ["m1", "m2"])
+        self.assertEqual(mg.version, mg["m2"].version)
+
+        cursor = get_metric_version()
+        self.assertEqual(mg.get_changes(cursor), [])
+
+        mg.set_value(name="m1", value=10)
+        mg.set_value(name="m3", value=3)
+        self.assertEqual(mg.get_changes(cursor), ["m1", "m3"])
+        self.assertEqual(mg.get_changes(), ["m2", "m1", "m3"])
+
+        mg.remove_value("m3")
+        self.assertEqual(mg.get_changes(cursor), ["m1"])
+        mg.clear()
+        self.assertEqual(mg.get_changes(), [])
+
 
 if __name__ == '__main__':
     unittest.main()
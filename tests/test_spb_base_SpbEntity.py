@@ -2,7 +2,7 @@ import unittest
 from datetime import datetime
 import uuid
 
-from mqtt_spb_wrapper.spb_base import SpbEntity, MetricDataType, SpbPayloadParser
+from mqtt_spb_wrapper.spb_base import SpbEntity, MetricDataType, SpbPayloadParser, get_metric_version
 
 
 class TestSpbEntity(unittest.TestCase):
@@ -313,6 +313,26 @@ class TestSpbEntity(unittest.TestCase):
         self.assertIn("spb_group_name", entity_repr)
         self.assertIn("data1", entity_repr)
 
+    def test_get_changes(self):
+        """Test the entity metrics updated since a version cursor."""
+        entity = SpbEntity(spb_group_name="Group1", spb_eon_name="EoN1")
+        entity.attributes.set_value(name="attr1", value="A")
+        entity.data.set_value(name="data1", value=1)
+        entity.data.set_value(name="data2", value=2)
+
+        changes = entity.get_changes()
+        self.assertEqual([m["name"] for m in changes["data"]], ["data1", "data2"])
+        self.assertEqual([m["name"] for m in changes["attributes"]], ["attr1"])
+        self.assertTrue(entity.data["data1"].is_updated)    # Updated flags are not modified
+
+        cursor = get_metric_version()
+        entity.data.set_value(name="data2", value=20)
+        changes = entity.get_changes(cursor)
+        self.assertEqual(changes["spb_eon_name"], "EoN1")
+        self.assertEqual([(m["name"], m["value"]) for m in changes["data"]], [("data2", 20)])
+        self.assertEqual(changes["attributes"], [])
+        self.assertEqual(entity.version, entity.data["data2"].version)
+
 
 if __name__ == '__main__':
     unittest.main(buffer=False)
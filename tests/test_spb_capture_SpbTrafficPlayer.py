@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from mqtt_spb_wrapper.spb_capture import SpbTrafficRecorder, SpbTrafficPlayer
+
+
+class TestSpbTrafficPlayer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "traffic.spbcap")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _record(self, count=100, interval=10, **kwargs):
+        with SpbTrafficRecorder(self.path, block_interval=0.05, **kwargs) as recorder:
+            for i in range(count):
+                recorder.record("spBv1.0/G/DDATA/EoN1/Device%d" % (i % 3), b"payload%d" % i, 1000 + i * interval,
+                                retain=(i == 0))
+        return count
+
+    def test_record_and_read(self):
+        """Test the recorded messages, topics and flags."""
+        self._record()
+        with SpbTrafficPlayer(self.path) as player:
+            messages = list(player.messages())
+            self.assertEqual(player.start_time, 1000)
+
+        self.assertEqual(len(messages), 100)
+        self.assertEqual(messages[0], (1000, "spBv1.0/G/DDATA/EoN1/Device0", b"payload0", True))
+        self.assertEqual(messages[-1], (1990, "spBv1.0/G/DDATA/EoN1/Device0", b"payload99", False))
+
+    def test_seek_by_time(self):
+        """Test the time range reads, using the time index."""
+        self._record()
+        with SpbTrafficPlayer(self.path) as player:
+            self.assertGreater(len(player._index_offsets), 10)     # One block every 50 ms
+            messages = list(player.messages(start=1505, end=1600))
+        self.assertEqual([m[2] for m in messages], [b"payload%d" % i for i in range(51, 60)])
+
+    def test_missing_index(self):
+        """Test the blocks found by scanning the file when the index is missing or incomplete."""
+        self._record()
+        with SpbTrafficPlayer(self.path) as player:
+            offsets = list(player._index_offsets)
+
+        os.remove(self.path + ".idx")
+        with SpbTrafficPlayer(self.path) as player:
+            self.assertEqual(player._index_offsets, offsets)
+            self.assertEqual(len(list(player.messages(start=1500))), 50)
+
+    def test_append_and_truncated(self):
+        """Test the messages appended to an existing capture, and a truncated last record."""
+        self._record(count=10)
+        with SpbTrafficRecorder(self.path) as recorder:
+            recorder.record("spBv1.0/G/NDATA/EoN2", b"appended", 5000)
+        with open(self.path, "ab") as f:
+            f.write(b"\x02\x00\x00")    # Partial record
+
+        with SpbTrafficPlayer(self.path) as player:
+            messages = list(player.messages())
+        self.assertEqual(len(messages), 11)
+        self.assertEqual(messages[-1][1:3], ("spBv1.0/G/NDATA/EoN2", b"appended"))
+
+    def test_play(self):
+        """Test the replay into a client, at max speed and at a speed factor."""
+        self._record(count=10, interval=20)     # 180 ms recorded
+        client = MagicMock(spec=["publish"])
+
+        with SpbTrafficPlayer(self.path) as player:
+            self.assertEqual(player.play(client, speed=0), 10)
+            client.publish.assert_called_with("spBv1.0/G/DDATA/EoN1/Device0", b"payload9", qos=0, retain=False)
+
+            start = time.monotonic()
+            self.assertEqual(player.play(client, speed=2), 10)
+            self.assertGreaterEqual(time.monotonic() - start, 0.08)
+
+    def test_not_a_capture(self):
+        """Test opening a file that is not a capture."""
+        with open(self.path, "wb") as f:
+            f.write(b"not a capture file")
+        with self.assertRaises(ValueError):
+            SpbTrafficPlayer(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
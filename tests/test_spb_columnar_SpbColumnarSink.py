@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from mqtt_spb_wrapper.spb_stream import SpbChange, SpbChangeStream
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from mqtt_spb_wrapper.spb_columnar import SpbColumnarSink
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestSpbColumnarSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stream = SpbChangeStream(batch_size=4)
+        for i in range(10):
+            self.stream.put(SpbChange("G", "EoN1", "Device%d" % (i % 2), "temperature", 20.0 + i, 1000 * i, i))
+        self.stream.put(SpbChange("G", "EoN1", None, "status", "ok", 10000, 10))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parquet(self):
+        """Test the rolling Parquet files."""
+        sink = SpbColumnarSink(self.tmp.name, max_rows=8)
+        sink.start(self.stream)
+        sink.stop()
+
+        self.assertEqual(len(sink.files), 2)
+        self.assertFalse([f for f in os.listdir(self.tmp.name) if f.endswith(".tmp")])
+
+        table = pa.concat_tables([pq.read_table(f) for f in sink.files])
+        self.assertEqual(table.num_rows, 11)
+        self.assertEqual(table.column("value").to_pylist()[:2], [20.0, 21.0])
+        self.assertEqual(table.column("value_str").to_pylist()[-1], "ok")
+        self.assertIsNone(table.column("eond").to_pylist()[-1])
+
+    def test_arrow(self):
+        """Test the Arrow IPC files, with dictionary encoded names."""
+        sink = SpbColumnarSink(self.tmp.name, file_format="arrow", max_rows=0)
+        sink.start(self.stream)
+        sink.stop()
+
+        self.assertEqual(len(sink.files), 1)
+        with pa.OSFile(sink.files[0], "rb") as f:
+            table = pa.ipc.open_stream(f).read_all()
+        self.assertEqual(table.num_rows, 11)
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("metric").type))
+
+    def test_close_error(self):
+        """Test that the writer thread keeps running when a file can not be closed."""
+        replace = os.replace
+        calls = []
+
+        def _replace(src, dst):
+            calls.append(src)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            replace(src, dst)
+
+        with patch("mqtt_spb_wrapper.spb_columnar.os.replace", side_effect=_replace):
+            sink = SpbColumnarSink(self.tmp.name, max_rows=0, max_age=0.05)
+            sink.start(self.stream)
+
+            # Age roll fails
+            deadline = time.monotonic() + 5
+            while sink.get_stats()["errors"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(sink.get_stats()["errors"], 1)
+
+            # Next records written to a new file
+            self.stream.put(SpbChange("G", "EoN1", "Device1", "temperature", 30.0, 20000, 11))
+            sink.stop()
+
+        self.assertEqual(sink.get_stats()["errors"], 1)
+        self.assertEqual(len(sink.files), 1)
+        self.assertEqual(pq.read_table(sink.files[0]).num_rows, 1)
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            SpbColumnarSink(self.tmp.name, file_format="csv")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from mqtt_spb_wrapper.spb_base import SpbTopic
+from mqtt_spb_wrapper.spb_conflation import SpbConflationQueue
+
+
+def _payload(**values):
+    return {"timestamp": "1", "metrics": [{"name": k, "value": v} for k, v in values.items()]}
+
+
+class TestSpbConflationQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.topic_data = SpbTopic("spBv1.0/Group1/DDATA/EoN1/Device1")
+        self.topic_data2 = SpbTopic("spBv1.0/Group1/DDATA/EoN1/Device2")
+        self.topic_birth = SpbTopic("spBv1.0/Group1/DBIRTH/EoN1/Device1")
+
+    def test_merge_data(self):
+        """Test that pending DATA messages keep only the newest value of each metric."""
+        queue = SpbConflationQueue()
+        queue.put("EoN1", self.topic_data, _payload(temperature=1, pressure=1), 100)
+        queue.put("EoN1", self.topic_data2, _payload(temperature=5), 101)
+        queue.put("EoN1", self.topic_data, _payload(temperature=2), 102)
+        queue.put("EoN1", self.topic_data, _payload(temperature=3, humidity=3), 103)
+
+        events = queue.get(timeout=0)
+        self.assertEqual(len(events), 2)
+
+        topic, payload, ts = events[0]
+        self.assertEqual(topic, self.topic_data)
+        self.assertEqual(ts, 103)
+        values = {m["name"]: m["value"] for m in payload["metrics"]}
+        self.assertEqual(values, {"temperature": 3, "pressure": 1, "humidity": 3})
+
+        self.assertEqual(events[1][0], self.topic_data2)
+        self.assertEqual(queue.conflated, 2)
+        self.assertEqual(queue.messages, 4)
+        self.assertIsNone(queue.get(timeout=0))
+
+    def test_birth_not_merged(self):
+        """Test that DATA messages are not merged across a BIRTH message."""
+        queue = SpbConflationQueue()
+        queue.put("EoN1", self.topic_data, _payload(temperature=1), 100)
+        queue.put("EoN1", self.topic_birth, _payload(temperature=0), 101)
+        queue.put("EoN1", self.topic_data, _payload(temperature=2), 102)
+
+        events = queue.get(timeout=0)
+        self.assertEqual([e[0] for e in events], [self.topic_data, self.topic_birth, self.topic_data])
+        self.assertEqual(queue.conflated, 0)
+
+    def test_close(self):
+        """Test that a closed queue returns the pending messages and then None."""
+        queue = SpbConflationQueue()
+        queue.put("EoN1", self.topic_data, _payload(temperature=1), 100)
+        queue.close()
+        self.assertEqual(len(queue.get()), 1)
+        self.assertIsNone(queue.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
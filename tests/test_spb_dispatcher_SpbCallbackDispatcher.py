@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+
+from mqtt_spb_wrapper.spb_dispatcher import SpbCallbackDispatcher
+
+
+class TestSpbCallbackDispatcher(unittest.TestCase):
+
+    def test_invalid_policy(self):
+        """Test that unknown overflow policies are rejected."""
+        with self.assertRaises(ValueError):
+            SpbCallbackDispatcher(overflow="unknown")
+
+    def test_not_running_executes_inline(self):
+        """Test that callbacks are executed in the caller thread if the dispatcher is not running."""
+        dispatcher = SpbCallbackDispatcher()
+        res = []
+        dispatcher.submit("key", res.append, 1)
+        self.assertEqual(res, [1])
+
+    def test_fifo_per_key(self):
+        """Test that the callbacks of the same key are executed in order."""
+        dispatcher = SpbCallbackDispatcher(workers=4)
+        dispatcher.start()
+        res = {"a": [], "b": []}
+        for i in range(200):
+            dispatcher.submit("a", res["a"].append, i)
+            dispatcher.submit("b", res["b"].append, i)
+        dispatcher.stop()
+
+        self.assertEqual(res["a"], list(range(200)))
+        self.assertEqual(res["b"], list(range(200)))
+        stats = dispatcher.get_stats()
+        self.assertEqual(stats["executed"], 400)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def _blocked_dispatcher(self, overflow):
+        """Dispatcher with its single worker blocked by a slow callback."""
+        dispatcher = SpbCallbackDispatcher(workers=1, max_queue=2, overflow=overflow)
+        dispatcher.start()
+        event = threading.Event()
+        dispatcher.submit("key", event.wait)
+        while dispatcher.queue_depth():  # Wait until the worker is blocked
+            time.sleep(0.01)
+        return dispatcher, event
+
+    def test_drop_newest(self):
+        """Test the drop-newest overflow policy."""
+        dispatcher, event = self._blocked_dispatcher("drop-newest")
+        res = []
+        for i in range(4):
+            dispatcher.submit("key", res.append, i)
+        event.set()
+        dispatcher.stop()
+        self.assertEqual(res, [0, 1])
+        self.assertEqual(dispatcher.get_stats()["dropped"], 2)
+
+    def test_drop_oldest(self):
+        """Test the drop-oldest overflow policy."""
+        dispatcher, event = self._blocked_dispatcher("drop-oldest")
+        res = []
+        for i in range(4):
+            dispatcher.submit("key", res.append, i)
+        event.set()
+        dispatcher.stop()
+        self.assertEqual(res, [2, 3])
+
+    def test_conflate(self):
+        """Test the conflate overflow policy, only the latest value per conflate key is executed."""
+        dispatcher, event = self._blocked_dispatcher("conflate")
+        res = []
+        for i in range(10):
+            dispatcher.submit("key", res.append, ("temperature", i), conflate_key="temperature")
+            dispatcher.submit("key", res.append, ("pressure", i), conflate_key="pressure")
+        event.set()
+        dispatcher.stop()
+        self.assertEqual(res, [("temperature", 9), ("pressure", 9)])
+        self.assertEqual(dispatcher.get_stats()["conflated"], 18)
+
+    def test_conflate_order(self):
+        """Test that only the callbacks with a conflate key are conflated, keeping the order of the entity."""
+        dispatcher, event = self._blocked_dispatcher("conflate")
+        dispatcher.max_queue = 3
+        res = []
+        dispatcher.submit("key", res.append, "DATA1")     # Without conflate key, never conflated
+        dispatcher.submit("key", res.append, "DATA2")
+        dispatcher.submit("key", res.append, ("temperature", 1), conflate_key="temperature")
+        self.assertEqual(dispatcher.get_stats()["conflated"], 0)    # Queue not full
+
+        dispatcher.submit("key", res.append, "DEATH")     # Full, the oldest is discarded
+        dispatcher.submit("key", res.append, ("temperature", 2), conflate_key="temperature")
+        event.set()
+        dispatcher.stop()
+
+        self.assertEqual(res, ["DATA2", "DEATH", ("temperature", 2)])
+        stats = dispatcher.get_stats()
+        self.assertEqual((stats["conflated"], stats["dropped"]), (1, 1))
+
+    def test_block_from_worker(self):
+        """Test that a callback submitting to its own full lane does not wait for itself."""
+        dispatcher = SpbCallbackDispatcher(workers=1, max_queue=1, overflow="block")
+        dispatcher.start()
+        res = []
+        done = threading.Event()
+
+        def callback():
+            dispatcher.submit("key", res.append, 1)     # Queued, the lane is full
+            dispatcher.submit("key", res.append, 2)     # Executed inline
+            done.set()
+
+        dispatcher.submit("key", callback)
+        self.assertTrue(done.wait(timeout=2))
+        dispatcher.stop()
+        self.assertEqual(sorted(res), [1, 2])
+
+    def test_block_stopped(self):
+        """Test that a producer blocked on a full queue returns False when the dispatcher is stopped."""
+        dispatcher, event = self._blocked_dispatcher("block")
+        dispatcher.submit("key", time.sleep, 0)
+        dispatcher.submit("key", time.sleep, 0)
+        res = []
+        thread = threading.Thread(target=lambda: res.append(dispatcher.submit("key", time.sleep, 0)))
+        thread.start()
+        time.sleep(0.05)
+        threading.Thread(target=dispatcher.stop, kwargs={"drain": False}).start()
+        thread.join(timeout=2)
+        event.set()
+        self.assertEqual(res, [False])
+
+    def test_callback_errors(self):
+        """Test that callback exceptions do not stop the worker."""
+        dispatcher = SpbCallbackDispatcher()
+        dispatcher.start()
+        res = []
+        dispatcher.submit("key", lambda: 1 / 0)
+        dispatcher.submit("key", res.append, 1)
+        dispatcher.stop()
+        self.assertEqual(res, [1])
+        self.assertEqual(dispatcher.get_stats()["errors"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import io
+import json
+import unittest
+
+from mqtt_spb_wrapper import SpbEntity
+from mqtt_spb_wrapper.spb_base import get_metric_version
+from mqtt_spb_wrapper.spb_export import iter_entity_rows, write_jsonl
+
+
+class TestSpbExport(unittest.TestCase):
+
+    def setUp(self):
+        self.entity = SpbEntity(spb_group_name="G", spb_eon_name="EoN1", spb_eon_device_name="Device1")
+        self.entity.attributes.set_value("site", "A", timestamp=1000)
+        self.entity.data.set_value("temperature", 25.5, timestamp=2000)
+        self.entity.data.set_value("counter", [1, 2], timestamp=[3000, 4000])
+
+    def test_rows(self):
+        """Test the flat rows, and that the updated flags are not modified."""
+        self.entity.data["temperature"].is_updated = True
+        rows = list(iter_entity_rows(self.entity, "G"))
+
+        self.assertEqual([r[:7] for r in rows], [
+            ("G", "EoN1", "Device1", "attributes", "site", "A", 1000),
+            ("G", "EoN1", "Device1", "data", "temperature", 25.5, 2000),
+            ("G", "EoN1", "Device1", "data", "counter", [1, 2], [3000, 4000]),
+        ])
+        self.assertTrue(self.entity.data["temperature"].is_updated)
+
+    def test_since(self):
+        """Test that only the metrics updated after a version are exported."""
+        version = get_metric_version()
+        self.entity.data.set_value("temperature", 26.0)
+        rows = list(iter_entity_rows(self.entity, "G", since=version))
+        self.assertEqual([(r[4], r[5]) for r in rows], [("temperature", 26.0)])
+        self.assertGreater(rows[0][8], version)
+
+    def test_jsonl(self):
+        fp = io.StringIO()
+        self.assertEqual(write_jsonl(iter_entity_rows(self.entity, "G"), fp), 3)
+        lines = [json.loads(line) for line in fp.getvalue().splitlines()]
+        self.assertEqual(lines[1]["metric"], "temperature")
+        self.assertEqual(lines[1]["value"], 25.5)
+        self.assertEqual(lines[2]["timestamp"], [3000, 4000])
+
+
+if __name__ == '__main__':
+    unittest.main()
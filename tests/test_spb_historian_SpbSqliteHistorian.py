@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mqtt_spb_wrapper.spb_historian import SpbSqliteHistorian
+from mqtt_spb_wrapper.spb_stream import SpbChange, SpbChangeStream
+
+DAY = 86400000
+
+
+class TestSpbSqliteHistorian(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "historian.db")
+        self.stream = SpbChangeStream(batch_size=100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, historian, records):
+        for record in records:
+            self.stream.put(SpbChange(*record))
+        self.assertTrue(historian.flush(timeout=5))
+
+    def test_write_and_query(self):
+        """Test the batched writes and the range queries."""
+        historian = SpbSqliteHistorian(self.path)
+        historian.start(self.stream)
+        try:
+            self._write(historian, [("G", "EoN1", "Device1", "temperature", 20.0 + i, 1000 * i, i) for i in range(10)]
+                        + [("G", "EoN1", None, "status", "ok", 5000, 1),
+                           ("G", "EoN1", "Device1", "counter", [1, 2, 3], [DAY, DAY + 1, DAY + 2], 2)])
+
+            self.assertEqual(historian.query("EoN1", "Device1", "temperature", start=2000, end=5000),
+                             [(2000, 22.0), (3000, 23.0), (4000, 24.0)])
+            self.assertEqual(historian.query("EoN1", None, "status"), [(5000, "ok")])
+            self.assertEqual(historian.query("EoN1", "Device1", "counter"), [(DAY, 1), (DAY + 1, 2), (DAY + 2, 3)])
+            self.assertEqual(historian.query("EoN1", "Device2", "temperature"), [])
+            self.assertEqual(historian.get_stats()["written"], 14)
+        finally:
+            historian.stop()
+
+        # Interned metrics and time partitions
+        db = sqlite3.connect(self.path)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM metrics").fetchone()[0], 3)
+        self.assertEqual([r[0] for r in db.execute("SELECT name FROM partitions ORDER BY ts_start")],
+                         ["data_0", "data_%d" % DAY])
+        self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        db.close()
+
+        # Reopened database
+        historian = SpbSqliteHistorian(self.path)
+        self.assertEqual(len(historian.query("EoN1", "Device1", "temperature")), 10)
+
+    def test_retention(self):
+        """Test that the old partitions are dropped."""
+        historian = SpbSqliteHistorian(self.path, partition=86400, retention=86400)
+        historian.start(self.stream)
+        try:
+            with patch("time.time", return_value=(3 * DAY + 1000) / 1000):
+                for day in range(4):
+                    self._write(historian, [("G", "EoN1", "Device1", "temperature", float(day), day * DAY, day)])
+            self.assertEqual(historian.query("EoN1", "Device1", "temperature"), [(2 * DAY, 2.0), (3 * DAY, 3.0)])
+        finally:
+            historian.stop()
+
+    def test_retention_future_timestamps(self):
+        """Test that a device clock in the future does not drop the stored partitions."""
+        historian = SpbSqliteHistorian(self.path, partition=86400, retention=7 * 86400)
+        historian.start(self.stream)
+        try:
+            with patch("time.time", return_value=(10 * DAY) / 1000):
+                self._write(historian, [("G", "EoN1", "Device1", "temperature", float(i), 9 * DAY + i, i)
+                                        for i in range(5)])
+                self._write(historian, [("G", "EoN1", "Device2", "temperature", 1.0, 40 * DAY, 0)])
+            self.assertEqual(len(historian.query("EoN1", "Device1", "temperature")), 5)
+        finally:
+            historian.stop()
+
+    def test_invalid_timestamps(self):
+        """Test that negative timestamps are stored, and only the invalid points are discarded."""
+        historian = SpbSqliteHistorian(self.path, partition=3600)
+        historian.start(self.stream)
+        try:
+            self._write(historian, [("G", "EoN1", "Device1", "temperature", 1.0, -3600000, 0),
+                                    ("G", "EoN1", "Device1", "temperature", 2.0, 2 ** 70, 1),
+                                    ("G", "EoN1", "Device1", "temperature", 3.0, 1000, 2)])
+            self.assertEqual(historian.query("EoN1", "Device1", "temperature"), [(-3600000, 1.0), (1000, 3.0)])
+            self.assertEqual(historian.get_stats()["errors"], 0)
+            self.assertEqual(historian.get_stats()["discarded"], 1)
+        finally:
+            historian.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import math
+import random
+import unittest
+from array import array
+
+from mqtt_spb_wrapper.spb_history import SpbMetricHistory, _encode_block, _decode_block
+
+
+class TestSpbMetricHistory(unittest.TestCase):
+
+    def test_window(self):
+        """Test windowed queries over sealed and current blocks."""
+        history = SpbMetricHistory(block_size=16)
+        for i in range(100):
+            history.append(i * 1000, float(i))
+
+        ts, values = history.get_window(10000, 19000)
+        self.assertIsInstance(ts, array)
+        self.assertEqual(list(ts), [i * 1000 for i in range(10, 20)])
+        self.assertEqual(list(values), [float(i) for i in range(10, 20)])
+        self.assertEqual(len(history), 100)
+
+        ts, values = history.get_last(5000, now=99000)
+        self.assertEqual(list(values), [94.0, 95.0, 96.0, 97.0, 98.0, 99.0])
+
+    def test_aggregate(self):
+        """Test the min, max and average over a window."""
+        history = SpbMetricHistory(block_size=16, compression=True)
+        for i in range(100):
+            history.append(i * 1000, float(i))
+        history.append(100000, float("nan"))
+
+        self.assertEqual(history.aggregate(), {"count": 100, "min": 0.0, "max": 99.0, "avg": 49.5})
+        self.assertEqual(history.aggregate(10000, 20000), {"count": 11, "min": 10.0, "max": 20.0, "avg": 15.0})
+        self.assertEqual(history.aggregate(200000), {"count": 0, "min": None, "max": None, "avg": None})
+
+    def test_retention_count(self):
+        """Test the retention by number of points."""
+        history = SpbMetricHistory(max_count=50, block_size=16)
+        for i in range(1000):
+            history.append(i, float(i))
+
+        ts, values = history.get_window()
+        self.assertEqual(list(ts), list(range(950, 1000)))
+        self.assertEqual(len(history), 50)
+        self.assertLess(history.memory_usage(), 100 * 16)
+
+    def test_retention_age(self):
+        """Test the retention by age, relative to the newest point."""
+        history = SpbMetricHistory(max_age=10000, block_size=16)
+        for i in range(1000):
+            history.append(i * 1000, float(i))
+
+        ts, _ = history.get_window()
+        self.assertEqual(ts[0], 989000)
+        self.assertEqual(len(history), 11)
+
+    def test_retention_memory(self):
+        """Test the retention by memory budget."""
+        history = SpbMetricHistory(max_bytes=4096, block_size=64)
+        for i in range(10000):
+            history.append(i * 1000, float(i))
+
+        self.assertLessEqual(history.memory_usage(), 4096)
+        self.assertEqual(history.get_window()[0][-1], 9999000)
+
+    def test_out_of_order(self):
+        """Test that points older than the newest point are discarded."""
+        history = SpbMetricHistory()
+        self.assertTrue(history.append(2000, 1.0))
+        self.assertFalse(history.append(1000, 2.0))
+        self.assertEqual(history.discarded, 1)
+        self.assertEqual(len(history), 1)
+
+    def test_compression(self):
+        """Test that compressed blocks are decoded without loss, and use less memory."""
+        rnd = random.Random(1)
+        ts = array("q", [1700000000000 + i * 1000 + rnd.choice([0, 0, 1, -3, 500, 10 ** 9]) for i in range(256)])
+        values = array("d", [rnd.choice([20.5, 21.0, rnd.random(), -0.0, math.inf, math.nan]) for _ in range(256)])
+
+        ts2, values2 = _decode_block(_encode_block(ts, values), len(ts))
+        self.assertEqual(list(ts2), list(ts))
+        self.assertEqual(values2.tobytes(), values.tobytes())
+
+        raw = SpbMetricHistory()
+        compressed = SpbMetricHistory(compression=True)
+        for i in range(2560):
+            raw.append(i * 1000, 20.0 + (i % 4) * 0.5)
+            compressed.append(i * 1000, 20.0 + (i % 4) * 0.5)
+
+        self.assertEqual(compressed.get_window(), raw.get_window())
+        self.assertLess(compressed.memory_usage() * 5, raw.memory_usage())
+
+
+    def test_downsample(self):
+        """Test the time bucket aggregations."""
+        for compression in (False, True):
+            history = SpbMetricHistory(block_size=16, compression=compression)
+            for i in range(100):
+                history.append(i * 1000, float(i))
+
+            ts, values = history.downsample(10000, "mean")
+            self.assertIsInstance(values, array)
+            self.assertEqual(list(ts), [i * 10000 for i in range(10)])
+            self.assertEqual(list(values), [i * 10 + 4.5 for i in range(10)])
+
+            ts, values = history.downsample(40000, "max", start=5000)
+            self.assertEqual(list(ts), [0, 40000, 80000])
+            self.assertEqual(list(values), [39.0, 79.0, 99.0])
+
+            self.assertEqual(list(history.downsample(40000, "min")[1]), [0.0, 40.0, 80.0])
+            self.assertEqual(list(history.downsample(40000, "last", end=50000)[1]), [39.0, 50.0])
+
+        with self.assertRaises(ValueError):
+            history.downsample(1000, "median")
+
+    def test_downsample_lttb(self):
+        """Test the LTTB downsampling keeps the first, last and peak points."""
+        history = SpbMetricHistory()
+        for i in range(1000):
+            history.append(i * 1000, 100.0 if i == 500 else math.sin(i / 50))
+
+        ts, values = history.downsample_lttb(50)
+        self.assertEqual(len(ts), 50)
+        self.assertEqual(ts[0], 0)
+        self.assertEqual(ts[-1], 999000)
+        self.assertIn(500000, ts)
+        self.assertEqual(list(ts), sorted(ts))
+
+        # Less points than requested
+        self.assertEqual(len(history.downsample_lttb(5000)[0]), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from mqtt_spb_wrapper.spb_index import SpbAttributeIndex
+
+
+class TestSpbAttributeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SpbAttributeIndex()
+        self.index.update("dev1", "site", "A")
+        self.index.update("dev1", "floor", 1)
+        self.index.update("dev2", "site", "A")
+        self.index.update("dev2", "floor", 2)
+        self.index.update("dev3", "site", "B")
+        self.index.update("dev3", "floor", 3.5)
+
+    def test_find(self):
+        """Test equality queries."""
+        self.assertEqual(self.index.find("site", "A"), {"dev1", "dev2"})
+        self.assertEqual(self.index.find("floor", "2"), {"dev2"})  # Compared as string
+        self.assertEqual(self.index.find("unknown", "A"), set())
+
+    def test_search(self):
+        """Test queries with multiple attributes."""
+        self.assertEqual(self.index.search({"site": "A", "floor": 1}), {"dev1"})
+        self.assertEqual(self.index.search({"site": "B", "floor": 1}), set())
+        self.assertEqual(self.index.search({}), {"dev1", "dev2", "dev3"})
+
+    def test_find_range(self):
+        """Test range queries on numeric values."""
+        self.assertEqual(self.index.find_range("floor", 2, 3.5), {"dev2", "dev3"})
+        self.assertEqual(self.index.find_range("floor", max_value=1), {"dev1"})
+        self.assertEqual(self.index.find_range("floor", min_value=3), {"dev3"})
+        self.assertEqual(self.index.find_range("site", 0, 10), set())
+
+    def test_update_value(self):
+        """Test that updating a value moves the entity in the index."""
+        self.index.update("dev1", "site", "B")
+        self.index.update("dev1", "floor", 10)
+        self.assertEqual(self.index.find("site", "A"), {"dev2"})
+        self.assertEqual(self.index.find("site", "B"), {"dev1", "dev3"})
+        self.assertEqual(self.index.find_range("floor", 0, 5), {"dev2", "dev3"})
+
+    def test_select(self):
+        """Test queries with comparison operators."""
+        self.assertEqual(self.index.select("floor", ">", 1), {"dev2", "dev3"})
+        self.assertEqual(self.index.select("floor", "<=", 2), {"dev1", "dev2"})
+        self.assertEqual(self.index.select("site", "!=", "A"), {"dev3"})
+        with self.assertRaises(ValueError):
+            self.index.select("site", ">", "A")
+
+    def test_remove_entity(self):
+        """Test removing an entity from the index."""
+        self.index.remove_entity("dev1")
+        self.assertEqual(self.index.find("site", "A"), {"dev2"})
+        self.assertEqual(self.index.find_range("floor"), {"dev2", "dev3"})
+        self.assertEqual(len(self.index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import threading
+import unittest
+
+from mqtt_spb_wrapper.spb_index import SpbMetricIndex, _SortedBuckets
+
+
+class TestSpbMetricIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SpbMetricIndex()
+        self.index.update("dev1", "temperature", 75)
+        self.index.update("dev2", "temperature", 80.0)
+        self.index.update("dev3", "temperature", 95.5)
+        self.index.update("dev1", "state", "RUN")
+        self.index.update("dev2", "state", "STOP")
+        self.index.update("dev3", "alarm", True)
+
+    def test_find_numeric(self):
+        """Test the comparison operators on numeric values."""
+        self.assertEqual(self.index.find("temperature", ">", 80), {"dev3"})
+        self.assertEqual(self.index.find("temperature", ">=", 80), {"dev2", "dev3"})
+        self.assertEqual(self.index.find("temperature", "<", 80), {"dev1"})
+        self.assertEqual(self.index.find("temperature", "<=", 80), {"dev1", "dev2"})
+        self.assertEqual(self.index.find("temperature", "==", 80), {"dev2"})
+        self.assertEqual(self.index.find("temperature", "!=", 80), {"dev1", "dev3"})
+        self.assertEqual(self.index.find("unknown", ">", 0), set())
+
+    def test_find_values(self):
+        """Test equality queries on string and boolean values."""
+        self.assertEqual(self.index.find("state", "==", "RUN"), {"dev1"})
+        self.assertEqual(self.index.find("state", "!=", "RUN"), {"dev2"})
+        self.assertEqual(self.index.find("alarm", "==", True), {"dev3"})
+        self.assertEqual(self.index.find("temperature", "==", True), set())
+
+        with self.assertRaises(ValueError):
+            self.index.find("state", ">", "RUN")
+        with self.assertRaises(ValueError):
+            self.index.find("state", "~", "RUN")
+
+    def test_update_and_remove(self):
+        """Test that updated and removed values are moved out of the index."""
+        self.index.update("dev3", "temperature", 20)
+        self.index.update("dev1", "temperature", [1, 2, 3])     # Not indexed
+        self.assertEqual(self.index.find("temperature", ">", 50), {"dev2"})
+        self.assertEqual(self.index.get("dev3", "temperature"), 20)
+        self.assertIsNone(self.index.get("dev1", "temperature"))
+
+        self.index.remove_entity("dev2")
+        self.assertEqual(self.index.find("temperature", ">=", 0), {"dev3"})
+        self.assertEqual(self.index.find("state", "==", "STOP"), set())
+        self.assertEqual(len(self.index), 2)
+
+    def test_sorted_buckets(self):
+        """Test the sorted buckets with bucket splits and removals."""
+        rnd = random.Random(1)
+        items = _SortedBuckets()
+        values = [(rnd.randint(0, 1000), i) for i in range(5000)]
+        for v in values:
+            items.add(v)
+
+        for v in values[::2]:
+            self.assertTrue(items.remove(v))
+        self.assertFalse(items.remove((-1, 0)))
+
+        expected = sorted(values[1::2])
+        self.assertEqual(len(items), len(expected))
+        self.assertEqual(list(items.irange()), expected)
+        self.assertEqual(list(items.irange((100,), (200,))), [v for v in expected if 100 <= v[0] < 200])
+
+    def test_concurrent_queries(self):
+        """Test queries from another thread while the values are updated."""
+        errors = []
+        stop = threading.Event()
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    self.index.find("load", ">", 50)
+                    self.index.find("load", "!=", 10)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        rnd = random.Random(1)
+        for i in range(20000):
+            self.index.update("dev%d" % rnd.randint(0, 2000), "load", rnd.randint(0, 100))
+        stop.set()
+        thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.index.find("load", ">=", 0), set(self.index._current["load"].keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock
+
+from mqtt_spb_wrapper.spb_liveness import SpbLivenessTracker, SpbTimerWheel
+
+
+class TestSpbTimerWheel(unittest.TestCase):
+
+    def test_expire(self):
+        """Test timers expire on their tick, including timers further than a wheel turn."""
+        wheel = SpbTimerWheel(resolution=100, slots=8)
+        wheel.advance(0)
+        wheel.schedule("a", 250)
+        wheel.schedule("b", 2000)   # More than a full turn
+        wheel.schedule("c", 300)
+        wheel.cancel("c")
+
+        self.assertEqual(wheel.advance(199), [])
+        self.assertEqual(wheel.advance(250), ["a"])
+        self.assertEqual(wheel.advance(1900), [])
+        self.assertIn("b", wheel)
+        self.assertEqual(wheel.advance(5000), ["b"])
+        self.assertEqual(len(wheel), 0)
+
+
+class TestSpbLivenessTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.callback = MagicMock()
+        self.tracker = SpbLivenessTracker(interval=1.0, stale_factor=2, offline_factor=5, resolution=0.1,
+                                          callback=self.callback)
+
+    def test_transitions(self):
+        """Test the online, stale and offline transitions."""
+        self.tracker.seen("dev1", 0)
+        self.callback.assert_called_with("dev1", None, "online")
+
+        self.tracker.seen("dev1", 1500)     # Timer is not moved, but rescheduled when it expires
+        self.tracker.advance(2100)
+        self.assertEqual(self.tracker.get_state("dev1"), "online")
+
+        self.tracker.advance(3600)
+        self.assertEqual(self.tracker.get_state("dev1"), "stale")
+        self.callback.assert_called_with("dev1", "online", "stale")
+
+        self.tracker.advance(6600)
+        self.assertEqual(self.tracker.get_state("dev1"), "offline")
+        self.assertEqual(self.tracker.get_counts(), {"online": 0, "stale": 0, "offline": 1})
+
+        self.tracker.seen("dev1", 7000)
+        self.callback.assert_called_with("dev1", "offline", "online")
+
+    def test_dead_and_remove(self):
+        """Test DEATH messages and removed entities."""
+        self.tracker.seen("dev1", 0)
+        self.tracker.seen("dev2", 0)
+        self.tracker.dead("dev1", 100)
+        self.assertEqual(self.tracker.get_counts(), {"online": 1, "stale": 0, "offline": 1})
+
+        self.tracker.remove("dev2")
+        self.tracker.advance(10000)
+        self.assertEqual(self.tracker.get_counts(), {"online": 0, "stale": 0, "offline": 1})
+        self.assertIsNone(self.tracker.get_state("dev2"))
+
+    def test_learned_interval(self):
+        """Test the interval learned from the messages."""
+        tracker = SpbLivenessTracker(stale_factor=2, offline_factor=5, resolution=0.1)
+        tracker.seen("dev1", 0)
+        tracker.advance(9000)
+        self.assertEqual(tracker.get_state("dev1"), "online")  # Interval not known yet
+
+        tracker.seen("dev1", 10000)
+        tracker.advance(25000)
+        self.assertEqual(tracker.get_state("dev1"), "online")
+        tracker.advance(30100)
+        self.assertEqual(tracker.get_state("dev1"), "stale")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import unittest
+
+from mqtt_spb_wrapper.spb_publish import SpbPublishFuture, SpbPublishWindow
+
+
+class TestSpbPublishWindow(unittest.TestCase):
+
+    def test_register_and_deliver(self):
+        """Test that futures are resolved when the message is delivered."""
+        window = SpbPublishWindow()
+        future = SpbPublishFuture("topic", 1)
+        self.assertTrue(window.acquire())
+        window.register(future, 10)
+        self.assertFalse(future.done())
+        self.assertEqual(window.get_stats()["inflight"], 1)
+
+        window.delivered(10)
+        self.assertTrue(future.result(timeout=0))
+        self.assertEqual(window.get_stats(), {"queued": 0, "inflight": 0, "published": 1, "failed": 0})
+
+    def test_delivered_before_register(self):
+        """Test a message delivered before being registered."""
+        window = SpbPublishWindow()
+        future = SpbPublishFuture("topic", 0)
+        window.acquire()
+        window.delivered(5)
+        window.register(future, 5)
+        self.assertTrue(future.result(timeout=0))
+
+    def test_window_full(self):
+        """Test that the window limits the number of in-flight messages."""
+        window = SpbPublishWindow(max_inflight=2)
+        for mid in (1, 2):
+            self.assertTrue(window.acquire())
+            window.register(SpbPublishFuture("topic", 1), mid)
+
+        self.assertTrue(window.is_full())
+        self.assertFalse(window.acquire(timeout=0))
+        self.assertFalse(window.acquire(timeout=0.01))
+
+        # A delivery releases a blocked producer
+        threading.Timer(0.05, window.delivered, args=(1,)).start()
+        self.assertTrue(window.acquire(timeout=5))
+
+    def test_fail_all(self):
+        """Test that pending futures are failed when the client is destroyed."""
+        window = SpbPublishWindow()
+        future = SpbPublishFuture("topic", 1)
+        window.acquire()
+        window.register(future, 1)
+        window.fail_all()
+        self.assertFalse(future.result(timeout=0))
+        self.assertEqual(window.get_stats()["failed"], 1)
+
+    def test_fail_qos0(self):
+        """Test that only the QoS 0 futures are failed when the connection is lost."""
+        window = SpbPublishWindow(max_inflight=2)
+        future0 = SpbPublishFuture("topic", 0)
+        future1 = SpbPublishFuture("topic", 1)
+        window.acquire()
+        window.register(future0, 1)
+        window.acquire()
+        window.register(future1, 2)
+        self.assertTrue(window.is_full())
+
+        window.fail_qos0()
+        self.assertFalse(future0.result(timeout=0))
+        self.assertFalse(future1.done())
+        self.assertFalse(window.is_full())
+        self.assertEqual(window.get_stats()["failed"], 1)
+
+        # QoS 1 message retransmitted and delivered after the reconnection
+        window.delivered(2)
+        self.assertTrue(future1.result(timeout=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
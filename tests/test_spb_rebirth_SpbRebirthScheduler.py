@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from mqtt_spb_wrapper.spb_rebirth import SpbRebirthScheduler
+
+
+class TestSpbRebirthScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def _send(self, eon_name):
+        with self.lock:
+            self.sent.append(eon_name)
+        return True
+
+    def _wait_sent(self, count, timeout=2.0):
+        ts = time.time() + timeout
+        while len(self.sent) < count and time.time() < ts:
+            time.sleep(0.01)
+
+    def test_coalesce(self):
+        """Test that requests to the same EoN are coalesced."""
+        scheduler = SpbRebirthScheduler(self._send)
+        self.assertTrue(scheduler.request("EoN1"))
+        self.assertFalse(scheduler.request("EoN1"))
+        scheduler.start()
+        try:
+            self._wait_sent(1)
+            self.assertFalse(scheduler.request("EoN1"))     # In-flight
+            time.sleep(0.05)
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(self.sent, ["EoN1"])
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["requested"], 3)
+        self.assertEqual(stats["coalesced"], 2)
+        self.assertEqual(stats["inflight"], 1)
+
+    def test_max_inflight(self):
+        """Test the fleet-wide limit of requests waiting for the BIRTH."""
+        scheduler = SpbRebirthScheduler(self._send, max_inflight=2, timeout=10)
+        scheduler.start()
+        try:
+            for i in range(5):
+                scheduler.request("EoN%d" % i)
+            self._wait_sent(2)
+            time.sleep(0.05)
+            self.assertEqual(self.sent, ["EoN0", "EoN1"])
+
+            scheduler.completed("EoN0")
+            self._wait_sent(3)
+            self.assertEqual(self.sent, ["EoN0", "EoN1", "EoN2"])
+            self.assertEqual(scheduler.get_stats()["pending"], 2)
+        finally:
+            scheduler.stop()
+
+    def test_min_interval_and_timeout(self):
+        """Test that the requests expire, and the requests to an EoN are rate limited."""
+        scheduler = SpbRebirthScheduler(self._send, min_interval=0.3, timeout=0.05)
+        scheduler.start()
+        try:
+            scheduler.request("EoN1")
+            self._wait_sent(1)
+            time.sleep(0.1)
+            self.assertEqual(scheduler.get_stats()["expired"], 1)
+
+            ts = time.time()
+            scheduler.request("EoN1")
+            self._wait_sent(2)
+            self.assertEqual(self.sent, ["EoN1", "EoN1"])
+            self.assertGreater(time.time() - ts, 0.1)
+        finally:
+            scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
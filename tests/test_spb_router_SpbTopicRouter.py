@@ -0,0 +1,51 @@
+import unittest
+
+from mqtt_spb_wrapper.spb_router import SpbTopicRouter
+
+
+class TestSpbTopicRouter(unittest.TestCase):
+
+    def test_resolve(self):
+        """Test that the routes are parsed once and cached per topic string."""
+        router = SpbTopicRouter()
+
+        route = router.resolve("spBv1.0/Group1/DDATA/EoN1/Device1")
+        self.assertEqual(route.topic.eon_device_name, "Device1")
+        self.assertEqual(route.kind, "DATA")
+        self.assertIs(router.resolve("spBv1.0/Group1/DDATA/EoN1/Device1"), route)
+        self.assertEqual(router.resolve("spBv1.0/Group1/STATE/App1").kind, "STATE")
+        self.assertIsNone(router.resolve("other/Group1/DDATA/EoN1"))
+
+        router.invalidate()
+        self.assertIsNot(router.resolve("spBv1.0/Group1/DDATA/EoN1/Device1"), route)
+
+    def test_max_routes(self):
+        """Test that the cache is bounded."""
+        router = SpbTopicRouter(max_routes=10)
+        for i in range(25):
+            router.resolve("spBv1.0/Group1/NDATA/EoN%d" % i)
+        self.assertLessEqual(len(router), 10)
+
+    def test_wildcard_handlers(self):
+        """Test the MQTT wildcards of the handler topic filters."""
+        router = SpbTopicRouter()
+        router.add_handler("spBv1.0/Group1/DDATA/+/Pump1", "pump")
+        router.add_handler("spBv1.0/Group1/#", "group")
+        router.add_handler("spBv1.0/+/NDATA/EoN1", "eon")
+        router.add_handler("spBv1.0/Group1/NDATA/EoN1/#", "eon_multi")
+
+        self.assertEqual(sorted(router.resolve("spBv1.0/Group1/DDATA/EoN2/Pump1").handlers), ["group", "pump"])
+        self.assertEqual(sorted(router.match("spBv1.0/Group1/NDATA/EoN1")), ["eon", "eon_multi", "group"])
+        self.assertEqual(router.match("spBv1.0/Group2/DDATA/EoN1/Pump1"), [])
+
+        # Cached routes are updated
+        self.assertTrue(router.remove_handler("spBv1.0/Group1/#", "group"))
+        self.assertFalse(router.remove_handler("spBv1.0/Group1/#", "group"))
+        self.assertEqual(router.resolve("spBv1.0/Group1/DDATA/EoN2/Pump1").handlers, ["pump"])
+
+        with self.assertRaises(ValueError):
+            router.add_handler("spBv1.0/#/NDATA", "invalid")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from mqtt_spb_wrapper.spb_shard import SpbHashRing
+
+
+class TestSpbHashRing(unittest.TestCase):
+
+    def test_empty_ring(self):
+        """Test that an empty ring has no owners."""
+        ring = SpbHashRing()
+        self.assertIsNone(ring.get_owner("EoN1"))
+
+    def test_owner_is_stable(self):
+        """Test that the same key is always assigned to the same member, regardless of the members order."""
+        ring1 = SpbHashRing(["App1", "App2", "App3"])
+        ring2 = SpbHashRing(["App3", "App1", "App2"])
+        for i in range(100):
+            self.assertEqual(ring1.get_owner("EoN%d" % i), ring2.get_owner("EoN%d" % i))
+
+    def test_all_members_get_keys(self):
+        """Test that the keys are distributed between all members."""
+        ring = SpbHashRing(["App1", "App2", "App3"])
+        owners = {ring.get_owner("EoN%d" % i) for i in range(300)}
+        self.assertEqual(owners, {"App1", "App2", "App3"})
+
+    def test_member_leave_only_moves_its_keys(self):
+        """Test that when a member leaves, only its keys are reassigned."""
+        ring = SpbHashRing(["App1", "App2", "App3"])
+        before = {"EoN%d" % i: ring.get_owner("EoN%d" % i) for i in range(300)}
+
+        ring.set_members(["App1", "App2"])
+        for key, owner in before.items():
+            if owner != "App3":
+                self.assertEqual(ring.get_owner(key), owner)
+            else:
+                self.assertIn(ring.get_owner(key), ["App1", "App2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import multiprocessing
+import unittest
+
+from mqtt_spb_wrapper.spb_sharedmem import SpbSharedTable, SpbSharedTableReader
+
+
+def _read_process(name, result):
+    with SpbSharedTableReader(name) as reader:
+        result.put(reader.read("G", "EoN1", "Device1", "temperature"))
+
+
+class TestSpbSharedTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = SpbSharedTable(slots=4, directory_size=1024)
+
+    def tearDown(self):
+        self.table.close()
+
+    def test_write_and_read(self):
+        """Test the values written and read by type, with stable slots."""
+        table = self.table
+        self.assertTrue(table.write("G", "EoN1", "Device1", "temperature", 20.5, 1000))
+        self.assertTrue(table.write("G", "EoN1", "Device1", "counter", 2 ** 62, 1000))
+        self.assertTrue(table.write("G", "EoN1", None, "running", True, 1000))
+        self.assertTrue(table.write("G", "EoN1", "Device1", "samples", [1.0, 2.0], [1000, 2000]))
+        self.assertFalse(table.write("G", "EoN1", "Device1", "status", "ok", 1000))  # Not numeric
+
+        with SpbSharedTableReader(table.name) as reader:
+            self.assertEqual(len(reader), 4)
+            self.assertEqual(reader.read("G", "EoN1", "Device1", "temperature"), (20.5, 1000))
+            self.assertEqual(reader.read("G", "EoN1", "Device1", "counter"), (2 ** 62, 1000))
+            self.assertEqual(reader.read("G", "EoN1", None, "running"), (True, 1000))
+            self.assertEqual(reader.read("G", "EoN1", "Device1", "samples"), (2.0, 2000))
+            self.assertIsNone(reader.read("G", "EoN1", "Device1", "status"))
+
+            slot = reader.get_slot("G", "EoN1", "Device1", "temperature")
+            table.write("G", "EoN1", "Device1", "temperature", 21.0, 3000)
+            self.assertEqual(reader.get_slot("G", "EoN1", "Device1", "temperature"), slot)
+            self.assertEqual(reader.read_slot(slot), (21.0, 3000))
+
+            self.assertEqual(dict(reader.items())[("G", "EoN1", None, "running")], (True, 1000))
+
+    def test_table_full(self):
+        """Test the metrics discarded once all the slots are used."""
+        for i in range(4):
+            self.assertTrue(self.table.write("G", "EoN1", None, "m%d" % i, i))
+        self.assertFalse(self.table.write("G", "EoN1", None, "m4", 4))
+        self.assertTrue(self.table.write("G", "EoN1", None, "m0", 10))
+        self.assertEqual(self.table.get_stats(), {"written": 5, "discarded": 1, "slots": 4})
+
+    def test_write_in_progress(self):
+        """Test the reads of a slot while it is being written ( odd sequence )."""
+        self.table.write("G", "EoN1", None, "m", 1.0, 1000)
+        with SpbSharedTableReader(self.table.name, retries=3) as reader:
+            self.table._buf[64] += 1
+            self.assertIsNone(reader.read("G", "EoN1", None, "m"))
+            self.table._buf[64] += 1
+            self.assertEqual(reader.read("G", "EoN1", None, "m"), (1.0, 1000))
+
+    def test_other_process(self):
+        """Test a reader attached from another process."""
+        self.table.write("G", "EoN1", "Device1", "temperature", 25.5, 1000)
+        ctx = multiprocessing.get_context("spawn")
+        result = ctx.Queue()
+        process = ctx.Process(target=_read_process, args=(self.table.name, result))
+        process.start()
+        self.assertEqual(result.get(timeout=30), (25.5, 1000))
+        process.join(timeout=30)
+
+    def test_not_a_table(self):
+        """Test attaching to a segment that is not a table."""
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=128)
+        try:
+            with self.assertRaises(ValueError):
+                SpbSharedTableReader(shm.name)
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from mqtt_spb_wrapper.spb_stream import SpbChange, SpbChangeStream
+
+
+def _record(i):
+    return SpbChange("Group1", "EoN1", "Device1", "temperature", float(i), 1000 + i, i & 0xFF)
+
+
+class TestSpbChangeStream(unittest.TestCase):
+
+    def test_batches(self):
+        """Test the batch size and the iteration until closed."""
+        stream = SpbChangeStream(batch_size=3)
+        for i in range(7):
+            stream.put(_record(i))
+        stream.close()
+        stream.put(_record(8))  # Ignored, closed
+
+        batches = list(stream)
+        self.assertEqual([len(b) for b in batches], [3, 3, 1])
+        self.assertEqual(batches[0][0].value, 0.0)
+        self.assertEqual(batches[2][0].timestamp, 1006)
+
+    def test_timeout_and_overflow(self):
+        """Test the get timeout, and that the oldest records are discarded when the queue is full."""
+        stream = SpbChangeStream(max_queue=5)
+        self.assertEqual(stream.get_batch(timeout=0.01), [])
+
+        for i in range(8):
+            stream.put(_record(i))
+        self.assertEqual(stream.dropped, 3)
+        self.assertEqual([r.value for r in stream.get_batch()], [3.0, 4.0, 5.0, 6.0, 7.0])
+
+    def test_window(self):
+        """Test that the consumer waits for a full batch, up to the window."""
+        stream = SpbChangeStream(batch_size=4, window=5.0)
+
+        def _producer():
+            for i in range(4):
+                time.sleep(0.01)
+                stream.put(_record(i))
+
+        thread = threading.Thread(target=_producer)
+        thread.start()
+        ts = time.monotonic()
+        self.assertEqual(len(stream.get_batch()), 4)
+        self.assertLess(time.monotonic() - ts, 2.0)   # Full batch, before the window
+        thread.join()
+
+        stream = SpbChangeStream(batch_size=4, window=0.05)
+        stream.put(_record(0))
+        self.assertEqual(len(stream.get_batch()), 1)
+
+    def test_records_and_async(self):
+        """Test the single records generator and the async iterator."""
+        stream = SpbChangeStream(batch_size=2)
+        for i in range(3):
+            stream.put(_record(i))
+        stream.close()
+        self.assertEqual([r.seq for r in stream.records()], [0, 1, 2])
+
+        stream = SpbChangeStream(batch_size=2)
+        for i in range(3):
+            stream.put(_record(i))
+        stream.close()
+
+        async def _consume():
+            return [len(batch) async for batch in stream]
+
+        self.assertEqual(asyncio.run(_consume()), [2, 1])
+
+    def test_async_cancel(self):
+        """Test that cancelling an async consumer does not lose records nor block the event loop shutdown."""
+        stream = SpbChangeStream(batch_size=10)
+        stream.ASYNC_POLL_INTERVAL = 0.05
+
+        async def _consume():
+            task = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.02)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            for i in range(3):
+                stream.put(_record(i))
+            await asyncio.sleep(0.1)    # The cancelled wait returns in the executor thread
+            return [r.seq for r in await stream.__anext__()]
+
+        ts = time.monotonic()
+        self.assertEqual(asyncio.run(_consume()), [0, 1, 2])
+        self.assertLess(time.monotonic() - ts, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from mqtt_spb_wrapper.spb_base import SpbTopic
+from mqtt_spb_wrapper.spb_subscription import SpbSubscriptionFilter
+
+
+class TestSpbSubscriptionFilter(unittest.TestCase):
+
+    def test_all_nodes(self):
+        """Test that without a node selection all the group is subscribed, by message type."""
+        f = SpbSubscriptionFilter("spBv1.0", "Group1", message_types=["DDATA"])
+        self.assertEqual(f.topics(), {"spBv1.0/Group1/DDATA/#"})
+        self.assertTrue(f.match(SpbTopic("spBv1.0/Group1/DDATA/EoN1/Device1")))
+        self.assertFalse(f.match(SpbTopic("spBv1.0/Group1/NDATA/EoN1")))
+        self.assertFalse(f.add_edge_node("EoN1"))
+
+    def test_edge_nodes_and_devices(self):
+        """Test the topic filters of edge nodes and devices."""
+        f = SpbSubscriptionFilter("spBv1.0", "Group1", edge_nodes=["EoN1"], devices=[("EoN2", "Device1")],
+                                  message_types=["NBIRTH", "DBIRTH", "DDATA"])
+        self.assertFalse(f.client_filter)
+        self.assertEqual(f.topics(), {
+            "spBv1.0/Group1/NBIRTH/EoN1/#", "spBv1.0/Group1/DBIRTH/EoN1/#", "spBv1.0/Group1/DDATA/EoN1/#",
+            "spBv1.0/Group1/DBIRTH/EoN2/Device1", "spBv1.0/Group1/DDATA/EoN2/Device1", "spBv1.0/Group1/NBIRTH/EoN2",
+        })
+
+        self.assertTrue(f.match(SpbTopic("spBv1.0/Group1/NBIRTH/EoN2")))
+        self.assertFalse(f.match(SpbTopic("spBv1.0/Group1/DDATA/EoN2/Device2")))
+
+        # Dynamic additions
+        self.assertFalse(f.add_device("EoN1", "Device9"))   # Covered by the edge node
+        self.assertTrue(f.add_device("EoN3", "Device1"))
+        self.assertIn("spBv1.0/Group1/DDATA/EoN3/Device1", f.topics())
+        self.assertTrue(f.add_edge_node("EoN2"))
+        self.assertNotIn("spBv1.0/Group1/DDATA/EoN2/Device1", f.topics())
+        self.assertIn("spBv1.0/Group1/DDATA/EoN2/#", f.topics())
+
+    def test_patterns(self):
+        """Test the glob patterns of EoN and EoN/EoND names."""
+        f = SpbSubscriptionFilter("spBv1.0", "Group1", patterns=["Line1-*", "Line2-*/Pump*"])
+        self.assertTrue(f.client_filter)
+        self.assertEqual(len(f.topics()), len(SpbSubscriptionFilter.MESSAGE_TYPES))
+
+        self.assertTrue(f.match(SpbTopic("spBv1.0/Group1/NDATA/Line1-A")))
+        self.assertTrue(f.match(SpbTopic("spBv1.0/Group1/DDATA/Line1-A/Valve1")))
+        self.assertTrue(f.match(SpbTopic("spBv1.0/Group1/DDATA/Line2-A/Pump1")))
+        self.assertFalse(f.match(SpbTopic("spBv1.0/Group1/DDATA/Line2-A/Valve1")))
+        self.assertFalse(f.match(SpbTopic("spBv1.0/Group1/NDATA/Line3-A")))
+        self.assertFalse(f.match(SpbTopic("spBv1.0/Group1/NCMD/Line1-A")))
+
+    def test_covers_sequence(self):
+        """Test that the sequence is only covered by the full message stream of an edge node."""
+        f = SpbSubscriptionFilter("spBv1.0", "Group1", edge_nodes=["EoN1"], devices=[("EoN2", "Device1")],
+                                  patterns=["Line1-*", "Line2-*/Pump*"])
+        self.assertTrue(f.covers_sequence("EoN1"))
+        self.assertTrue(f.covers_sequence("Line1-A"))
+        self.assertFalse(f.covers_sequence("EoN2"))
+        self.assertFalse(f.covers_sequence("Line2-A"))
+
+        f = SpbSubscriptionFilter("spBv1.0", "Group1", message_types=["NBIRTH", "NDATA"])
+        self.assertFalse(f.covers_sequence("EoN1"))
+        self.assertTrue(SpbSubscriptionFilter("spBv1.0", "Group1").covers_sequence("EoN1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
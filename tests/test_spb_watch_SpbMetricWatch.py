@@ -0,0 +1,38 @@
+import unittest
+
+from mqtt_spb_wrapper.spb_watch import SpbMetricWatch
+
+
+class TestSpbMetricWatch(unittest.TestCase):
+
+    def test_match(self):
+        """Test the metric patterns, for devices and edge nodes."""
+        watch = SpbMetricWatch()
+        watch.add("Line1", "*", "Temperature", "device_temp")
+        watch.add("Line*", None, "Temperature", "eon_temp")
+
+        self.assertEqual(watch.match("Line1", "Pump1", "Temperature"), ("device_temp",))
+        self.assertEqual(watch.match("Line2", None, "Temperature"), ("eon_temp",))
+        self.assertEqual(watch.match("Line2", "Pump1", "Temperature"), ())
+        self.assertEqual(watch.match("Line1", "Pump1", "Pressure"), ())
+
+    def test_metric_patterns(self):
+        """Test the metric name patterns, and the removal of registrations."""
+        watch = SpbMetricWatch()
+        id_temp = watch.add("*", "*", "Temperature", "temp")
+        id_all = watch.add("Line1", "Pump?", "*", "all")
+        self.assertEqual(len(watch), 2)
+
+        self.assertEqual(watch.match("Line1", "Pump1", "Temperature"), ("temp", "all"))
+        self.assertEqual(watch.match("Line1", "Pump1", "Pressure"), ("all",))
+        self.assertEqual(watch.match("Line1", "Pump10", "Pressure"), ())
+
+        self.assertTrue(watch.remove(id_all))
+        self.assertFalse(watch.remove(id_all))
+        self.assertEqual(watch.match("Line1", "Pump1", "Pressure"), ())
+        self.assertTrue(watch.remove(id_temp))
+        self.assertEqual(len(watch), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()